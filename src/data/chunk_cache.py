@@ -0,0 +1,272 @@
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import threading
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+
+
+# 默认缓存目录
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'MySystem', 'volumes')
+
+# 每个分块的目标大小（未压缩字节数）
+SLAB_BYTES = 4 * 1024 * 1024
+
+# 默认磁盘预算（字节）
+DEFAULT_MAX_BYTES = 8 * 1024 ** 3
+
+
+class ChunkedVolume:
+    """分块压缩存储的体数据，按需解压所需的分块"""
+
+    def __init__(self, store_dir, max_cached_slabs=8):
+        """
+        打开分块存储
+
+        Args:
+            store_dir: 分块存储目录
+            max_cached_slabs: 内存中保留的已解压分块数量
+        """
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, 'meta.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        self.shape = tuple(meta['shape'])
+        self.dtype = np.dtype(meta['dtype'])
+        self.slab_size = meta['slab_size']
+        self.offsets = meta['offsets']
+        self.ndim = len(self.shape)
+        self.max_cached_slabs = max_cached_slabs
+        self._slabs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _read_slab(self, index):
+        """读取并解压第index个分块，形状为(切片数, 高度, 宽度)"""
+        with self._lock:
+            if index in self._slabs:
+                self._slabs.move_to_end(index)
+                return self._slabs[index]
+
+        start, end = self.offsets[index], self.offsets[index + 1]
+        with open(os.path.join(self.store_dir, 'slabs.bin'), 'rb') as f:
+            f.seek(start)
+            compressed = f.read(end - start)
+        # zlib解压时释放GIL，多个线程可以同时解压不同分块
+        raw = zlib.decompress(compressed)
+
+        z0 = index * self.slab_size
+        z1 = min(z0 + self.slab_size, self.shape[2])
+        slab = np.frombuffer(raw, dtype=self.dtype).reshape(z1 - z0, self.shape[1], self.shape[0])
+
+        with self._lock:
+            self._slabs[index] = slab
+            while len(self._slabs) > self.max_cached_slabs:
+                self._slabs.popitem(last=False)
+        return slab
+
+    def __getitem__(self, key):
+        """
+        读取指定区域，只解压与z范围相交的分块
+
+        Args:
+            key: 按(x, y, z)顺序的整数或切片元组
+
+        Returns:
+            data: numpy数组
+        """
+        if not isinstance(key, tuple):
+            key = (key,)
+        key = key + (slice(None),) * (3 - len(key))
+        kx, ky, kz = key
+
+        if isinstance(kz, slice):
+            z_indices = range(*kz.indices(self.shape[2]))
+        else:
+            z = int(kz)
+            z_indices = [z + self.shape[2] if z < 0 else z]
+            if not 0 <= z_indices[0] < self.shape[2]:
+                raise IndexError('z索引超出范围')
+
+        # 按分块读取，每个分块转置为(x, y, z)后再取子区域
+        parts = []
+        for slab_index in sorted({z // self.slab_size for z in z_indices}):
+            slab = self._read_slab(slab_index).T
+            z0 = slab_index * self.slab_size
+            local = [z - z0 for z in z_indices if z // self.slab_size == slab_index]
+            parts.append(slab[kx, ky][..., local])
+
+        if parts:
+            data = np.concatenate(parts, axis=-1)
+        else:
+            data = np.empty(np.empty(self.shape[:2] + (0,), dtype=self.dtype)[kx, ky].shape,
+                            dtype=self.dtype)
+        if not isinstance(kz, slice):
+            data = data[..., 0]
+        return data
+
+    def __array__(self, dtype=None, copy=None):
+        data = self[:, :, :]
+        if dtype is not None:
+            data = data.astype(dtype, copy=False)
+        return data
+
+
+class ChunkCache:
+    """压缩NIfTI文件的分块缓存，首次打开时转存，之后随机访问分块"""
+
+    def __init__(self, cache_dir=None, slab_bytes=SLAB_BYTES, compress_level=1, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        初始化分块缓存
+
+        Args:
+            cache_dir: 缓存目录，默认为DEFAULT_CACHE_DIR
+            slab_bytes: 每个分块的目标大小（未压缩字节数）
+            compress_level: zlib压缩级别
+            max_bytes: 磁盘预算（字节），超出时按最近使用时间淘汰
+        """
+        self.cache_dir = cache_dir or DEFAULT_CACHE_DIR
+        self.slab_bytes = slab_bytes
+        self.compress_level = compress_level
+        self.max_bytes = max_bytes
+
+    def cache_key(self, file_path):
+        """
+        根据文件路径、大小和修改时间生成缓存键
+
+        Args:
+            file_path: 源文件路径
+
+        Returns:
+            key: 缓存键字符串
+        """
+        stat = os.stat(file_path)
+        identity = f'{os.path.abspath(file_path)}|{stat.st_size}|{stat.st_mtime_ns}'
+        return hashlib.sha1(identity.encode('utf-8')).hexdigest()
+
+    def store_path(self, file_path):
+        """获取文件对应的分块存储目录"""
+        return os.path.join(self.cache_dir, self.cache_key(file_path))
+
+    def open(self, file_path):
+        """
+        打开已缓存的分块存储
+
+        Args:
+            file_path: 源文件路径
+
+        Returns:
+            volume: ChunkedVolume对象，未缓存时返回None
+        """
+        store_dir = self.store_path(file_path)
+        meta_path = os.path.join(store_dir, 'meta.json')
+        if not os.path.exists(meta_path):
+            return None
+        try:
+            # 更新修改时间作为最近使用时间
+            os.utime(meta_path)
+            return ChunkedVolume(store_dir)
+        except Exception as e:
+            print(f"读取分块缓存时出错: {e}")
+            return None
+
+    def store(self, file_path, raw_data):
+        """
+        将原始体数据按z方向分块压缩后写入缓存
+
+        Args:
+            file_path: 源文件路径
+            raw_data: 未缩放的原始数据，轴顺序为(x, y, z)
+
+        Returns:
+            store_dir: 分块存储目录，写入失败时返回None
+        """
+        store_dir = self.store_path(file_path)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        temp_dir = tempfile.mkdtemp(dir=self.cache_dir, prefix='.tmp_')
+        try:
+            x, y, z = raw_data.shape
+            slice_bytes = x * y * raw_data.dtype.itemsize
+            slab_size = max(1, self.slab_bytes // max(slice_bytes, 1))
+
+            offsets = [0]
+            with open(os.path.join(temp_dir, 'slabs.bin'), 'wb') as f:
+                for z0 in range(0, z, slab_size):
+                    # 分块以(z, y, x)的C顺序保存，与NIfTI磁盘布局一致
+                    slab = np.ascontiguousarray(raw_data[:, :, z0:z0 + slab_size].T)
+                    compressed = zlib.compress(slab.tobytes(), self.compress_level)
+                    f.write(compressed)
+                    offsets.append(offsets[-1] + len(compressed))
+
+            meta = {
+                'source': os.path.abspath(file_path),
+                'shape': [x, y, z],
+                'dtype': raw_data.dtype.str,
+                'slab_size': slab_size,
+                'offsets': offsets
+            }
+            with open(os.path.join(temp_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+                json.dump(meta, f)
+
+            # 写完后整体改名，避免其他进程读到不完整的缓存
+            if os.path.exists(store_dir):
+                shutil.rmtree(store_dir, ignore_errors=True)
+            os.replace(temp_dir, store_dir)
+            self.evict(keep=store_dir)
+            return store_dir
+        except Exception as e:
+            print(f"写入分块缓存时出错: {e}")
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            return None
+
+    def entries(self):
+        """
+        列出缓存条目
+
+        Returns:
+            entries: (最近使用时间, 字节数, 目录)列表
+        """
+        entries = []
+        if not os.path.isdir(self.cache_dir):
+            return entries
+        for name in os.listdir(self.cache_dir):
+            store_dir = os.path.join(self.cache_dir, name)
+            meta_path = os.path.join(store_dir, 'meta.json')
+            if name.startswith('.tmp_') or not os.path.exists(meta_path):
+                continue
+            try:
+                size = sum(os.path.getsize(os.path.join(store_dir, f)) for f in os.listdir(store_dir))
+                entries.append((os.path.getmtime(meta_path), size, store_dir))
+            except OSError:
+                # 其他进程正在淘汰该条目
+                continue
+        return entries
+
+    def evict(self, keep=None):
+        """
+        超出磁盘预算时删除最久未使用的条目
+
+        Args:
+            keep: 不删除的目录（刚写入的条目）
+
+        Returns:
+            removed: 被删除的目录列表
+        """
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        removed = []
+        for _, size, store_dir in entries:
+            if total <= self.max_bytes:
+                break
+            if store_dir == keep:
+                continue
+            shutil.rmtree(store_dir, ignore_errors=True)
+            total -= size
+            removed.append(store_dir)
+        return removed
+
+    def clear(self):
+        """清空缓存目录"""
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
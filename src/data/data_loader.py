@@ -1,15 +1,40 @@
+import os
+import tempfile
 import nibabel as nib
 import numpy as np
+from src.data.lazy_volume import LazyVolume
+from src.data.chunk_cache import ChunkCache
+from src.data.gzip_io import GzipReader, GzipVolume, write_gzip
+from src.data.volume_cache import get_volume_cache, estimate_nbytes
 
 class DataLoader:
     """医学图像数据加载器"""
     
-    def load_nifti(self, file_path):
+    def __init__(self, chunk_cache=None, volume_cache=None):
+        """
+        初始化数据加载器
+        
+        Args:
+            chunk_cache: 压缩文件的分块缓存，默认为ChunkCache()，为False时不使用分块缓存
+                         （批处理只顺序读取每个文件一次，不需要转存）
+            volume_cache: 体数据内存缓存，默认为进程内共享的缓存
+        """
+        if chunk_cache is False:
+            self.chunk_cache = None
+        else:
+            self.chunk_cache = chunk_cache if chunk_cache is not None else ChunkCache()
+        self.volume_cache = volume_cache if volume_cache is not None else get_volume_cache()
+    
+    def load_nifti(self, file_path, lazy=False, data_kind='image', use_cache=True):
         """
         加载NIFTI格式的3D医学图像
         
         Args:
             file_path: NIFTI文件路径
+            lazy: 是否延迟加载，为True时返回按需转换切片的LazyVolume，
+                  未压缩的.nii文件通过内存映射读取，.nii.gz文件通过分块缓存读取
+            data_kind: 数据类别，'image'保留整数类型或使用float32，'mask'使用uint8
+            use_cache: 是否使用共享的体数据缓存（缓存的数组为只读）
             
         Returns:
             image_data: 加载的图像数据，形状为(深度, 高度, 宽度)
@@ -17,42 +42,201 @@ class DataLoader:
             header: 图像的头部信息
         """
         try:
+            cache = self.volume_cache if use_cache else None
+            if cache is not None:
+                # 已完整加载的数据同样可以满足延迟加载请求
+                policies = [(False, data_kind), (True, data_kind)] if lazy else [(False, data_kind)]
+                for policy in policies:
+                    cached = cache.get(cache.make_key(file_path, *policy))
+                    if cached is not None:
+                        return cached
+            
             # 加载NIFTI文件
             img = nib.load(file_path)
-            # 获取图像数据
-            image_data = img.get_fdata()
+            # 获取未缩放的原始数据（未压缩文件为内存映射数组）
+            proxy = img.dataobj
+            if nib.is_proxy(proxy):
+                raw_data = self.load_raw_data(file_path, proxy, lazy=lazy)
+                slope, inter = proxy.slope, proxy.inter
+            else:
+                raw_data = np.asanyarray(proxy)
+                slope, inter = 1.0, 0.0
+            # 按数据类别确定数据类型，强度缩放在转换时才应用
+            dtype = self.resolve_dtype(data_kind, raw_data.dtype, slope, inter)
             # 转换维度顺序为(深度, 高度, 宽度)
-            image_data = np.transpose(image_data, (2, 1, 0))
+            volume = LazyVolume(raw_data, axes=(2, 1, 0), slope=slope, inter=inter, dtype=dtype,
+                                source_path=file_path)
+            image_data = volume if lazy else volume[...]
             # 获取仿射变换矩阵
             affine = img.affine
             # 获取头部信息
             header = img.header
             
+            if cache is not None:
+                # 多个选项卡共享同一份数据，禁止就地修改
+                if isinstance(image_data, np.ndarray):
+                    image_data.flags.writeable = False
+                cache.put(cache.make_key(file_path, lazy, data_kind),
+                          (image_data, affine, header), estimate_nbytes(image_data))
+            
             return image_data, affine, header
         except Exception as e:
             print(f"加载NIFTI文件时出错: {e}")
             return None, None, None
     
-    def save_nifti(self, image_data, affine, header, file_path):
+    def load_header(self, file_path):
+        """
+        只读取仿射变换和头部信息，不加载图像数据
+        
+        Args:
+            file_path: NIFTI文件路径
+            
+        Returns:
+            affine: 图像的仿射变换矩阵
+            header: 图像的头部信息
+        """
+        try:
+            key = self.volume_cache.make_key(file_path, 'header')
+            cached = self.volume_cache.get(key)
+            if cached is not None:
+                return cached
+            img = nib.load(file_path)
+            self.volume_cache.put(key, (img.affine, img.header))
+            return img.affine, img.header
+        except Exception as e:
+            print(f"读取NIFTI头部时出错: {e}")
+            return None, None
+    
+    def load_raw_data(self, file_path, proxy, lazy=False):
+        """
+        获取未缩放的原始数据，压缩文件经由分块缓存读取
+        
+        延迟加载可随机访问的压缩文件（BGZF，或安装了indexed_gzip时的普通gzip）时
+        不解压整个文件，按需读取切片所在的区间
+        
+        Args:
+            file_path: NIFTI文件路径
+            proxy: nibabel的数组代理对象
+            lazy: 是否延迟加载
+            
+        Returns:
+            raw_data: 轴顺序为(x, y, z)的原始数据（内存映射数组、分块存储、GzipVolume或numpy数组）
+        """
+        if not str(file_path).endswith('.gz') or len(proxy.shape) != 3:
+            return proxy.get_unscaled()
+        
+        # 已有分块缓存时只解压访问到的分块
+        if self.chunk_cache is not None:
+            cached = self.chunk_cache.open(file_path)
+            if cached is not None and cached.shape == tuple(proxy.shape) and cached.dtype == proxy.dtype:
+                return cached
+        
+        reader = GzipReader(file_path)
+        if lazy and reader.random_access and proxy.order == 'F':
+            return GzipVolume(reader, proxy.offset, proxy.shape, proxy.dtype)
+        
+        # 首次打开：完整解压一次并转存为分块缓存
+        raw_data = self.read_gzip_raw(file_path, proxy, reader)
+        if self.chunk_cache is not None:
+            self.chunk_cache.store(file_path, raw_data)
+        return raw_data
+    
+    def read_gzip_raw(self, file_path, proxy, reader=None):
+        """
+        解压.nii.gz文件并在解压缓冲区上直接构造原始数组
+        
+        多成员（BGZF）文件在多个核上并行解压，单成员文件顺序解压
+        
+        Args:
+            file_path: NIFTI文件路径
+            proxy: nibabel的数组代理对象，提供数据偏移、类型和形状
+            reader: 已打开的GzipReader，为None时打开file_path
+            
+        Returns:
+            raw_data: 轴顺序为(x, y, z)的只读原始数组
+        """
+        buffer = (reader or GzipReader(file_path)).read_all()
+        count = int(np.prod(proxy.shape))
+        raw_data = np.frombuffer(buffer, dtype=proxy.dtype, count=count, offset=proxy.offset)
+        return raw_data.reshape(proxy.shape, order=proxy.order)
+    
+    def resolve_dtype(self, data_kind, disk_dtype, slope=1.0, inter=0.0):
+        """
+        根据数据类别确定加载后的数据类型
+        
+        Args:
+            data_kind: 数据类别，'image'或'mask'
+            disk_dtype: 磁盘上的数据类型
+            slope: 强度缩放斜率
+            inter: 强度缩放截距
+            
+        Returns:
+            dtype: 加载后的数据类型
+        """
+        if data_kind == 'mask':
+            # 掩码只包含少量标签值，使用uint8存储
+            return np.dtype(np.uint8)
+        elif data_kind == 'image':
+            # 无缩放的整数图像保留原始类型，其余统一使用float32计算
+            scaled = (slope is not None and slope != 1.0) or (inter is not None and inter != 0.0)
+            if not scaled and np.issubdtype(disk_dtype, np.integer):
+                return np.dtype(disk_dtype)
+            return np.dtype(np.float32)
+        else:
+            raise ValueError("data_kind必须为'image'或'mask'")
+    
+    def save_nifti(self, image_data, affine, header, file_path, mask=False, max_workers=None, crop_info=None):
         """
         保存数据为NIFTI格式
         
+        先写入同目录下的临时文件再重命名，写入中断时不会留下不完整的文件；
+        .nii.gz文件按BGZF格式在多个核上并行压缩
+        
         Args:
             image_data: 要保存的图像数据
             affine: 仿射变换矩阵
             header: 头部信息
             file_path: 保存路径
+            mask: 是否为掩码，为True时保存为uint8类型
+            max_workers: 并行压缩的线程数，默认为CPU核数
+            crop_info: 数据为裁剪结果时传入Preprocessor.crop_to_foreground返回的裁剪信息，
+                       保存前放回原始视野
         """
+        temp_path = None
         try:
+            image_data = np.asarray(image_data)
+            if crop_info is not None:
+                # 包围盒外填0
+                full = np.zeros(crop_info['shape'], dtype=image_data.dtype)
+                full[tuple(slice(start, stop) for start, stop in crop_info['bbox'])] = image_data
+                image_data = full
+            if mask:
+                # 掩码只包含少量标签值，概率图四舍五入后按uint8保存
+                if np.issubdtype(image_data.dtype, np.floating):
+                    image_data = np.rint(image_data)
+                image_data = image_data.astype(np.uint8, copy=False)
             # 转换维度顺序回(x, y, z)
             image_data = np.transpose(image_data, (2, 1, 0))
             # 创建NIFTI图像对象
             img = nib.Nifti1Image(image_data, affine, header)
-            # 保存文件
-            nib.save(img, file_path)
+            if mask:
+                img.set_data_dtype(np.uint8)
+                img.header.set_slope_inter(1, 0)
+            
+            # 写入临时文件后原子替换
+            directory = os.path.dirname(os.path.abspath(file_path))
+            fd, temp_path = tempfile.mkstemp(prefix='.tmp_', suffix='.nii', dir=directory)
+            os.close(fd)
+            if str(file_path).endswith('.gz'):
+                write_gzip(temp_path, img.to_bytes(), max_workers=max_workers)
+            else:
+                nib.save(img, temp_path)
+            os.replace(temp_path, file_path)
             return True
         except Exception as e:
             print(f"保存NIFTI文件时出错: {e}")
+            if temp_path is not None and os.path.exists(temp_path):
+                os.remove(temp_path)
             return False
     
     def get_image_info(self, header):
@@ -60,7 +244,7 @@ class DataLoader:
         获取图像信息
         
         Args:
-            header: 图像头部信息
+            header: 图像头部信息，或DatasetIndexer生成的清单条目
             
         Returns:
             info: 包含图像信息的字典
@@ -68,6 +252,15 @@ class DataLoader:
         if header is None:
             return {}
         
+        if isinstance(header, dict):
+            # 清单条目已包含所需信息，无需打开文件
+            return {
+                'dimensions': header['dims'][:3],
+                'voxel_size': header['pixdim'][:3],
+                'data_type': header['datatype'],
+                'bit_depth': header['bitpix']
+            }
+        
         info = {
             'dimensions': header.get('dim')[1:4],
             'voxel_size': header.get('pixdim')[1:4],
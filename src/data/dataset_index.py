@@ -0,0 +1,182 @@
+import os
+import json
+import hashlib
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import nibabel as nib
+import numpy as np
+
+
+# 清单保存目录，按文件夹绝对路径的哈希命名，不写入被扫描的（可能只读或共享的）文件夹
+DEFAULT_MANIFEST_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'MySystem', 'manifests')
+
+# 支持的NIfTI文件扩展名
+NIFTI_EXTENSIONS = ('.nii', '.nii.gz')
+
+
+class DatasetIndexer:
+    """数据集索引器，只读取NIfTI头部信息并维护文件夹清单"""
+
+    def __init__(self, max_workers=None, manifest_dir=None):
+        """
+        初始化索引器
+
+        Args:
+            max_workers: 并行读取头部的线程数，默认为CPU核数的两倍（以IO为主）
+            manifest_dir: 清单保存目录，默认为DEFAULT_MANIFEST_DIR
+        """
+        self.max_workers = max_workers or 2 * (os.cpu_count() or 1)
+        self.manifest_dir = manifest_dir or DEFAULT_MANIFEST_DIR
+
+    def manifest_path(self, folder):
+        """
+        文件夹清单的保存路径
+
+        Args:
+            folder: 文件夹路径
+
+        Returns:
+            manifest_path: 清单文件路径
+        """
+        key = hashlib.sha1(os.path.abspath(folder).encode('utf-8')).hexdigest()
+        return os.path.join(self.manifest_dir, key + '.json')
+
+    def find_files(self, folder):
+        """
+        查找文件夹中的所有NIfTI文件
+
+        Args:
+            folder: 文件夹路径
+
+        Returns:
+            file_paths: 排序后的文件路径列表
+        """
+        file_paths = []
+        for root, dirs, files in os.walk(folder):
+            for file in files:
+                if file.endswith(NIFTI_EXTENSIONS):
+                    file_paths.append(os.path.join(root, file))
+        return sorted(file_paths)
+
+    def read_entry(self, file_path, folder):
+        """
+        只读取头部信息生成清单条目（nib.load不会读取图像数据）
+
+        Args:
+            file_path: NIfTI文件路径
+            folder: 清单所在文件夹，条目中保存相对路径
+
+        Returns:
+            entry: 清单条目字典，读取失败时抛出异常
+        """
+        stat = os.stat(file_path)
+        header = nib.load(file_path).header
+        affine = np.asarray(header.get_best_affine(), dtype=np.float64)
+        ndim = int(header['dim'][0])
+        return {
+            'path': os.path.relpath(file_path, folder),
+            'size': stat.st_size,
+            'mtime': stat.st_mtime_ns,
+            'dims': [int(d) for d in header['dim'][1:ndim + 1]],
+            'pixdim': [float(p) for p in header['pixdim'][1:ndim + 1]],
+            'dtype': header.get_data_dtype().str,
+            'datatype': int(header['datatype']),
+            'bitpix': int(header['bitpix']),
+            'affine_hash': hashlib.sha1(affine.tobytes()).hexdigest()
+        }
+
+    def load_manifest(self, folder):
+        """
+        读取文件夹的清单
+
+        Args:
+            folder: 文件夹路径
+
+        Returns:
+            entries: 以相对路径为键的条目字典，清单不存在时返回空字典
+        """
+        manifest_path = self.manifest_path(folder)
+        if not os.path.exists(manifest_path):
+            return {}
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            if manifest.get('folder') != os.path.abspath(folder):
+                return {}
+            return {entry['path']: entry for entry in manifest.get('files', [])}
+        except Exception as e:
+            print(f"读取清单时出错: {e}")
+            return {}
+
+    def save_manifest(self, folder, entries):
+        """
+        写入文件夹的清单（先写临时文件再改名）
+
+        Args:
+            folder: 文件夹路径
+            entries: 条目列表
+
+        Returns:
+            bool: 写入是否成功
+        """
+        manifest_path = self.manifest_path(folder)
+        try:
+            os.makedirs(self.manifest_dir, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=self.manifest_dir, prefix='.manifest_', suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'version': 2, 'folder': os.path.abspath(folder), 'files': entries}, f, indent=1)
+            os.replace(temp_path, manifest_path)
+            return True
+        except Exception as e:
+            print(f"写入清单时出错: {e}")
+            return False
+
+    def scan(self, folder, progress_callback=None):
+        """
+        扫描文件夹并增量更新清单，大小和修改时间未变的文件沿用已有条目
+
+        Args:
+            folder: 文件夹路径
+            progress_callback: 进度回调，参数为(已完成数, 需读取总数)
+
+        Returns:
+            entries: 按路径排序的条目列表
+            errors: 无法读取的文件列表，元素为(相对路径, 错误信息)
+        """
+        cached = self.load_manifest(folder)
+        file_paths = self.find_files(folder)
+
+        entries = []
+        errors = []
+        pending = []
+        for file_path in file_paths:
+            rel_path = os.path.relpath(file_path, folder)
+            entry = cached.get(rel_path)
+            try:
+                stat = os.stat(file_path)
+            except OSError as e:
+                errors.append((rel_path, str(e)))
+                continue
+            if entry is not None and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime_ns:
+                entries.append(entry)
+            else:
+                pending.append(file_path)
+
+        # 新增或修改过的文件并行读取头部
+        if pending:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = [executor.submit(self.read_entry, file_path, folder) for file_path in pending]
+                for done, (file_path, future) in enumerate(zip(pending, futures), 1):
+                    try:
+                        entries.append(future.result())
+                    except Exception as e:
+                        errors.append((os.path.relpath(file_path, folder), str(e)))
+                    if progress_callback is not None:
+                        progress_callback(done, len(pending))
+
+        entries.sort(key=lambda entry: entry['path'])
+        if pending or len(entries) != len(cached):
+            self.save_manifest(folder, entries)
+        errors.sort()
+        return entries, errors
@@ -0,0 +1,294 @@
+import os
+import gzip
+import struct
+import threading
+import zlib
+from bisect import bisect_right
+from itertools import accumulate
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+try:
+    # 可选依赖：为单成员gzip文件建立zran风格的索引点，支持快速随机访问
+    import indexed_gzip
+except ImportError:
+    indexed_gzip = None
+
+
+# 每个线程任务解压的成员数量，避免为每个64KB的小块单独调度
+MEMBERS_PER_TASK = 64
+
+# BGZF每个成员的最大未压缩长度（保证压缩后成员不超过64KB）
+BGZF_BLOCK_SIZE = 65280
+
+# BGZF文件结尾的空成员
+BGZF_EOF = bytes.fromhex('1f8b08040000000000ff0600424302001b0003000000000000000000')
+
+
+def scan_members(buffer):
+    """
+    解析BGZF风格的多成员gzip流
+
+    BGZF（bgzip等工具生成）在每个成员头部的扩展字段中记录了成员大小，
+    无需解压即可定位所有成员的边界
+
+    Args:
+        buffer: 压缩文件的完整内容
+
+    Returns:
+        members: (偏移, 长度)列表，不是BGZF格式时返回None
+    """
+    members = []
+    pos = 0
+    total = len(buffer)
+    while pos < total:
+        # 检查gzip魔数和FEXTRA标志
+        if total - pos < 18 or buffer[pos] != 0x1f or buffer[pos + 1] != 0x8b:
+            return None
+        if not buffer[pos + 3] & 0x04:
+            return None
+
+        xlen = struct.unpack_from('<H', buffer, pos + 10)[0]
+        extra_start = pos + 12
+        extra_end = extra_start + xlen
+        block_size = None
+        i = extra_start
+        while i + 4 <= extra_end:
+            subfield_len = struct.unpack_from('<H', buffer, i + 2)[0]
+            if buffer[i] == 66 and buffer[i + 1] == 67 and subfield_len == 2:
+                # 'BC'子字段：成员总长度减一
+                block_size = struct.unpack_from('<H', buffer, i + 4)[0] + 1
+            i += 4 + subfield_len
+        if block_size is None:
+            return None
+
+        members.append((pos, block_size))
+        pos += block_size
+    return members
+
+
+def compress_member(block, level=6):
+    """
+    将一段数据压缩为一个BGZF成员
+
+    Args:
+        block: 不超过BGZF_BLOCK_SIZE的数据
+        level: 压缩级别
+
+    Returns:
+        member: 带'BC'扩展字段的gzip成员
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    deflated = compressor.compress(block) + compressor.flush()
+    # 头部18字节 + 压缩数据 + CRC32和ISIZE共8字节
+    block_size = 18 + len(deflated) + 8
+    header = struct.pack('<4BI2BH2BHH', 0x1f, 0x8b, 8, 4, 0, 0, 0xff, 6, 66, 67, 2, block_size - 1)
+    trailer = struct.pack('<2I', zlib.crc32(block) & 0xffffffff, len(block))
+    return header + deflated + trailer
+
+
+def write_gzip(file_path, data, level=6, max_workers=None):
+    """
+    将数据按BGZF格式在多个核上并行压缩并写入文件
+
+    生成的文件是标准的多成员gzip文件，任何gzip工具都可以读取，
+    GzipReader读取时也可以并行解压
+
+    Args:
+        file_path: 输出文件路径
+        data: 要压缩的数据（bytes或支持缓冲区协议的对象）
+        level: 压缩级别
+        max_workers: 并行压缩的线程数，默认为CPU核数
+    """
+    view = memoryview(data).cast('B')
+    blocks = [view[i:i + BGZF_BLOCK_SIZE] for i in range(0, len(view), BGZF_BLOCK_SIZE)]
+    max_workers = max_workers or os.cpu_count() or 1
+
+    def compress_group(group):
+        # zlib压缩时释放GIL，按组调度减少线程切换
+        return b''.join(compress_member(block, level) for block in group)
+
+    groups = [blocks[i:i + MEMBERS_PER_TASK] for i in range(0, len(blocks), MEMBERS_PER_TASK)]
+    with open(file_path, 'wb') as f:
+        if len(groups) <= 1 or max_workers <= 1:
+            for group in groups:
+                f.write(compress_group(group))
+        else:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                for chunk in executor.map(compress_group, groups):
+                    f.write(chunk)
+        f.write(BGZF_EOF)
+
+
+class GzipReader:
+    """gzip文件读取器，多成员文件并行解压，单成员文件使用索引点随机访问"""
+
+    def __init__(self, file_path, max_workers=None):
+        """
+        打开gzip文件
+
+        Args:
+            file_path: gzip文件路径
+            max_workers: 并行解压的线程数，默认为CPU核数
+        """
+        self.file_path = file_path
+        self.max_workers = max_workers or os.cpu_count() or 1
+        with open(file_path, 'rb') as f:
+            self.compressed = f.read()
+        self.members = scan_members(self.compressed)
+        self.member_offsets = None
+        # 单成员文件随机访问时保持打开，索引点可以复用
+        self._seekable = None
+        if self.members is not None:
+            # 成员末尾的ISIZE为解压后大小，据此建立解压后的偏移表
+            sizes = [struct.unpack_from('<I', self.compressed, offset + size - 4)[0]
+                     for offset, size in self.members]
+            self.member_offsets = [0] + list(accumulate(sizes))
+
+    @property
+    def parallel(self):
+        """是否可以并行解压"""
+        return self.members is not None and len(self.members) > 1
+
+    @property
+    def random_access(self):
+        """是否可以不从头解压而读取任意区间（多成员文件，或安装了indexed_gzip的单成员文件）"""
+        return self.parallel or indexed_gzip is not None
+
+    @property
+    def size(self):
+        """解压后的总大小，单成员文件未知时返回None"""
+        return self.member_offsets[-1] if self.member_offsets is not None else None
+
+    def _inflate(self, indices):
+        """解压指定的若干成员（zlib解压时释放GIL）"""
+        view = memoryview(self.compressed)
+        return b''.join(
+            zlib.decompress(view[self.members[i][0]:self.members[i][0] + self.members[i][1]], 31)
+            for i in indices
+        )
+
+    def _inflate_parallel(self, indices):
+        """将成员分组后在线程池中并行解压"""
+        indices = list(indices)
+        groups = [indices[i:i + MEMBERS_PER_TASK] for i in range(0, len(indices), MEMBERS_PER_TASK)]
+        if len(groups) <= 1 or self.max_workers <= 1:
+            return b''.join(self._inflate(group) for group in groups)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return b''.join(executor.map(self._inflate, groups))
+
+    def read_all(self):
+        """
+        解压整个文件
+
+        Returns:
+            data: 解压后的字节串
+        """
+        if not self.parallel:
+            # 单成员文件只能顺序解压
+            return gzip.decompress(self.compressed)
+        return self._inflate_parallel(range(len(self.members)))
+
+    def read_range(self, offset, length):
+        """
+        读取解压后数据中的指定区间
+
+        Args:
+            offset: 解压后数据中的起始偏移
+            length: 读取长度
+
+        Returns:
+            data: 区间内的字节串
+        """
+        if self.member_offsets is not None:
+            # 只解压与区间相交的成员
+            first = bisect_right(self.member_offsets, offset) - 1
+            last = bisect_right(self.member_offsets, offset + length - 1) - 1
+            last = min(last, len(self.members) - 1)
+            data = self._inflate_parallel(range(first, last + 1))
+            start = offset - self.member_offsets[first]
+            return data[start:start + length]
+
+        # 单成员文件：优先使用indexed_gzip的索引点定位，否则从头解压到目标位置
+        if self._seekable is None:
+            if indexed_gzip is not None:
+                self._seekable = indexed_gzip.IndexedGzipFile(self.file_path)
+            else:
+                self._seekable = gzip.open(self.file_path, 'rb')
+        self._seekable.seek(offset)
+        return self._seekable.read(length)
+
+    def close(self):
+        """关闭随机访问使用的文件句柄"""
+        if self._seekable is not None:
+            self._seekable.close()
+            self._seekable = None
+
+
+class GzipVolume:
+    """
+    .nii.gz文件中的体数据，按z范围读取解压后数据中对应的连续区间
+
+    NIfTI数据按Fortran顺序存储，相邻的若干z切片在解压后的数据中是连续的一段，
+    多成员文件只解压与该段相交的成员，单成员文件通过indexed_gzip的索引点定位
+    """
+
+    def __init__(self, reader, offset, shape, dtype):
+        """
+        Args:
+            reader: GzipReader实例
+            offset: 数据在解压后文件中的偏移（vox_offset）
+            shape: 轴顺序为(x, y, z)的形状
+            dtype: 磁盘上的数据类型
+        """
+        self.reader = reader
+        self.offset = offset
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.ndim = len(self.shape)
+        self.plane_bytes = self.shape[0] * self.shape[1] * self.dtype.itemsize
+        # 单成员文件的随机访问共享一个文件句柄
+        self._lock = threading.Lock()
+
+    def read_planes(self, z0, z1):
+        """读取[z0, z1)范围的切片，返回轴顺序为(x, y, z)的数组"""
+        with self._lock:
+            data = self.reader.read_range(self.offset + z0 * self.plane_bytes, (z1 - z0) * self.plane_bytes)
+        return np.frombuffer(data, dtype=self.dtype).reshape(z1 - z0, self.shape[1], self.shape[0]).T
+
+    def __getitem__(self, key):
+        """
+        读取指定区域，只解压z范围内的数据
+
+        Args:
+            key: 按(x, y, z)顺序的整数或切片元组
+
+        Returns:
+            data: numpy数组
+        """
+        if not isinstance(key, tuple):
+            key = (key,)
+        key = key + (slice(None),) * (3 - len(key))
+        kx, ky, kz = key
+        if isinstance(kz, slice):
+            z_indices = range(*kz.indices(self.shape[2]))
+        else:
+            z = int(kz)
+            z_indices = [z + self.shape[2] if z < 0 else z]
+            if not 0 <= z_indices[0] < self.shape[2]:
+                raise IndexError('z索引超出范围')
+        if len(z_indices) == 0:
+            return np.empty(np.empty(self.shape[:2] + (0,), dtype=self.dtype)[kx, ky].shape, dtype=self.dtype)
+        z0, z1 = min(z_indices), max(z_indices) + 1
+        planes = self.read_planes(z0, z1)
+        data = planes[kx, ky][..., [z - z0 for z in z_indices]]
+        if not isinstance(kz, slice):
+            data = data[..., 0]
+        return data
+
+    def __array__(self, dtype=None, copy=None):
+        data = self[:, :, :]
+        if dtype is not None:
+            data = data.astype(dtype, copy=False)
+        return data
@@ -0,0 +1,143 @@
+import numpy as np
+
+
+class LazyVolume:
+    """延迟加载的3D体数据，按需读取并转换切片"""
+
+    def __init__(self, source, axes=(2, 1, 0), slope=1.0, inter=0.0, dtype=None, source_path=None):
+        """
+        初始化延迟加载体数据
+
+        Args:
+            source: 底层数组（如内存映射数组），轴顺序为磁盘上的(x, y, z)
+            axes: 输出轴对应的source轴，默认(2, 1, 0)即输出(深度, 高度, 宽度)
+            slope: 强度缩放斜率（scl_slope）
+            inter: 强度缩放截距（scl_inter）
+            dtype: 输出数据类型，默认为None（无缩放时保留磁盘类型，否则为float32）
+            source_path: 底层数据来自的文件路径，预处理缓存据此生成键而无需读取数据
+        """
+        self.source = source
+        self.axes = tuple(axes)
+        self.slope = 1.0 if slope is None else float(slope)
+        self.inter = 0.0 if inter is None else float(inter)
+        self.scaled = self.slope != 1.0 or self.inter != 0.0
+        if dtype is None:
+            dtype = np.float32 if self.scaled else source.dtype
+        self.dtype = np.dtype(dtype)
+        self.source_path = source_path
+        # 预处理缓存计算的哈希，底层数据不会改变，计算一次后记录在对象上
+        self.digest = None
+
+    @property
+    def shape(self):
+        return tuple(self.source.shape[axis] for axis in self.axes)
+
+    @property
+    def ndim(self):
+        return len(self.axes)
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    @property
+    def nbytes(self):
+        return self.size * self.dtype.itemsize
+
+    def __len__(self):
+        return self.shape[0]
+
+    def _normalize_key(self, key):
+        """将索引展开为与维度数相同的元组"""
+        if not isinstance(key, tuple):
+            key = (key,)
+        if any(k is Ellipsis for k in key):
+            index = key.index(Ellipsis)
+            fill = (slice(None),) * (self.ndim - len(key) + 1)
+            key = key[:index] + fill + key[index + 1:]
+        key = key + (slice(None),) * (self.ndim - len(key))
+        if len(key) != self.ndim:
+            raise IndexError('索引维度超出体数据维度')
+        return key
+
+    def __getitem__(self, key):
+        """
+        读取指定区域，只访问底层数组中对应的部分
+
+        Args:
+            key: 整数、切片或它们组成的元组，按输出轴顺序
+
+        Returns:
+            data: 转换后的numpy数组
+        """
+        key = self._normalize_key(key)
+        if not all(isinstance(k, (int, np.integer, slice)) for k in key):
+            # 高级索引先整体读取
+            return np.asarray(self)[key]
+
+        # 将输出轴上的索引映射到source轴
+        source_key = [slice(None)] * self.source.ndim
+        for out_axis, k in enumerate(key):
+            source_key[self.axes[out_axis]] = k
+        data = np.asarray(self.source[tuple(source_key)])
+
+        # 剩余轴在source中按升序排列，调整为输出顺序
+        kept_axes = [self.axes[i] for i, k in enumerate(key) if isinstance(k, slice)]
+        order = sorted(kept_axes)
+        data = data.transpose([order.index(axis) for axis in kept_axes])
+
+        return self._convert(data)
+
+    def _convert(self, data):
+        """
+        应用强度缩放并转换数据类型
+
+        缩放在float32中完成；输出为整数类型（如掩码的uint8）时，缩放后的值或浮点数据
+        先四舍五入并截断到目标类型的范围，最后才转换类型
+        """
+        integer_output = np.issubdtype(self.dtype, np.integer)
+        if not self.scaled and not (integer_output and np.issubdtype(data.dtype, np.floating)):
+            return data.astype(self.dtype, copy=False)
+        data = data.astype(np.float32)
+        if self.slope != 1.0:
+            data *= self.slope
+        if self.inter != 0.0:
+            data += self.inter
+        if integer_output:
+            info = np.iinfo(self.dtype)
+            np.rint(data, out=data)
+            np.clip(data, info.min, info.max, out=data)
+        return data.astype(self.dtype, copy=False)
+
+    def __array__(self, dtype=None, copy=None):
+        data = np.ascontiguousarray(self[...])
+        if dtype is not None:
+            data = data.astype(dtype, copy=False)
+        return data
+
+    def transpose(self, *axes):
+        """
+        返回调换轴顺序后的延迟加载视图
+
+        Args:
+            axes: 新的轴顺序
+
+        Returns:
+            volume: 新的LazyVolume，与当前对象共享底层数组
+        """
+        if len(axes) == 1 and isinstance(axes[0], (tuple, list)):
+            axes = axes[0]
+        if not axes:
+            axes = tuple(reversed(range(self.ndim)))
+        return LazyVolume(
+            self.source,
+            axes=[self.axes[axis] for axis in axes],
+            slope=self.slope,
+            inter=self.inter,
+            dtype=self.dtype,
+            source_path=self.source_path
+        )
+
+    def copy(self):
+        """完整读取为numpy数组"""
+        return np.array(self)
@@ -0,0 +1,223 @@
+import os
+import tempfile
+
+import numpy as np
+from scipy import ndimage
+
+from src.data.data_loader import DataLoader
+
+
+# 掩码容器文件的扩展名
+MASK_EXTENSION = '.mask.npz'
+
+
+class MaskStore:
+    """
+    稀疏掩码的紧凑存储
+
+    每个切片按游程编码保存（游程长度和标签值），切片偏移表支持直接访问任意切片，
+    同时保存连通病灶列表，无需解码即可查看病灶数量、大小和位置
+    """
+
+    def __init__(self, shape, offsets, lengths, values, affine=None, lesions=None):
+        """
+        初始化掩码存储
+
+        Args:
+            shape: 掩码形状(深度, 高度, 宽度)
+            offsets: 每个切片在游程数组中的起始位置，长度为深度+1
+            lengths: 游程长度
+            values: 游程对应的标签值
+            affine: 仿射变换矩阵
+            lesions: 病灶列表数组字典，为None时在需要时从掩码计算
+        """
+        self.shape = tuple(int(n) for n in shape)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.lengths = np.asarray(lengths, dtype=np.uint32)
+        self.values = np.asarray(values, dtype=np.uint8)
+        self.affine = affine
+        self._lesions = lesions
+
+    @classmethod
+    def from_array(cls, mask, affine=None):
+        """
+        将掩码编码为游程
+
+        Args:
+            mask: 3D掩码，浮点数据四舍五入为标签值
+            affine: 仿射变换矩阵
+
+        Returns:
+            store: MaskStore实例
+        """
+        mask = np.asarray(mask)
+        if np.issubdtype(mask.dtype, np.floating):
+            mask = np.rint(mask)
+        mask = mask.astype(np.uint8, copy=False)
+        depth = mask.shape[0]
+        slice_size = mask[0].size if depth else 0
+        flat = mask.ravel()
+
+        # 值发生变化的位置和每个切片的起点都作为游程起点
+        boundaries = np.ones(flat.size, dtype=bool)
+        if flat.size:
+            boundaries[1:] = flat[1:] != flat[:-1]
+            boundaries[::slice_size] = True
+        starts = np.flatnonzero(boundaries)
+        lengths = np.diff(np.append(starts, flat.size))
+        values = flat[starts]
+        offsets = np.searchsorted(starts, np.arange(depth + 1) * slice_size)
+
+        store = cls(mask.shape, offsets, lengths, values, affine)
+        store._lesions = store.find_lesions(mask)
+        return store
+
+    @classmethod
+    def from_nifti(cls, file_path, data_loader=None):
+        """
+        从NIFTI掩码文件创建
+
+        Args:
+            file_path: NIFTI文件路径
+            data_loader: DataLoader实例
+
+        Returns:
+            store: MaskStore实例，加载失败时返回None
+        """
+        data_loader = data_loader or DataLoader()
+        mask, affine, header = data_loader.load_nifti(file_path, data_kind='mask')
+        if mask is None:
+            return None
+        return cls.from_array(mask, affine)
+
+    @staticmethod
+    def find_lesions(mask):
+        """
+        标记三维连通病灶并统计大小、质心和包围盒
+
+        Args:
+            mask: 3D掩码
+
+        Returns:
+            lesions: 包含'size'、'centroid'和'bbox'数组的字典
+        """
+        labeled, count = ndimage.label(mask > 0)
+        coords = np.nonzero(labeled)
+        ids = labeled[coords] - 1
+        sizes = np.bincount(ids, minlength=count)
+        centroids = np.zeros((count, 3), dtype=np.float32)
+        bboxes = np.zeros((count, 6), dtype=np.int32)
+        for axis in range(3):
+            centroids[:, axis] = np.bincount(ids, weights=coords[axis], minlength=count) / np.maximum(sizes, 1)
+        for index, bbox in enumerate(ndimage.find_objects(labeled)):
+            bboxes[index, :3] = [s.start for s in bbox]
+            bboxes[index, 3:] = [s.stop for s in bbox]
+        return {'size': sizes.astype(np.int64), 'centroid': centroids, 'bbox': bboxes}
+
+    @property
+    def lesions(self):
+        """
+        病灶列表
+
+        Returns:
+            lesions: 每个病灶的字典，包含体素数、质心(z, y, x)和包围盒(起点, 终点)
+        """
+        if self._lesions is None:
+            self._lesions = self.find_lesions(self.to_array())
+        return [
+            {'size': int(size), 'centroid': tuple(centroid.tolist()),
+             'bbox': (tuple(bbox[:3].tolist()), tuple(bbox[3:].tolist()))}
+            for size, centroid, bbox in zip(self._lesions['size'], self._lesions['centroid'], self._lesions['bbox'])
+        ]
+
+    def __len__(self):
+        return self.shape[0]
+
+    def get_slice(self, index):
+        """
+        解码单个切片
+
+        Args:
+            index: 切片索引
+
+        Returns:
+            slice_data: 形状为(高度, 宽度)的uint8数组
+        """
+        if index < 0:
+            index += self.shape[0]
+        start, stop = self.offsets[index], self.offsets[index + 1]
+        return np.repeat(self.values[start:stop], self.lengths[start:stop]).reshape(self.shape[1:])
+
+    def __getitem__(self, index):
+        return self.get_slice(index)
+
+    def to_array(self):
+        """
+        解码整个掩码
+
+        Returns:
+            mask: 形状为(深度, 高度, 宽度)的uint8数组
+        """
+        return np.repeat(self.values, self.lengths).reshape(self.shape)
+
+    def to_nifti(self, file_path, header=None, data_loader=None):
+        """
+        保存为uint8的NIFTI掩码文件
+
+        Args:
+            file_path: 保存路径
+            header: 头部信息
+            data_loader: DataLoader实例
+
+        Returns:
+            bool: 是否保存成功
+        """
+        data_loader = data_loader or DataLoader()
+        affine = self.affine if self.affine is not None else np.eye(4)
+        return data_loader.save_nifti(self.to_array(), affine, header, file_path, mask=True)
+
+    def save(self, file_path):
+        """
+        保存掩码容器（先写临时文件再重命名）
+
+        Args:
+            file_path: 保存路径，通常以MASK_EXTENSION结尾
+        """
+        arrays = {
+            'shape': np.asarray(self.shape, dtype=np.int64),
+            'offsets': self.offsets,
+            'lengths': self.lengths,
+            'values': self.values,
+        }
+        if self.affine is not None:
+            arrays['affine'] = np.asarray(self.affine, dtype=np.float64)
+        if self._lesions is not None:
+            arrays.update({f'lesion_{name}': value for name, value in self._lesions.items()})
+
+        directory = os.path.dirname(os.path.abspath(file_path))
+        fd, temp_path = tempfile.mkstemp(prefix='.tmp_', suffix='.npz', dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez_compressed(f, **arrays)
+            os.replace(temp_path, file_path)
+        except Exception:
+            os.remove(temp_path)
+            raise
+
+    @classmethod
+    def load(cls, file_path):
+        """
+        读取掩码容器
+
+        Args:
+            file_path: 容器文件路径
+
+        Returns:
+            store: MaskStore实例
+        """
+        with np.load(file_path) as data:
+            lesions = None
+            if 'lesion_size' in data:
+                lesions = {name: data[f'lesion_{name}'] for name in ('size', 'centroid', 'bbox')}
+            affine = data['affine'] if 'affine' in data else None
+            return cls(data['shape'], data['offsets'], data['lengths'], data['values'], affine, lesions)
@@ -0,0 +1,109 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+class Prefetcher:
+    """后台预读后续文件，预读结果保存在共享的体数据缓存中"""
+
+    def __init__(self, data_loader, depth=2, max_workers=1):
+        """
+        初始化预读器
+
+        Args:
+            data_loader: DataLoader实例
+            depth: 最多预读的文件数
+            max_workers: 预读线程数
+        """
+        self.data_loader = data_loader
+        self.depth = depth
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def estimate_bytes(self, file_path, lazy, data_kind):
+        """
+        根据头部信息估算加载后占用的内存
+
+        Args:
+            file_path: 文件路径
+            lazy: 是否延迟加载
+            data_kind: 数据类别
+
+        Returns:
+            nbytes: 估算的字节数，无法估算时返回None
+        """
+        if lazy and not str(file_path).endswith('.gz'):
+            # 未压缩文件延迟加载时为内存映射，不占用常驻内存
+            return 0
+        affine, header = self.data_loader.load_header(file_path)
+        if header is None:
+            return None
+        slope, inter = header.get_slope_inter()
+        dtype = self.data_loader.resolve_dtype(data_kind, header.get_data_dtype(), slope, inter)
+        if lazy:
+            # 压缩文件首次打开时保留解压后的原始数据
+            dtype = header.get_data_dtype()
+        return int(np.prod(header.get_data_shape())) * dtype.itemsize
+
+    def prefetch(self, file_paths, lazy=False, data_kind='image'):
+        """
+        在后台预读若干文件，超出缓存内存预算时停止
+
+        Args:
+            file_paths: 按处理顺序排列的候选文件列表，只预读前depth个
+            lazy: 是否延迟加载
+            data_kind: 数据类别
+        """
+        cache = self.data_loader.volume_cache
+        with self._lock:
+            reserved = sum(nbytes for _, nbytes in self._pending.values())
+            for file_path in file_paths[:self.depth]:
+                key = (os.path.abspath(file_path), lazy, data_kind)
+                if key in self._pending:
+                    continue
+                nbytes = self.estimate_bytes(file_path, lazy, data_kind)
+                if nbytes is None or reserved + nbytes > cache.free_bytes():
+                    break
+                future = self.executor.submit(self._load, key, file_path, lazy, data_kind)
+                self._pending[key] = (future, nbytes)
+                reserved += nbytes
+
+    def _load(self, key, file_path, lazy, data_kind):
+        try:
+            return self.data_loader.load_nifti(file_path, lazy=lazy, data_kind=data_kind)
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def get(self, file_path, lazy=False, data_kind='image'):
+        """
+        获取文件数据，正在预读时等待预读完成，否则直接加载
+
+        Args:
+            file_path: 文件路径
+            lazy: 是否延迟加载
+            data_kind: 数据类别
+
+        Returns:
+            image_data, affine, header: 与DataLoader.load_nifti相同
+        """
+        with self._lock:
+            pending = self._pending.get((os.path.abspath(file_path), lazy, data_kind))
+        if pending is not None:
+            return pending[0].result()
+        return self.data_loader.load_nifti(file_path, lazy=lazy, data_kind=data_kind)
+
+    def cancel(self):
+        """取消尚未开始的预读"""
+        with self._lock:
+            for key, (future, _) in list(self._pending.items()):
+                if future.cancel():
+                    del self._pending[key]
+
+    def shutdown(self):
+        """停止预读线程"""
+        self.cancel()
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,169 @@
+import os
+import mmap
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from src.data.lazy_volume import LazyVolume
+from src.data.chunk_cache import ChunkedVolume
+from src.data.gzip_io import GzipVolume
+
+
+# 默认内存预算（字节）
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+
+def is_memory_mapped(array):
+    """
+    判断数组是否由内存映射文件支撑（不占用常驻内存）
+
+    Args:
+        array: numpy数组
+
+    Returns:
+        bool: 是否为内存映射数组或其视图
+    """
+    base = array
+    while isinstance(base, np.ndarray):
+        if isinstance(base, np.memmap):
+            return True
+        base = base.base
+    return isinstance(base, mmap.mmap)
+
+
+def estimate_nbytes(image_data):
+    """
+    估算体数据实际占用的内存
+
+    Args:
+        image_data: numpy数组、LazyVolume或None
+
+    Returns:
+        nbytes: 字节数
+    """
+    if image_data is None:
+        return 0
+    if isinstance(image_data, LazyVolume):
+        source = image_data.source
+        if isinstance(source, ChunkedVolume):
+            # 分块存储只在内存中保留少量已解压的分块
+            slab_bytes = source.shape[0] * source.shape[1] * source.slab_size * source.dtype.itemsize
+            return slab_bytes * source.max_cached_slabs
+        if isinstance(source, GzipVolume):
+            # 只在内存中保留压缩数据
+            return len(source.reader.compressed)
+        return estimate_nbytes(source)
+    if isinstance(image_data, np.ndarray):
+        return 0 if is_memory_mapped(image_data) else image_data.nbytes
+    return 0
+
+
+class VolumeCache:
+    """进程内共享的体数据缓存，超出内存预算时按LRU策略淘汰"""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        初始化缓存
+
+        Args:
+            max_bytes: 内存预算（字节）
+        """
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+    def make_key(self, file_path, *policy):
+        """
+        生成缓存键，包含路径、修改时间和加载策略
+
+        Args:
+            file_path: 文件路径
+            policy: 加载策略（如是否延迟加载、数据类别）
+
+        Returns:
+            key: 缓存键
+        """
+        stat = os.stat(file_path)
+        return (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size) + tuple(policy)
+
+    def get(self, key):
+        """
+        获取缓存项并标记为最近使用
+
+        Args:
+            key: 缓存键
+
+        Returns:
+            value: 缓存的值，不存在时返回None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value, nbytes=0):
+        """
+        加入缓存项，必要时淘汰最久未使用的项
+
+        Args:
+            key: 缓存键
+            value: 要缓存的值
+            nbytes: 该项占用的内存
+
+        Returns:
+            bool: 是否已缓存（超出预算的单项不缓存）
+        """
+        if nbytes > self.max_bytes:
+            return False
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, nbytes)
+            self.current_bytes += nbytes
+            self._evict()
+        return True
+
+    def _evict(self):
+        """淘汰最久未使用的项直到满足内存预算"""
+        while self.current_bytes > self.max_bytes and self._entries:
+            _, (_, nbytes) = self._entries.popitem(last=False)
+            self.current_bytes -= nbytes
+
+    def set_max_bytes(self, max_bytes):
+        """
+        调整内存预算
+
+        Args:
+            max_bytes: 新的内存预算（字节）
+        """
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def free_bytes(self):
+        """剩余可用的内存预算"""
+        with self._lock:
+            return max(0, self.max_bytes - self.current_bytes)
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+
+_shared_cache = None
+_shared_lock = threading.Lock()
+
+
+def get_volume_cache():
+    """获取进程内共享的体数据缓存"""
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = VolumeCache()
+        return _shared_cache
@@ -0,0 +1,319 @@
+import queue
+import threading
+from functools import lru_cache
+
+import numpy as np
+
+from src.preprocessing.slice_sequence import SliceSequence
+from src.preprocessing.preprocessor import Preprocessor
+
+
+class InferenceCancelled(Exception):
+    """推理被取消"""
+    pass
+
+
+def foreground_probability(output, spatial_ndim):
+    """
+    将模型输出统一为每个样本的前景概率
+
+    Args:
+        output: 模型输出，形状为(n, *空间维度)或(n, 通道, *空间维度)
+        spatial_ndim: 空间维度数
+
+    Returns:
+        probability: 形状为(n, *空间维度)的float32数组
+    """
+    output = np.asarray(output, dtype=np.float32)
+    if output.ndim == spatial_ndim + 1:
+        return output
+    if output.ndim == spatial_ndim + 2:
+        if output.shape[1] == 1:
+            return output[:, 0]
+        # 多通道输出：第0通道为背景
+        return 1.0 - output[:, 0]
+    raise ValueError(f"模型输出的维度不正确: {output.shape}")
+
+
+@lru_cache(maxsize=8)
+def gaussian_importance_map(window, sigma_scale=0.125, min_weight=1e-3):
+    """
+    滑窗融合用的高斯重要性图，中心权重为1，边缘权重小但不为0
+
+    各轴的1D高斯相乘得到，与nnUNet中对中心点做高斯滤波的结果相同。
+    按窗口大小缓存，返回只读数组
+
+    Args:
+        window: 窗口大小(深, 高, 宽)
+        sigma_scale: 标准差与窗口边长的比例
+        min_weight: 最小权重，只被窗口角落覆盖的体素用float16累加时也不会下溢为0
+
+    Returns:
+        importance: 形状为window的float32数组
+    """
+    importance = np.ones((), dtype=np.float32)
+    for p in window:
+        center = (p - 1) / 2.0
+        sigma = max(p * sigma_scale, 1e-3)
+        axis = np.exp(-0.5 * ((np.arange(p) - center) / sigma) ** 2).astype(np.float32)
+        importance = np.multiply.outer(importance, axis)
+    importance /= importance.max()
+    importance = np.maximum(importance, min_weight).astype(np.float32)
+    importance.setflags(write=False)
+    return importance
+
+
+class SlidingWindowBlender:
+    """
+    滑窗预测结果的逐层融合
+
+    窗口按深度起点的升序到达，累加缓冲区只覆盖两倍窗口深度的层；深度小于当前窗口起点的层
+    不会再被后续窗口覆盖，加权平均后写入输出并移出缓冲区，缓冲区大小与体数据深度无关
+    """
+
+    def __init__(self, output, window, importance, threshold=None, accumulate_dtype=np.float32):
+        """
+        Args:
+            output: 输出数组，形状为体数据形状
+            window: 窗口大小(深, 高, 宽)
+            importance: 窗口内的权重
+            threshold: 给出时输出二值化结果
+            accumulate_dtype: 累加缓冲区的类型
+        """
+        self.output = output
+        self.window = tuple(window)
+        self.importance = importance
+        self.threshold = threshold
+        # 补边后的高度和宽度
+        height = max(output.shape[1], self.window[1])
+        width = max(output.shape[2], self.window[2])
+        self.depth = 2 * self.window[0]
+        self.probability = np.zeros((self.depth, height, width), dtype=accumulate_dtype)
+        self.weights = np.zeros_like(self.probability)
+        self.base = 0
+
+    def add(self, position, patch):
+        """累加一个加权后的窗口预测"""
+        z, y, x = position
+        if z < self.base:
+            raise ValueError("窗口必须按深度起点的升序加入")
+        if z + self.window[0] > self.base + self.depth:
+            self.flush(z)
+        region = (
+            slice(z - self.base, z - self.base + self.window[0]),
+            slice(y, y + self.window[1]),
+            slice(x, x + self.window[2])
+        )
+        self.probability[region] += patch
+        self.weights[region] += self.importance
+
+    def flush(self, stop):
+        """将[base, stop)层的加权平均写入输出，缓冲区移到从stop开始"""
+        count = stop - self.base
+        rows = min(stop, self.output.shape[0], self.base + self.depth) - self.base
+        if rows > 0:
+            height, width = self.output.shape[1:]
+            # 每个体素至少被一个窗口覆盖，权重不小于min_weight
+            blended = np.divide(
+                self.probability[:rows, :height, :width], self.weights[:rows, :height, :width], dtype=np.float32
+            )
+            target = self.output[self.base:self.base + rows]
+            if self.threshold is None:
+                target[...] = blended
+            else:
+                np.greater_equal(blended, self.threshold, out=target, casting='unsafe')
+        keep = max(self.depth - count, 0)
+        if keep:
+            self.probability[:keep] = self.probability[count:]
+            self.weights[:keep] = self.weights[count:]
+        self.probability[keep:] = 0
+        self.weights[keep:] = 0
+        self.base = stop
+
+    def finish(self):
+        """写出缓冲区中剩余的层"""
+        self.flush(self.base + self.depth)
+
+
+class InferenceEngine:
+    """
+    批量推理引擎
+
+    将切片或图像块组成固定大小的批次，后台线程准备下一批数据（复制到预分配的缓冲区并做可选的预处理），
+    同时主线程对当前批次调用model.predict
+    """
+
+    def __init__(self, model, batch_size=8, mode='2d', patch_size=None, stride=None,
+                 preprocessor=None, preprocess_fn=None, prefetch_batches=2,
+                 overlap=None, blend='gaussian', accumulate_dtype=np.float32):
+        """
+        初始化推理引擎
+
+        Args:
+            model: FirstStageModel或SecondStageModel实例，predict接收形状为(n, 高, 宽)
+                   或(n, 深, 高, 宽)的float32批次
+            batch_size: 每批的切片数或图像块数
+            mode: '2d'按深度切片推理，'patch'按图像块滑窗推理
+            patch_size: 图像块大小，patch模式下为None时使用preprocessor.patch_size
+            stride: 滑窗步长，默认由overlap决定
+            preprocessor: Preprocessor实例，patch模式下用于提取图像块，为None时自动创建
+            preprocess_fn: 可选的批次预处理函数，就地修改批次，在后台线程中执行
+            prefetch_batches: 预先准备的批次数
+            overlap: 相邻窗口的重叠比例，默认为0.5
+            blend: 重叠区域的融合方式，'gaussian'按高斯重要性图加权，'constant'直接平均
+            accumulate_dtype: 滑窗累加缓冲区的类型，np.float16可使缓冲区内存减半
+        """
+        if mode not in ('2d', 'patch'):
+            raise ValueError("mode必须为'2d'或'patch'")
+        if blend not in ('gaussian', 'constant'):
+            raise ValueError("blend必须为'gaussian'或'constant'")
+        if mode == 'patch' and preprocessor is None:
+            preprocessor = Preprocessor(patch_size=patch_size)
+        self.model = model
+        self.batch_size = batch_size
+        self.mode = mode
+        self.patch_size = patch_size
+        self.stride = stride
+        self.preprocessor = preprocessor
+        self.preprocess_fn = preprocess_fn
+        self.prefetch_batches = prefetch_batches
+        self.overlap = 0.5 if overlap is None else overlap
+        self.blend = blend
+        self.accumulate_dtype = np.dtype(accumulate_dtype)
+
+    def window_and_stride(self):
+        """patch模式下的3D窗口大小和步长"""
+        patch_size = tuple(self.patch_size or self.preprocessor.patch_size or ())
+        if len(patch_size) not in (2, 3):
+            raise ValueError("patch_size的长度必须为2或3")
+        window = patch_size if len(patch_size) == 3 else (1,) + patch_size
+        if self.stride is not None:
+            stride = tuple(self.stride) if len(self.stride) == 3 else (1,) + tuple(self.stride)
+        else:
+            stride = tuple(max(int(round(p * (1 - self.overlap))), 1) for p in window)
+        return patch_size, window, stride
+
+    def iter_batches(self, volume):
+        """
+        生成(位置, 批次)，每个批次都是新的float32数组，可以在队列中等待和就地预处理
+
+        Yields:
+            positions, batch: 2D模式下为切片索引列表，patch模式下为块起点列表
+        """
+        if self.mode == '2d':
+            slices = SliceSequence(volume)
+            for start in range(0, len(slices), self.batch_size):
+                stop = min(start + self.batch_size, len(slices))
+                out = np.empty((stop - start,) + slices.slice_shape, dtype=np.float32)
+                yield list(range(start, stop)), slices.batch(start, stop, out=out)
+        else:
+            patch_size, _, stride = self.window_and_stride()
+            for positions, batch in self.preprocessor.extract_patches(
+                volume, patch_size=patch_size, stride=stride, batch_size=self.batch_size
+            ):
+                # extract_patches复用缓冲区
+                yield positions, batch.copy()
+
+    def count_batches(self, volume):
+        """批次总数，用于汇报进度"""
+        if self.mode == '2d':
+            return -(-volume.shape[0] // self.batch_size)
+        _, window, stride = self.window_and_stride()
+        shape = [max(n, p) for n, p in zip(volume.shape, window)]
+        count = int(np.prod([len(s) for s in self.preprocessor.patch_starts(shape, window, stride)]))
+        return -(-count // self.batch_size)
+
+    @staticmethod
+    def _put(ready, item, stop_event):
+        """放入队列，消费者停止后放弃，避免生产者线程在满队列上永久阻塞"""
+        while not stop_event.is_set():
+            try:
+                ready.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce(self, volume, ready, stop_event):
+        """后台线程：准备批次并放入队列"""
+        try:
+            for positions, batch in self.iter_batches(volume):
+                if self.preprocess_fn is not None:
+                    self.preprocess_fn(batch)
+                if not self._put(ready, (positions, batch), stop_event):
+                    return
+            self._put(ready, None, stop_event)
+        except Exception as e:
+            self._put(ready, e, stop_event)
+
+    def run(self, volume, progress_callback=None, cancel_check=None, threshold=None):
+        """
+        对整个体数据推理
+
+        体数据按批次读取切片或图像块，不整体加载；滑窗模式的累加缓冲区只覆盖窗口所在的若干层
+
+        Args:
+            volume: 形状为(深度, 高度, 宽度)的3D数据（numpy数组、内存映射数组或LazyVolume）
+            progress_callback: 进度回调，参数为(已完成批次数, 总批次数)
+            cancel_check: 返回True时抛出InferenceCancelled
+            threshold: 给出时直接输出uint8掩码（前景概率不小于阈值为1），不保留float32概率
+
+        Returns:
+            probability: 与volume形状相同的float32前景概率，给出threshold时为uint8掩码
+        """
+        shape = tuple(volume.shape)
+        total = self.count_batches(volume)
+        output = np.zeros(shape, dtype=np.float32 if threshold is None else np.uint8)
+        blender = None
+        if self.mode == 'patch':
+            patch_size, window, _ = self.window_and_stride()
+            if self.blend == 'gaussian':
+                importance = gaussian_importance_map(window)
+            else:
+                importance = np.ones(window, dtype=np.float32)
+            blender = SlidingWindowBlender(output, window, importance, threshold, self.accumulate_dtype)
+
+        ready = queue.Queue(maxsize=self.prefetch_batches)
+        stop_event = threading.Event()
+        producer = threading.Thread(target=self._produce, args=(volume, ready, stop_event), daemon=True)
+        producer.start()
+        try:
+            done = 0
+            while True:
+                item = ready.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                if cancel_check is not None and cancel_check():
+                    raise InferenceCancelled()
+                positions, batch = item
+                prediction = self.model.predict(batch)
+                del batch
+                if self.mode == '2d':
+                    probability = foreground_probability(prediction, 2)
+                    target = output[positions[0]:positions[-1] + 1]
+                    if threshold is None:
+                        target[...] = probability
+                    else:
+                        np.greater_equal(probability, threshold, out=target, casting='unsafe')
+                else:
+                    self.accumulate(blender, positions, prediction, len(patch_size))
+                done += 1
+                if progress_callback is not None:
+                    progress_callback(done, total)
+        finally:
+            stop_event.set()
+            producer.join()
+
+        if blender is not None:
+            blender.finish()
+        return output
+
+    def accumulate(self, blender, positions, output, patch_ndim):
+        """将一批图像块的预测结果按重要性图加权后交给融合器"""
+        window = blender.window
+        output = foreground_probability(output, patch_ndim).reshape((len(positions),) + window)
+        blended = np.multiply(output, blender.importance, dtype=np.float32)
+        for position, patch in zip(positions, blended):
+            blender.add(position, patch)
@@ -1,5 +1,9 @@
+import os
 from abc import ABC, abstractmethod
 
+# 模型文件目录（项目根目录下的models）
+MODEL_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'models')
+
 class BaseModel(ABC):
     """模型基类"""
     
@@ -41,6 +45,37 @@ class FirstStageModel(BaseModel):
             prediction: 预测结果，应为分割掩码
         """
         pass
+    
+    def predict_sliding_window(self, volume, patch_size, overlap=0.5, batch_size=2,
+                               accumulate_dtype='float32', progress_callback=None, cancel_check=None):
+        """
+        滑窗推理，按块大小平铺整个体数据，重叠区域用高斯重要性图加权融合
+        
+        predict每次只接收一批图像块，峰值内存为两个体数据大小的累加缓冲区加上几批图像块，
+        与体数据大小无关的部分保持不变
+        
+        Args:
+            volume: 形状为(深度, 高度, 宽度)的3D数据
+            patch_size: 块大小（通常为nnUNet计划中的patch_size）
+            overlap: 相邻窗口的重叠比例
+            batch_size: 每批的图像块数
+            accumulate_dtype: 累加缓冲区类型，'float16'可使缓冲区内存减半
+            progress_callback: 进度回调，参数为(已完成批次数, 总批次数)
+            cancel_check: 返回True时停止推理
+            
+        Returns:
+            probability: 与volume形状相同的float32前景概率
+        """
+        from src.models.inference import InferenceEngine
+        engine = InferenceEngine(
+            self,
+            batch_size=batch_size,
+            mode='patch',
+            patch_size=tuple(patch_size),
+            overlap=overlap,
+            accumulate_dtype=accumulate_dtype
+        )
+        return engine.run(volume, progress_callback=progress_callback, cancel_check=cancel_check)
 
 class SecondStageModel(BaseModel):
     """二阶段分割模型接口"""
@@ -51,7 +86,8 @@ class SecondStageModel(BaseModel):
         二阶段模型预测
         
         Args:
-            input_data: 输入数据，应为一阶段模型处理后的2D图像
+            input_data: 输入数据，应为一阶段候选病灶周围的2D块(n, 高, 宽)
+                        或带上下文切片的2.5D块(n, 切片数, 高, 宽)
             
         Returns:
             prediction: 预测结果，应为精细分割掩码
@@ -61,6 +97,57 @@ class SecondStageModel(BaseModel):
 class ModelFactory:
     """模型工厂类，用于创建模型实例"""
     
+    # 界面中的模型名称 -> (模型类型, 加载函数, 模型配置)
+    _registry = {}
+    
+    @classmethod
+    def register(cls, name, model_type, model_config=None, loader=None):
+        """
+        注册界面中可选的模型
+        
+        Args:
+            name: 界面中显示的模型名称
+            model_type: 'first_stage'或'second_stage'
+            model_config: 模型配置，可包含warmup_shape（预热推理的输入形状）和
+                          patch_size（3D模型滑窗推理的默认块大小）
+            loader: 加载函数，参数为(model_type, model_config)，默认为create_model
+        """
+        cls._registry[name] = (model_type, loader or cls.create_model, dict(model_config or {}))
+    
+    @classmethod
+    def registered_names(cls, model_type=None):
+        """已注册的模型名称"""
+        return [name for name, (kind, _, _) in cls._registry.items() if model_type is None or kind == model_type]
+    
+    @classmethod
+    def model_config(cls, name):
+        """已注册模型的配置，未注册时返回None"""
+        entry = cls._registry.get(name)
+        return dict(entry[2]) if entry is not None else None
+    
+    @classmethod
+    def load(cls, name):
+        """
+        按界面中的名称加载模型
+        
+        Args:
+            name: 已注册的模型名称
+            
+        Returns:
+            model: 模型实例，模型未注册、模型文件不存在或没有对应的模型实现时抛出异常
+        """
+        entry = cls._registry.get(name)
+        if entry is None:
+            raise KeyError(f"未注册的模型: {name}")
+        model_type, loader, model_config = entry
+        model_path = model_config.get('model_path')
+        if model_path and not os.path.exists(model_path):
+            raise FileNotFoundError(f"模型文件不存在: {model_path}")
+        model = loader(model_type, dict(model_config))
+        if model is None:
+            raise ValueError(f"没有可用的模型实现: {name}")
+        return model
+    
     @staticmethod
     def create_model(model_type, model_config=None):
         """
@@ -73,9 +160,16 @@ class ModelFactory:
         Returns:
             model: 模型实例
         """
-        # 这里可以根据model_type和model_config创建不同的模型实例
-        # 具体实现由用户根据自己的模型来完成
-        # 示例：
+        model_config = model_config or {}
+        # 导出为ONNX的模型使用ONNX Runtime在CPU上运行
+        if model_config.get('backend') == 'onnx' or str(model_config.get('model_path', '')).endswith('.onnx'):
+            from src.models.onnx_backend import OnnxFirstStageModel, OnnxSecondStageModel
+            if model_type == 'first_stage':
+                return OnnxFirstStageModel(model_config)
+            elif model_type == 'second_stage':
+                return OnnxSecondStageModel(model_config)
+        
+        # 其他模型需要用户根据自己的模型实现来添加，例如：
         # if model_type == 'first_stage':
         #     if model_config.get('model_architecture') == '3d_unet':
         #         return UNet3DModel(model_config)
@@ -83,6 +177,25 @@ class ModelFactory:
         #         return UNet2DModel(model_config)
         # elif model_type == 'second_stage':
         #     return SecondStageRefinementModel(model_config)
-        # 
-        # 目前返回None，用户需要根据自己的模型实现来修改
-        return None
\ No newline at end of file
+        return None
+
+
+# 界面中可选的模型，模型文件放在MODEL_DIR下
+ModelFactory.register('3D U-Net', 'first_stage', {
+    'model_path': os.path.join(MODEL_DIR, 'first_stage_3d_unet.onnx'),
+    # 没有nnUNet计划时滑窗推理使用的块大小
+    'patch_size': (64, 128, 128),
+    'warmup_shape': (1, 64, 128, 128),
+})
+ModelFactory.register('2D U-Net', 'first_stage', {
+    'model_path': os.path.join(MODEL_DIR, 'first_stage_2d_unet.onnx'),
+    'warmup_shape': (1, 256, 256),
+})
+ModelFactory.register('精细分割模型', 'second_stage', {
+    'model_path': os.path.join(MODEL_DIR, 'second_stage_refinement.onnx'),
+    'warmup_shape': (1, 3, 64, 64),
+})
+ModelFactory.register('边缘优化模型', 'second_stage', {
+    'model_path': os.path.join(MODEL_DIR, 'second_stage_edge.onnx'),
+    'warmup_shape': (1, 3, 64, 64),
+})
@@ -0,0 +1,150 @@
+import time
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from src.models.model_interface import ModelFactory
+
+
+# 默认同时保留的模型数量
+DEFAULT_MAX_MODELS = 2
+
+# 默认空闲淘汰时间（秒）
+DEFAULT_IDLE_SECONDS = 30 * 60
+
+
+class ModelPool:
+    """
+    已加载模型的进程内池
+
+    按界面中的模型名称缓存模型实例，避免每次预测重新反序列化权重；
+    超过数量上限时按LRU策略淘汰，长时间未使用的模型也会被释放
+    """
+
+    def __init__(self, max_models=DEFAULT_MAX_MODELS, idle_seconds=DEFAULT_IDLE_SECONDS, loader=None):
+        """
+        初始化模型池
+
+        Args:
+            max_models: 同时保留的模型数量上限
+            idle_seconds: 模型空闲多久后被释放
+            loader: 加载函数，参数为模型名称，默认为ModelFactory.load
+        """
+        self.max_models = max_models
+        self.idle_seconds = idle_seconds
+        self.loader = loader or ModelFactory.load
+        # 名称 -> [模型, 最后使用时间]
+        self._models = OrderedDict()
+        self._lock = threading.Lock()
+        # 每个名称一把加载锁，同一模型只加载一次，不同模型可以同时加载
+        self._load_locks = {}
+        # 名称 -> 最近一次加载失败的原因
+        self._errors = {}
+
+    def _load_lock(self, name):
+        with self._lock:
+            return self._load_locks.setdefault(name, threading.Lock())
+
+    def _lookup(self, name):
+        with self._lock:
+            entry = self._models.get(name)
+            if entry is None:
+                return None
+            entry[1] = time.monotonic()
+            self._models.move_to_end(name)
+            return entry[0]
+
+    def get(self, name):
+        """
+        获取模型，未加载时加载并放入池中
+
+        Args:
+            name: 模型名称
+
+        Returns:
+            model: 模型实例，无法加载时返回None
+        """
+        self.evict_idle()
+        model = self._lookup(name)
+        if model is not None:
+            return model
+        with self._load_lock(name):
+            # 等待期间可能已由其他线程（如预热线程）加载完成
+            model = self._lookup(name)
+            if model is not None:
+                return model
+            try:
+                model = self.loader(name)
+            except Exception as e:
+                print(f"加载模型 {name} 时出错: {e}")
+                self._errors[name] = str(e)
+                return None
+            if model is None:
+                self._errors[name] = f"无法加载模型: {name}"
+                return None
+            with self._lock:
+                self._errors.pop(name, None)
+                self._models[name] = [model, time.monotonic()]
+                while len(self._models) > self.max_models:
+                    self._models.popitem(last=False)
+            return model
+
+    def require(self, name):
+        """
+        获取模型，无法加载时抛出异常
+
+        Args:
+            name: 模型名称
+
+        Returns:
+            model: 模型实例
+        """
+        model = self.get(name)
+        if model is None:
+            raise RuntimeError(self._errors.get(name) or f"无法加载模型: {name}")
+        return model
+
+    def contains(self, name):
+        """模型是否已在池中"""
+        with self._lock:
+            return name in self._models
+
+    def evict_idle(self):
+        """
+        释放空闲时间超过idle_seconds的模型
+
+        Returns:
+            evicted: 被释放的模型名称列表
+        """
+        now = time.monotonic()
+        with self._lock:
+            evicted = [name for name, (_, last_used) in self._models.items()
+                       if now - last_used > self.idle_seconds]
+            for name in evicted:
+                del self._models[name]
+        return evicted
+
+    def clear(self):
+        """释放所有模型"""
+        with self._lock:
+            self._models.clear()
+
+    def warm_up(self, name):
+        """
+        加载模型并用全零输入推理一次，使首次真实预测不再承担加载和初始化的开销
+
+        Args:
+            name: 模型名称
+
+        Returns:
+            bool: 模型是否可用
+        """
+        model = self.get(name)
+        if model is None:
+            return False
+        config = ModelFactory.model_config(name) or {}
+        shape = config.get('warmup_shape')
+        if shape is not None:
+            model.predict(np.zeros(shape, dtype=np.float32))
+        return True
@@ -0,0 +1,211 @@
+import os
+import tempfile
+import threading
+
+import numpy as np
+
+from src.models.model_interface import FirstStageModel, SecondStageModel
+
+try:
+    # 可选依赖：CPU上运行导出的ONNX模型
+    import onnxruntime
+except ImportError:
+    onnxruntime = None
+
+
+# int8动态量化模型的文件后缀
+QUANTIZED_SUFFIX = '.int8.onnx'
+
+# 每个会话保留的已绑定缓冲区数量（不同批次大小各占一组，通常为完整批次和最后一个不完整批次）
+MAX_BOUND_SHAPES = 2
+
+
+def quantized_path(model_path):
+    """int8量化模型的路径，与原模型放在同一目录"""
+    base, _ = os.path.splitext(model_path)
+    return base + QUANTIZED_SUFFIX
+
+
+def quantize_model(model_path):
+    """
+    生成int8动态量化模型（权重量化为int8，激活在运行时量化）
+
+    已存在且比原模型新的量化模型直接复用
+
+    Args:
+        model_path: 原ONNX模型路径
+
+    Returns:
+        output_path: 量化模型路径
+    """
+    output_path = quantized_path(model_path)
+    if os.path.exists(output_path) and os.path.getmtime(output_path) >= os.path.getmtime(model_path):
+        return output_path
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    # 先写入临时文件再重命名，避免中断后留下不完整的模型
+    fd, temp_path = tempfile.mkstemp(prefix='.tmp_', suffix='.onnx', dir=os.path.dirname(output_path) or '.')
+    os.close(fd)
+    try:
+        quantize_dynamic(model_path, temp_path, weight_type=QuantType.QInt8)
+        os.replace(temp_path, output_path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return output_path
+
+
+class OnnxSession:
+    """
+    ONNX Runtime CPU推理会话
+
+    每种输入形状预先分配一组输入/输出缓冲区并绑定到IOBinding，之后的调用只把批次复制到
+    输入缓冲区，模型直接写入输出缓冲区，不再为每次调用分配内存
+    """
+
+    def __init__(self, model_path, intra_op_threads=None, inter_op_threads=1, quantize=False):
+        """
+        创建推理会话
+
+        Args:
+            model_path: ONNX模型路径
+            intra_op_threads: 算子内并行线程数，默认为CPU核数
+            inter_op_threads: 算子间并行线程数
+            quantize: 是否使用int8动态量化模型
+        """
+        if onnxruntime is None:
+            raise ImportError("需要安装onnxruntime才能运行ONNX模型")
+        if quantize:
+            model_path = quantize_model(model_path)
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+        options.intra_op_num_threads = intra_op_threads or os.cpu_count() or 1
+        options.inter_op_num_threads = inter_op_threads
+        self.model_path = model_path
+        self.session = onnxruntime.InferenceSession(
+            model_path, sess_options=options, providers=['CPUExecutionProvider']
+        )
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.input_rank = len(model_input.shape)
+        self.output_name = self.session.get_outputs()[0].name
+        # 输入形状 -> (IOBinding, 输入缓冲区, 输出缓冲区)
+        self._bindings = {}
+        # 预热线程和预测线程可能同时使用池中的同一个模型，绑定的缓冲区不能并发使用
+        self.lock = threading.RLock()
+
+    def _bind(self, shape):
+        """为输入形状分配并绑定缓冲区，输出形状由第一次运行得到"""
+        input_buffer = np.zeros(shape, dtype=np.float32)
+        binding = self.session.io_binding()
+        binding.bind_cpu_input(self.input_name, input_buffer)
+        binding.bind_output(self.output_name, 'cpu')
+        self.session.run_with_iobinding(binding)
+        output_shape = binding.get_outputs()[0].shape()
+        output_buffer = np.empty(output_shape, dtype=np.float32)
+        binding.bind_output(
+            self.output_name, 'cpu', 0, np.float32, list(output_shape), output_buffer.ctypes.data
+        )
+        if len(self._bindings) >= MAX_BOUND_SHAPES:
+            self._bindings.pop(next(iter(self._bindings)))
+        self._bindings[shape] = (binding, input_buffer, output_buffer)
+        return self._bindings[shape]
+
+    def run(self, batch):
+        """
+        对一个批次推理
+
+        Args:
+            batch: 形状为(n, *空间维度)或(n, 通道, *空间维度)的数组
+
+        Returns:
+            output: 模型输出（绑定的输出缓冲区，下一次相同形状的调用会覆盖，
+                    其他线程也可能调用时需要在持有lock期间读取）
+        """
+        batch = np.asarray(batch, dtype=np.float32)
+        if batch.ndim == self.input_rank - 1:
+            # 单通道模型输入需要通道维
+            batch = batch[:, None]
+        shape = tuple(batch.shape)
+        with self.lock:
+            bound = self._bindings.get(shape)
+            if bound is None:
+                bound = self._bind(shape)
+            binding, input_buffer, output_buffer = bound
+            np.copyto(input_buffer, batch)
+            self.session.run_with_iobinding(binding)
+            return output_buffer
+
+
+def logits_to_probability(logits):
+    """单通道输出取sigmoid，多通道输出在通道维上取softmax"""
+    if logits.shape[1] == 1:
+        return 1.0 / (1.0 + np.exp(-logits))
+    shifted = logits - logits.max(axis=1, keepdims=True)
+    np.exp(shifted, out=shifted)
+    shifted /= shifted.sum(axis=1, keepdims=True)
+    return shifted
+
+
+class OnnxModelMixin:
+    """ONNX模型的公共实现"""
+
+    def __init__(self, model_config=None):
+        """
+        Args:
+            model_config: 模型配置，支持以下键：
+                model_path: ONNX模型路径，给出时立即加载
+                intra_op_threads: 算子内并行线程数
+                inter_op_threads: 算子间并行线程数
+                quantize: 是否使用int8动态量化模型
+                output: 模型输出类型，'logits'（默认）或'probability'
+        """
+        self.config = dict(model_config or {})
+        self.session = None
+        if self.config.get('model_path'):
+            self.load_model(self.config['model_path'])
+
+    def load_model(self, model_path):
+        """
+        加载ONNX模型
+
+        Args:
+            model_path: 模型文件路径
+        """
+        self.session = OnnxSession(
+            model_path,
+            intra_op_threads=self.config.get('intra_op_threads'),
+            inter_op_threads=self.config.get('inter_op_threads', 1),
+            quantize=self.config.get('quantize', False)
+        )
+
+    def predict(self, input_data):
+        """
+        模型预测
+
+        Args:
+            input_data: 形状为(n, *空间维度)的float32批次
+
+        Returns:
+            prediction: 形状为(n, 通道, *空间维度)的概率
+        """
+        if self.session is None:
+            raise RuntimeError("模型尚未加载")
+        # 在释放锁之前把输出缓冲区转换为新数组
+        with self.session.lock:
+            output = self.session.run(input_data)
+            if self.config.get('output', 'logits') == 'logits':
+                return logits_to_probability(output)
+            return output.copy()
+
+
+class OnnxFirstStageModel(OnnxModelMixin, FirstStageModel):
+    """用ONNX Runtime在CPU上运行的一阶段分割模型"""
+    pass
+
+
+class OnnxSecondStageModel(OnnxModelMixin, SecondStageModel):
+    """用ONNX Runtime在CPU上运行的二阶段分割模型"""
+    pass
@@ -1,13 +1,22 @@
 import os
 import numpy as np
 from src.data.data_loader import DataLoader
+from src.data.mask_store import MaskStore, MASK_EXTENSION
+from src.models.inference import InferenceCancelled, foreground_probability
 from src.visualization.image_display import ImageDisplay
 
+# 候选块的平面大小(高, 宽)
+DEFAULT_CANDIDATE_PATCH = (64, 64)
+
+# 候选块中心切片上下各取的上下文切片数（0为2D，大于0为2.5D）
+DEFAULT_CONTEXT_SLICES = 1
+
 class SecondStageProcessor:
     """二阶段模型数据处理器"""
     
     def __init__(self):
-        self.data_loader = DataLoader()
+        # 一阶段结果和导出的切片只读取一次，不转存分块缓存
+        self.data_loader = DataLoader(chunk_cache=False)
         self.image_display = ImageDisplay()
     
     def nifti_to_png(self, nifti_path, output_dir, slice_axis=0):
@@ -25,8 +34,8 @@ class SecondStageProcessor:
         # 确保输出目录存在
         os.makedirs(output_dir, exist_ok=True)
         
-        # 加载NIFTI文件
-        image_data, affine, header = self.data_loader.load_nifti(nifti_path)
+        # 延迟加载NIFTI文件，逐个切片读取
+        image_data, affine, header = self.data_loader.load_nifti(nifti_path, lazy=True)
         if image_data is None:
             return []
         
@@ -63,8 +72,8 @@ class SecondStageProcessor:
             bool: 转换是否成功
         """
         try:
-            # 加载参考NIFTI文件，获取仿射变换和头部信息
-            _, affine, header = self.data_loader.load_nifti(reference_nifti_path)
+            # 读取参考NIFTI文件的仿射变换和头部信息（无需加载图像数据）
+            affine, header = self.data_loader.load_header(reference_nifti_path)
             if affine is None or header is None:
                 return False
             
@@ -96,45 +105,38 @@ class SecondStageProcessor:
             print(f"PNG转NIFTI时出错: {e}")
             return False
     
-    def process_first_stage_output(self, first_stage_output, output_dir):
+    def process_first_stage_output(self, first_stage_output, shape=None, patch_size=DEFAULT_CANDIDATE_PATCH):
         """
         处理一阶段模型输出，准备二阶段模型输入
         
+        对一阶段掩码做连通域分析得到候选病灶，再计算覆盖候选病灶的块起点；
+        二阶段只读取这些块，不再逐切片导出整个体数据
+        
         Args:
-            first_stage_output: 一阶段模型输出，可以是NIFTI文件路径或3D数组
-            output_dir: 二阶段模型输入目录（PNG格式）
+            first_stage_output: 一阶段模型输出，可以是NIFTI文件路径、掩码容器路径或3D数组
+            shape: 图像形状，给出时检查一阶段输出与其一致
+            patch_size: 候选块的平面大小(高, 宽)
             
         Returns:
-            png_paths: PNG文件路径列表
+            mask: 一阶段输出的3D掩码
+            candidates: 候选病灶（与extract_candidates相同）
+            origins: 覆盖所有候选病灶的块起点(z, y, x)列表
         """
-        if isinstance(first_stage_output, str) and first_stage_output.endswith('.nii'):
-            # 如果是NIFTI文件路径
-            return self.nifti_to_png(first_stage_output, output_dir)
+        if isinstance(first_stage_output, str) and first_stage_output.endswith(MASK_EXTENSION):
+            mask = MaskStore.load(first_stage_output).to_array()
+        elif isinstance(first_stage_output, str) and first_stage_output.endswith(('.nii', '.nii.gz')):
+            mask, _, _ = self.data_loader.load_nifti(first_stage_output, data_kind='mask')
+            if mask is None:
+                raise IOError(f"无法加载一阶段输出: {first_stage_output}")
         elif isinstance(first_stage_output, np.ndarray) and first_stage_output.ndim == 3:
-            # 如果是3D数组，先保存为临时NIFTI文件
-            import tempfile
-            with tempfile.NamedTemporaryFile(suffix='.nii', delete=False) as temp_file:
-                temp_nifti_path = temp_file.name
-            
-            # 创建临时NIFTI文件
-            # 注意：这里需要仿射变换和头部信息，实际应用中可能需要从原始图像获取
-            # 这里使用默认值
-            temp_affine = np.eye(4)
-            temp_header = None
-            self.data_loader.save_nifti(first_stage_output, temp_affine, temp_header, temp_nifti_path)
-            
-            # 转换为PNG
-            png_paths = self.nifti_to_png(temp_nifti_path, output_dir)
-            
-            # 删除临时文件
-            try:
-                os.unlink(temp_nifti_path)
-            except:
-                pass
-            
-            return png_paths
+            mask = first_stage_output
         else:
-            raise ValueError("first_stage_output必须是NIFTI文件路径或3D numpy数组")
+            raise ValueError("first_stage_output必须是NIFTI文件路径、掩码容器路径或3D numpy数组")
+        if shape is not None and mask.shape != tuple(shape):
+            raise ValueError(f"一阶段输出形状{mask.shape}与图像形状{tuple(shape)}不一致")
+        candidates = self.extract_candidates(mask)
+        origins = self.candidate_origins(candidates['bbox'], mask.shape, patch_size)
+        return mask, candidates, origins
     
     def process_second_stage_output(self, second_stage_output, output_nifti_path, reference_nifti_path):
         """
@@ -153,12 +155,146 @@ class SecondStageProcessor:
             return self.png_to_nifti(second_stage_output, output_nifti_path, reference_nifti_path)
         elif isinstance(second_stage_output, np.ndarray) and second_stage_output.ndim == 3:
             # 如果是3D数组，直接保存为NIFTI
-            # 加载参考NIFTI文件，获取仿射变换和头部信息
-            _, affine, header = self.data_loader.load_nifti(reference_nifti_path)
+            # 读取参考NIFTI文件的仿射变换和头部信息（无需加载图像数据）
+            affine, header = self.data_loader.load_header(reference_nifti_path)
             if affine is None or header is None:
                 return False
             
             # 保存为NIFTI格式
             return self.data_loader.save_nifti(second_stage_output, affine, header, output_nifti_path)
         else:
-            raise ValueError("second_stage_output必须是PNG目录或3D numpy数组")
\ No newline at end of file
+            raise ValueError("second_stage_output必须是PNG目录或3D numpy数组")
+    
+    def extract_candidates(self, first_stage_output):
+        """
+        对一阶段输出做三维连通域分析，得到候选病灶
+        
+        Args:
+            first_stage_output: 一阶段输出的3D掩码
+            
+        Returns:
+            candidates: 包含'size'、'centroid'和'bbox'数组的字典（与MaskStore.find_lesions相同）
+        """
+        return MaskStore.find_lesions(np.asarray(first_stage_output))
+    
+    @staticmethod
+    def axis_origins(start, stop, size, length):
+        """包围盒[start, stop)在一个轴上需要的块起点，超过块大小时平铺多个块"""
+        extent = stop - start
+        if extent <= size:
+            origins = [start + extent // 2 - size // 2]
+        else:
+            origins = list(range(start, stop - size, size)) + [stop - size]
+        # 块尽量完整地落在体数据内
+        return [min(max(o, 0), max(length - size, 0)) for o in origins]
+    
+    def candidate_origins(self, bboxes, shape, patch_size=DEFAULT_CANDIDATE_PATCH):
+        """
+        计算覆盖所有候选病灶的块起点
+        
+        病灶包围盒覆盖的每个切片各取一个以包围盒为中心的块，相邻病灶产生的重复块只保留一个
+        
+        Args:
+            bboxes: 形状为(n, 6)的包围盒数组(起点z, y, x, 终点z, y, x)
+            shape: 体数据形状
+            patch_size: 块的平面大小(高, 宽)
+            
+        Returns:
+            origins: 排序后的块起点(z, y, x)列表
+        """
+        origins = set()
+        for z0, y0, x0, z1, y1, x1 in np.asarray(bboxes).tolist():
+            ys = self.axis_origins(y0, y1, patch_size[0], shape[1])
+            xs = self.axis_origins(x0, x1, patch_size[1], shape[2])
+            for z in range(z0, z1):
+                for y in ys:
+                    for x in xs:
+                        origins.add((z, y, x))
+        return sorted(origins)
+    
+    def iter_candidate_patches(self, image_data, origins, patch_size=DEFAULT_CANDIDATE_PATCH,
+                               context_slices=DEFAULT_CONTEXT_SLICES, batch_size=32):
+        """
+        按批裁剪候选块
+        
+        Args:
+            image_data: 3D图像
+            origins: 块起点(z, y, x)列表
+            patch_size: 块的平面大小(高, 宽)
+            context_slices: 中心切片上下各取的切片数，超出边界时重复边界切片
+            batch_size: 每批的块数
+            
+        Yields:
+            positions, batch: 块起点列表，以及形状为(n, 高, 宽)（context_slices为0时）
+                              或(n, 2*context_slices+1, 高, 宽)的float32批次（下一次迭代时会被覆盖）
+        """
+        depth, height, width = image_data.shape
+        h, w = patch_size
+        offsets = np.arange(-context_slices, context_slices + 1)
+        buffer = np.empty((batch_size, len(offsets), h, w), dtype=np.float32)
+        for start in range(0, len(origins), batch_size):
+            positions = origins[start:start + batch_size]
+            batch = buffer[:len(positions)]
+            for patch, (z, y, x) in zip(batch, positions):
+                # 体数据小于块大小时剩余部分补0
+                hh, ww = min(h, height - y), min(w, width - x)
+                if hh < h or ww < w:
+                    patch.fill(0)
+                slices = np.clip(z + offsets, 0, depth - 1)
+                # 先读取连续的切片范围再选取，LazyVolume不会因高级索引而整体加载
+                region = image_data[slices[0]:slices[-1] + 1, y:y + hh, x:x + ww]
+                patch[:, :hh, :ww] = region[slices - slices[0]]
+            yield positions, batch[:, 0] if context_slices == 0 else batch
+    
+    def refine_candidates(self, model, image_data, first_stage_output, patch_size=DEFAULT_CANDIDATE_PATCH,
+                          context_slices=DEFAULT_CONTEXT_SLICES, batch_size=32, threshold=0.5,
+                          preprocess_fn=None, progress_callback=None, cancel_check=None):
+        """
+        只对一阶段标出的候选病灶做二阶段精细分割
+        
+        候选块批量送入二阶段模型，精细分割结果贴回体数据中对应的位置，
+        计算量与病灶数量成正比，与切片数量无关
+        
+        Args:
+            model: SecondStageModel实例，predict输出每个块中心切片的(n, 高, 宽)概率或(n, 通道, 高, 宽)
+            image_data: 3D图像
+            first_stage_output: 一阶段输出的3D掩码或其文件路径（见process_first_stage_output），形状与image_data相同
+            patch_size: 块的平面大小(高, 宽)
+            context_slices: 中心切片上下各取的上下文切片数
+            batch_size: 每批的块数
+            threshold: 二值化阈值
+            preprocess_fn: 可选的批次归一化函数，就地修改批次
+            progress_callback: 进度回调，参数为(已完成批次数, 总批次数)
+            cancel_check: 返回True时抛出InferenceCancelled
+            
+        Returns:
+            refined: uint8精细分割掩码
+            candidates: 候选病灶数
+        """
+        if not isinstance(first_stage_output, str):
+            first_stage_output = np.asarray(first_stage_output)
+        first_stage_output, candidates, origins = self.process_first_stage_output(
+            first_stage_output, shape=image_data.shape, patch_size=patch_size
+        )
+        
+        # 候选块覆盖的区域由二阶段结果决定，其余区域保持一阶段结果
+        refined = (first_stage_output > 0).astype(np.uint8)
+        h, w = patch_size
+        for z, y, x in origins:
+            refined[z, y:y + h, x:x + w] = 0
+        
+        total = -(-len(origins) // batch_size)
+        done = 0
+        for positions, batch in self.iter_candidate_patches(image_data, origins, patch_size, context_slices, batch_size):
+            if cancel_check is not None and cancel_check():
+                raise InferenceCancelled()
+            if preprocess_fn is not None:
+                preprocess_fn(batch)
+            masks = foreground_probability(model.predict(batch), 2) >= threshold
+            for (z, y, x), mask in zip(positions, masks):
+                region = refined[z, y:y + h, x:x + w]
+                np.maximum(region, mask[:region.shape[0], :region.shape[1]], out=region)
+            done += 1
+            if progress_callback is not None:
+                progress_callback(done, total)
+        return refined, len(candidates['size'])
@@ -0,0 +1,364 @@
+import os
+import glob
+import json
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+from scipy.ndimage import affine_transform, map_coordinates
+
+from src.data.data_loader import DataLoader
+from src.preprocessing.resampling import resample_volume
+
+
+# 界面中列出的增强方法
+SPATIAL_AUGMENTATIONS = ('random_rotation', 'random_scaling', 'random_flip', 'elastic_deform')
+INTENSITY_AUGMENTATIONS = ('gaussian_noise', 'brightness', 'contrast', 'gamma')
+
+# 弹性形变控制点间距（体素）
+ELASTIC_GRID_SPACING = 32
+
+
+class Augmenter:
+    """数据增强器，空间变换合成为一次重采样，强度变换就地向量化计算"""
+
+    def __init__(self, selected, rotation_degrees=15.0, scale_range=(0.85, 1.15),
+                 elastic_magnitude=4.0, noise_std=0.1, brightness_range=(0.75, 1.25),
+                 contrast_range=(0.75, 1.25), gamma_range=(0.7, 1.5)):
+        """
+        初始化数据增强器
+
+        Args:
+            selected: 选中的增强方法键名列表（如'random_rotation'）
+            rotation_degrees: 切片平面内旋转的最大角度
+            scale_range: 缩放因子范围
+            elastic_magnitude: 弹性形变控制点的最大位移（体素）
+            noise_std: 高斯噪声标准差相对图像标准差的最大比例
+            brightness_range: 亮度乘数范围
+            contrast_range: 对比度因子范围
+            gamma_range: Gamma值范围
+        """
+        unknown = set(selected) - set(SPATIAL_AUGMENTATIONS) - set(INTENSITY_AUGMENTATIONS)
+        if unknown:
+            raise ValueError(f"未知的增强方法: {', '.join(sorted(unknown))}")
+        self.selected = set(selected)
+        self.rotation_degrees = rotation_degrees
+        self.scale_range = scale_range
+        self.elastic_magnitude = elastic_magnitude
+        self.noise_std = noise_std
+        self.brightness_range = brightness_range
+        self.contrast_range = contrast_range
+        self.gamma_range = gamma_range
+
+    def sample_matrix(self, rng):
+        """
+        采样从输出坐标到输入坐标的线性变换（旋转、缩放和翻转的合成）
+
+        Returns:
+            matrix: 3x3矩阵，未选中任何仿射变换时返回None
+        """
+        matrix = np.eye(3)
+        changed = False
+        if 'random_rotation' in self.selected:
+            # 各向异性的SWI数据只在切片平面内旋转
+            angle = np.deg2rad(rng.uniform(-self.rotation_degrees, self.rotation_degrees))
+            c, s = np.cos(angle), np.sin(angle)
+            matrix = matrix @ np.array([[1, 0, 0], [0, c, -s], [0, s, c]])
+            changed = True
+        if 'random_scaling' in self.selected:
+            matrix = matrix @ np.diag([1.0 / rng.uniform(*self.scale_range)] * 3)
+            changed = True
+        if 'random_flip' in self.selected:
+            flips = np.where(rng.random(3) < 0.5, -1.0, 1.0)
+            matrix = matrix @ np.diag(flips)
+            changed = changed or bool((flips < 0).any())
+        return matrix if changed else None
+
+    def sample_displacement(self, rng, shape):
+        """
+        在粗网格上采样随机位移并线性插值到完整分辨率
+
+        Returns:
+            displacement: 每个轴一个float32位移场
+        """
+        grid_shape = [max(2, int(np.ceil(n / ELASTIC_GRID_SPACING)) + 1) for n in shape]
+        displacement = []
+        for _ in range(3):
+            coarse = rng.uniform(-self.elastic_magnitude, self.elastic_magnitude, grid_shape).astype(np.float32)
+            factors = [n / g for n, g in zip(shape, grid_shape)]
+            field = resample_volume(coarse, factors, order=1, max_workers=1)
+            displacement.append(field[:shape[0], :shape[1], :shape[2]])
+        return displacement
+
+    def spatial_transform(self, image, label, rng):
+        """
+        将选中的空间变换合成为一次重采样
+
+        Args:
+            image: float32图像
+            label: 标签或None
+            rng: 随机数生成器
+
+        Returns:
+            image, label: 变换后的数据
+        """
+        matrix = self.sample_matrix(rng)
+        elastic = 'elastic_deform' in self.selected
+        if matrix is None and not elastic:
+            return image, label
+
+        center = (np.asarray(image.shape) - 1) / 2.0
+        if matrix is None:
+            matrix = np.eye(3)
+        offset = center - matrix @ center
+        background = float(image.min())
+
+        if not elastic:
+            # 只有仿射变换时不需要生成坐标数组
+            if np.allclose(np.abs(matrix), np.eye(3)):
+                # 只有翻转时直接翻转数组
+                axes = tuple(int(a) for a in np.flatnonzero(np.diag(matrix) < 0))
+                image = np.ascontiguousarray(np.flip(image, axes))
+                if label is not None:
+                    label = np.ascontiguousarray(np.flip(label, axes))
+                return image, label
+            image = affine_transform(image, matrix, offset, order=1, mode='constant', cval=background,
+                                     output=np.float32)
+            if label is not None:
+                label = affine_transform(label, matrix, offset, order=0, mode='constant', cval=0)
+            return image, label
+
+        # 仿射坐标加弹性位移，一次插值完成
+        grid = np.ogrid[tuple(slice(0, n) for n in image.shape)]
+        displacement = self.sample_displacement(rng, image.shape)
+        coords = np.empty((3,) + image.shape, dtype=np.float32)
+        for axis in range(3):
+            coords[axis] = displacement[axis]
+            coords[axis] += offset[axis]
+            for k in range(3):
+                if matrix[axis, k] != 0:
+                    coords[axis] += np.float32(matrix[axis, k]) * grid[k]
+        del displacement
+        image = map_coordinates(image, coords, order=1, mode='constant', cval=background, output=np.float32)
+        if label is not None:
+            label = map_coordinates(label, coords, order=0, mode='constant', cval=0)
+        return image, label
+
+    def intensity_transform(self, image, rng):
+        """
+        就地应用选中的强度变换
+
+        Args:
+            image: 可写的float32图像
+            rng: 随机数生成器
+        """
+        if 'brightness' in self.selected:
+            image *= np.float32(rng.uniform(*self.brightness_range))
+        if 'contrast' in self.selected:
+            mean = np.float32(image.mean(dtype=np.float64))
+            image -= mean
+            image *= np.float32(rng.uniform(*self.contrast_range))
+            image += mean
+        if 'gamma' in self.selected:
+            low = image.min()
+            span = np.float32(image.max() - low + 1e-8)
+            image -= low
+            image /= span
+            np.power(image, np.float32(rng.uniform(*self.gamma_range)), out=image)
+            image *= span
+            image += low
+        if 'gaussian_noise' in self.selected:
+            std = np.float32(rng.uniform(0, self.noise_std) * image.std(dtype=np.float64))
+            noise = rng.standard_normal(image.shape, dtype=np.float32)
+            noise *= std
+            image += noise
+
+    def augment(self, image, label=None, rng=None):
+        """
+        对一个病例做一次随机增强
+
+        Args:
+            image: 3D图像
+            label: 对应的标签，可以为None
+            rng: 随机数生成器
+
+        Returns:
+            image, label: 增强后的float32图像和uint8标签
+        """
+        rng = rng if rng is not None else np.random.default_rng()
+        image = np.array(image, dtype=np.float32)
+        if label is not None:
+            label = np.asarray(label, dtype=np.uint8)
+        image, label = self.spatial_transform(image, label, rng)
+        self.intensity_transform(image, rng)
+        return image, label
+
+
+def _attach(spec):
+    """连接到共享内存中的数组"""
+    name, shape, dtype = spec
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def _augment_task(image_spec, label_spec, affine, header, image_path, label_path, selected, seed):
+    """进程池中执行的单次增强任务，从共享内存读取病例数据"""
+    handles = []
+    try:
+        shm, image = _attach(image_spec)
+        handles.append(shm)
+        label = None
+        if label_spec is not None:
+            shm, label = _attach(label_spec)
+            handles.append(shm)
+
+        image, label = Augmenter(selected).augment(image, label, np.random.default_rng(seed))
+        data_loader = DataLoader(chunk_cache=False)
+        # 各进程已并行，压缩时不再开线程
+        if not data_loader.save_nifti(image, affine, header, image_path, max_workers=1):
+            raise IOError(f'保存文件失败: {image_path}')
+        if label is not None and not data_loader.save_nifti(label, affine, header, label_path,
+                                                            mask=True, max_workers=1):
+            raise IOError(f'保存文件失败: {label_path}')
+        return image_path
+    finally:
+        for shm in handles:
+            shm.close()
+
+
+def _share(array):
+    """将数组复制到共享内存"""
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+    return shm, (shm.name, array.shape, array.dtype.str)
+
+
+def find_training_cases(dataset_dir, include_augmented=False):
+    """
+    查找nnUNet原始数据集中的训练病例
+
+    Args:
+        dataset_dir: nnUNet_raw下的数据集目录
+        include_augmented: 是否包含已生成的增强病例
+
+    Returns:
+        cases: (病例名, 图像路径, 标签路径或None)列表
+    """
+    cases = []
+    for image_path in sorted(glob.glob(os.path.join(dataset_dir, 'imagesTr', '*_0000.nii*'))):
+        file_name = os.path.basename(image_path)
+        case_name = file_name[:file_name.index('_0000.nii')]
+        if '_aug' in case_name and not include_augmented:
+            continue
+        extension = file_name[file_name.index('.nii'):]
+        label_path = os.path.join(dataset_dir, 'labelsTr', case_name + extension)
+        cases.append((case_name, image_path, label_path if os.path.exists(label_path) else None))
+    return cases
+
+
+def augment_dataset(dataset_dir, selected, copies=1, max_workers=None, seed=None,
+                    progress_callback=None, cancel_check=None, max_cases_in_flight=2):
+    """
+    为nnUNet原始数据集生成增强病例，写入imagesTr和labelsTr
+
+    主进程读取病例并放入共享内存，多个工作进程直接读取共享内存生成不同的增强副本，
+    不需要在进程间复制体数据
+
+    Args:
+        dataset_dir: nnUNet_raw下的数据集目录
+        selected: 选中的增强方法键名列表
+        copies: 每个病例生成的增强副本数
+        max_workers: 进程数，默认为CPU核数
+        seed: 随机种子
+        progress_callback: 进度回调，参数为(已完成数, 总数)
+        cancel_check: 返回True时停止提交新任务
+        max_cases_in_flight: 同时放在共享内存中的病例数
+
+    Returns:
+        written: 生成的图像文件路径列表
+    """
+    Augmenter(selected)  # 提前检查增强方法
+    cases = find_training_cases(dataset_dir)
+    total = len(cases) * copies
+    seeds = np.random.SeedSequence(seed).spawn(max(total, 1))
+    data_loader = DataLoader(chunk_cache=False)
+    written = []
+    in_flight = {}
+    shared = {}
+
+    def collect(done):
+        for future in done:
+            case_name = in_flight.pop(future)
+            written.append(future.result())
+            shared[case_name][1] -= 1
+            if shared[case_name][1] == 0:
+                # 该病例的所有副本都已完成，释放共享内存
+                for shm in shared.pop(case_name)[0]:
+                    shm.close()
+                    shm.unlink()
+            if progress_callback is not None:
+                progress_callback(len(written), total)
+
+    # 界面进程中有Qt事件循环和多个后台线程，fork可能使子进程死锁，改用spawn启动
+    with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count() or 1,
+                             mp_context=multiprocessing.get_context('spawn')) as executor:
+        try:
+            task_index = 0
+            for case_name, image_path, label_path in cases:
+                if cancel_check is not None and cancel_check():
+                    break
+                # 限制共享内存中的病例数
+                while len(shared) >= max_cases_in_flight:
+                    collect(wait(in_flight, return_when=FIRST_COMPLETED).done)
+
+                image, affine, header = data_loader.load_nifti(image_path, use_cache=False)
+                if image is None:
+                    raise IOError(f'无法加载文件: {image_path}')
+                image_shm, image_spec = _share(image)
+                handles, label_spec = [image_shm], None
+                if label_path is not None:
+                    label, _, _ = data_loader.load_nifti(label_path, data_kind='mask', use_cache=False)
+                    if label is None:
+                        raise IOError(f'无法加载文件: {label_path}')
+                    label_shm, label_spec = _share(label)
+                    handles.append(label_shm)
+                shared[case_name] = [handles, copies]
+
+                extension = os.path.basename(image_path)[os.path.basename(image_path).index('.nii'):]
+                for k in range(copies):
+                    aug_name = f'{case_name}_aug{k + 1}'
+                    out_image = os.path.join(dataset_dir, 'imagesTr', f'{aug_name}_0000{extension}')
+                    out_label = os.path.join(dataset_dir, 'labelsTr', f'{aug_name}{extension}')
+                    future = executor.submit(
+                        _augment_task, image_spec, label_spec, affine, header,
+                        out_image, out_label, sorted(selected), seeds[task_index]
+                    )
+                    in_flight[future] = case_name
+                    task_index += 1
+
+            while in_flight:
+                collect(wait(in_flight, return_when=FIRST_COMPLETED).done)
+        finally:
+            for future in in_flight:
+                future.cancel()
+            executor.shutdown(wait=True)
+            for handles, _ in shared.values():
+                for shm in handles:
+                    shm.close()
+                    shm.unlink()
+
+    update_training_count(dataset_dir)
+    return written
+
+
+def update_training_count(dataset_dir):
+    """按labelsTr中的文件数更新dataset.json的numTraining"""
+    json_path = os.path.join(dataset_dir, 'dataset.json')
+    if not os.path.exists(json_path):
+        return
+    with open(json_path, 'r', encoding='utf-8') as f:
+        dataset = json.load(f)
+    dataset['numTraining'] = len(glob.glob(os.path.join(dataset_dir, 'labelsTr', '*.nii*')))
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump(dataset, f, indent=4)
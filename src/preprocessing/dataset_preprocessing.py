@@ -0,0 +1,180 @@
+import os
+import json
+import hashlib
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from src.data.data_loader import DataLoader
+from src.preprocessing.preprocessor import Preprocessor
+from src.preprocessing.augmentation import find_training_cases
+
+
+# 预处理结果所在的子目录
+OUTPUT_FOLDER = 'preprocessed'
+
+# 病例完成标记的扩展名
+DONE_EXTENSION = '.done'
+
+
+def params_digest(params):
+    """预处理参数的摘要，参数改变后已完成的病例需要重新处理"""
+    return hashlib.sha1(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def is_case_done(output_dir, case_name, digest):
+    """
+    检查病例是否已用相同参数处理完成
+
+    Args:
+        output_dir: 预处理结果目录
+        case_name: 病例名
+        digest: 预处理参数摘要
+
+    Returns:
+        bool: 是否已完成
+    """
+    marker = os.path.join(output_dir, case_name + DONE_EXTENSION)
+    if not os.path.exists(marker):
+        return False
+    with open(marker, 'r', encoding='utf-8') as f:
+        return f.read().strip() == digest
+
+
+def _write_atomic(path, write):
+    """先写入临时文件再重命名"""
+    fd, temp_path = tempfile.mkstemp(prefix='.tmp_', dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.replace(temp_path, path)
+    except Exception:
+        os.remove(temp_path)
+        raise
+
+
+def preprocess_case(case_name, image_path, label_path, output_dir, params):
+    """
+    预处理单个病例（在工作进程中执行）
+
+    裁剪到前景包围盒，亮度归一化，重采样到目标体素大小，
+    保存为{病例名}.npz（'data'和可选的'seg'）和{病例名}.json，最后写入完成标记
+
+    Args:
+        case_name: 病例名
+        image_path: 图像路径
+        label_path: 标签路径，可以为None
+        output_dir: 预处理结果目录
+        params: 预处理参数字典（normalize_method、target_voxel_size）
+
+    Returns:
+        case_name: 病例名
+    """
+    data_loader = DataLoader(chunk_cache=False)
+    preprocessor = Preprocessor()
+    image, affine, header = data_loader.load_nifti(image_path, use_cache=False)
+    if image is None:
+        raise IOError(f'无法加载文件: {image_path}')
+    label = None
+    if label_path is not None:
+        label, _, _ = data_loader.load_nifti(label_path, data_kind='mask', use_cache=False)
+        if label is None:
+            raise IOError(f'无法加载文件: {label_path}')
+
+    # 头部中的体素大小为(x, y, z)顺序
+    spacing = tuple(float(v) for v in header.get('pixdim')[1:4])[::-1]
+    target = tuple(params['target_voxel_size'] or spacing)
+
+    image, crop_info = preprocessor.crop_to_foreground(image)
+    image = preprocessor.normalize_intensity(image, method=params['normalize_method'])
+    # 保存的仿射变换矩阵对应裁剪和重采样后的体素网格
+    image, new_affine = preprocessor.resample(
+        image, spacing, target, affine=preprocessor.crop_affine(affine, crop_info)
+    )
+    arrays = {'data': image}
+    if label is not None:
+        label, _ = preprocessor.crop_to_foreground(label, bbox=crop_info['bbox'])
+        arrays['seg'] = preprocessor.resample(label, spacing, target, data_kind='mask')
+
+    properties = {
+        'original_shape': list(crop_info['shape']),
+        'crop_bbox': [list(b) for b in crop_info['bbox']],
+        'original_spacing': list(spacing),
+        'target_spacing': list(target),
+        'shape_after_resampling': list(image.shape),
+        'original_affine': np.asarray(affine).tolist(),
+        'affine': np.asarray(new_affine).tolist(),
+    }
+    _write_atomic(os.path.join(output_dir, case_name + '.npz'), lambda f: np.savez(f, **arrays))
+    _write_atomic(os.path.join(output_dir, case_name + '.json'),
+                  lambda f: f.write(json.dumps(properties, indent=4).encode('utf-8')))
+    # 完成标记最后写入，中断后未写标记的病例会重新处理
+    _write_atomic(os.path.join(output_dir, case_name + DONE_EXTENSION),
+                  lambda f: f.write(params_digest(params).encode('utf-8')))
+    return case_name
+
+
+def preprocess_dataset(raw_dataset_dir, output_dir, normalize_method='z-score', target_voxel_size=None,
+                       max_workers=None, progress_callback=None, cancel_check=None):
+    """
+    在进程池中预处理nnUNet原始数据集的所有训练病例
+
+    已有完成标记且参数相同的病例直接跳过，中断后再次运行会从未完成的病例继续
+
+    Args:
+        raw_dataset_dir: nnUNet_raw下的数据集目录
+        output_dir: 预处理结果目录（通常为nnUNet_preprocessed/数据集名/preprocessed）
+        normalize_method: 归一化方法
+        target_voxel_size: 目标体素大小(深度, 高度, 宽度)，为None时保持原始体素大小
+        max_workers: 进程数，默认为CPU核数
+        progress_callback: 进度回调，参数为(已完成数, 总数)
+        cancel_check: 返回True时取消尚未开始的病例
+
+    Returns:
+        processed: 本次处理的病例数
+        skipped: 已完成而跳过的病例数
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    params = {
+        'normalize_method': normalize_method,
+        'target_voxel_size': list(target_voxel_size) if target_voxel_size is not None else None,
+    }
+    digest = params_digest(params)
+    cases = find_training_cases(raw_dataset_dir, include_augmented=True)
+    pending = [case for case in cases if not is_case_done(output_dir, case[0], digest)]
+    total = len(cases)
+    skipped = total - len(pending)
+    done = skipped
+    if progress_callback is not None:
+        progress_callback(done, total)
+    if not pending:
+        return 0, skipped
+
+    processed = 0
+    # 界面进程中有Qt事件循环和多个后台线程，fork可能使子进程死锁，改用spawn启动
+    with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count() or 1,
+                             mp_context=multiprocessing.get_context('spawn')) as executor:
+        futures = [
+            executor.submit(preprocess_case, case_name, image_path, label_path, output_dir, params)
+            for case_name, image_path, label_path in pending
+        ]
+        try:
+            for future in as_completed(futures):
+                if future.cancelled():
+                    continue
+                future.result()
+                processed += 1
+                done += 1
+                if progress_callback is not None:
+                    progress_callback(done, total)
+                if cancel_check is not None and cancel_check():
+                    # 已在运行的病例会完成并写入标记，其余的下次继续
+                    for f in futures:
+                        f.cancel()
+        except Exception:
+            for f in futures:
+                f.cancel()
+            raise
+    return processed, skipped
@@ -0,0 +1,171 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import cv2
+
+
+# 每个线程任务处理的切片数
+SLAB_SLICES = 16
+
+
+def build_luts(hist):
+    """
+    按cv2.equalizeHist的规则为每行直方图计算均衡化查找表
+
+    Args:
+        hist: 形状为(n, 256)的直方图
+
+    Returns:
+        luts: 形状为(n, 256)的查找表，取值0-255
+    """
+    hist = np.asarray(hist, dtype=np.int64)
+    rows = np.arange(hist.shape[0])
+    total = hist.sum(axis=1, keepdims=True)
+    first = np.argmax(hist > 0, axis=1)
+    first_count = hist[rows, first][:, None]
+    cdf = np.cumsum(hist, axis=1)
+    denom = total - first_count
+    scale = 255.0 / np.where(denom > 0, denom, 1)
+    luts = np.clip(np.rint((cdf - first_count) * scale), 0, 255)
+    # 只有一个灰度值的切片映射为该灰度值本身
+    return np.where(denom > 0, luts, first[:, None])
+
+
+def to_codes(slab, low, high):
+    """
+    将数据线性映射到0-255的uint8灰度
+
+    Args:
+        slab: float32数据块
+        low: 最小值（可按切片广播）
+        high: 最大值
+
+    Returns:
+        codes: uint8灰度
+    """
+    return ((slab - low) / (high - low + np.float32(1e-8)) * np.float32(255)).astype(np.uint8)
+
+
+def slice_histograms(codes):
+    """
+    计算每个切片的256级直方图
+
+    Args:
+        codes: 形状为(n, 高度, 宽度)的uint8灰度
+
+    Returns:
+        hist: 形状为(n, 256)的直方图
+    """
+    return np.stack([cv2.calcHist([c], [0], None, [256], [0, 256]).ravel() for c in codes]).astype(np.int64)
+
+
+def slab_ranges(image_data, slab_slices=SLAB_SLICES):
+    """沿深度轴划分任务块"""
+    depth = image_data.shape[0]
+    return [(start, min(start + slab_slices, depth)) for start in range(0, depth, slab_slices)]
+
+
+def run_slabs(func, ranges, max_workers=None):
+    """在线程池中处理各个任务块（numpy和cv2的主要运算释放GIL）"""
+    max_workers = max_workers or os.cpu_count() or 1
+    if len(ranges) <= 1 or max_workers <= 1:
+        return [func(start, stop) for start, stop in ranges]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(lambda r: func(*r), ranges))
+
+
+def equalize_slices(image_data, out=None, max_workers=None):
+    """
+    逐切片直方图均衡化，一个任务块内所有切片的查找表一次向量化计算，再用cv2.LUT映射
+
+    结果与逐切片调用cv2.equalizeHist后再映射回原强度范围一致
+
+    Args:
+        image_data: 形状为(深度, 高度, 宽度)的float32数组
+        out: 输出数组，可以与image_data相同（就地处理）
+        max_workers: 线程数，默认为CPU核数
+
+    Returns:
+        out: 均衡化后的float32数组
+    """
+    if out is None:
+        out = np.empty(image_data.shape, dtype=np.float32)
+
+    def process(start, stop):
+        slab = image_data[start:stop]
+        low = slab.min(axis=(1, 2))
+        high = slab.max(axis=(1, 2))
+        codes = to_codes(slab, low[:, None, None], high[:, None, None])
+        # 查找表直接给出原强度范围内的结果
+        values = build_luts(slice_histograms(codes)) / 255.0 * (high - low)[:, None] + low[:, None]
+        values = values.astype(np.float32)
+        for i in range(stop - start):
+            out[start + i] = cv2.LUT(codes[i], values[i])
+
+    run_slabs(process, slab_ranges(image_data), max_workers)
+    return out
+
+
+def equalize_volume(image_data, out=None, max_workers=None):
+    """
+    三维直方图均衡化，整个体数据共用一个直方图和查找表
+
+    Args:
+        image_data: 形状为(深度, 高度, 宽度)的float32数组
+        out: 输出数组，可以与image_data相同（就地处理）
+        max_workers: 线程数，默认为CPU核数
+
+    Returns:
+        out: 均衡化后的float32数组
+    """
+    if out is None:
+        out = np.empty(image_data.shape, dtype=np.float32)
+    ranges = slab_ranges(image_data)
+    low = np.float32(image_data.min())
+    high = np.float32(image_data.max())
+
+    def histogram(start, stop):
+        return slice_histograms(to_codes(image_data[start:stop], low, high)).sum(axis=0)
+
+    hist = np.sum(run_slabs(histogram, ranges, max_workers), axis=0)
+    values = (build_luts(hist[None])[0] / 255.0 * (high - low) + low).astype(np.float32)
+
+    def apply(start, stop):
+        codes = to_codes(image_data[start:stop], low, high)
+        for i in range(stop - start):
+            out[start + i] = cv2.LUT(codes[i], values)
+
+    run_slabs(apply, ranges, max_workers)
+    return out
+
+
+def clahe_slices(image_data, out=None, clip_limit=2.0, tile_grid_size=(8, 8), max_workers=None):
+    """
+    逐切片限制对比度自适应直方图均衡化（CLAHE）
+
+    Args:
+        image_data: 形状为(深度, 高度, 宽度)的float32数组
+        out: 输出数组，可以与image_data相同（就地处理）
+        clip_limit: 对比度限制
+        tile_grid_size: 分块网格大小
+        max_workers: 线程数，默认为CPU核数
+
+    Returns:
+        out: 均衡化后的float32数组
+    """
+    if out is None:
+        out = np.empty(image_data.shape, dtype=np.float32)
+
+    def process(start, stop):
+        # CLAHE对象不是线程安全的，每个任务单独创建
+        clahe = cv2.createCLAHE(clipLimit=clip_limit, tileGridSize=tile_grid_size)
+        for i in range(start, stop):
+            slice_data = image_data[i]
+            low = slice_data.min()
+            high = slice_data.max()
+            equalized = clahe.apply(to_codes(slice_data, low, high))
+            out[i] = equalized * np.float32((high - low) / 255.0) + low
+
+    run_slabs(process, slab_ranges(image_data), max_workers)
+    return out
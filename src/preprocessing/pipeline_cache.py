@@ -0,0 +1,166 @@
+import os
+import hashlib
+import tempfile
+import threading
+import weakref
+
+import numpy as np
+
+from src.data.lazy_volume import LazyVolume
+from src.data.volume_cache import get_volume_cache
+
+
+# 默认的磁盘缓存目录（只有显式传入cache_dir时才使用磁盘缓存）
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'MySystem', 'preprocessed')
+
+# 计算哈希时每次读取的切片数
+HASH_CHUNK_SLICES = 16
+
+
+class PipelineCache:
+    """预处理结果缓存，内存中与体数据共用缓存预算，可选保存到磁盘"""
+
+    def __init__(self, cache_dir=None, volume_cache=None):
+        """
+        初始化缓存
+
+        Args:
+            cache_dir: 磁盘缓存目录，为None时只缓存在内存中（可使用DEFAULT_CACHE_DIR）
+            volume_cache: 内存缓存，默认为进程内共享的体数据缓存
+        """
+        self.cache_dir = cache_dir
+        self.volume_cache = volume_cache if volume_cache is not None else get_volume_cache()
+        # 只读数组的哈希按对象记录，同一份数据重复预处理时无需再次读取
+        self._hashes = {}
+        self._lock = threading.Lock()
+
+    def volume_hash(self, image_data):
+        """
+        计算体数据内容的哈希
+
+        Args:
+            image_data: 3D体数据（numpy数组、内存映射数组或LazyVolume）
+
+        Returns:
+            digest: 十六进制哈希字符串
+        """
+        if isinstance(image_data, LazyVolume):
+            # 哈希记录在LazyVolume上，重复预处理同一影像时不再读取数据
+            if image_data.digest is None:
+                image_data.digest = self.lazy_volume_hash(image_data)
+            return image_data.digest
+        
+        memoize = isinstance(image_data, np.ndarray) and not image_data.flags.writeable
+        if memoize:
+            with self._lock:
+                entry = self._hashes.get(id(image_data))
+            if entry is not None and entry[0]() is image_data:
+                return entry[1]
+
+        digest = self.content_hash(image_data)
+
+        if memoize:
+            key = id(image_data)
+            ref = weakref.ref(image_data, lambda _, key=key: self._forget(key))
+            with self._lock:
+                self._hashes[key] = (ref, digest)
+        return digest
+
+    def lazy_volume_hash(self, volume):
+        """
+        计算LazyVolume的哈希
+
+        来自文件的体数据按文件身份（路径、大小和修改时间，与ChunkCache.cache_key相同）
+        以及轴顺序、强度缩放和输出类型生成哈希，不读取数据；其他数据按内容计算
+
+        Args:
+            volume: LazyVolume
+
+        Returns:
+            digest: 十六进制哈希字符串
+        """
+        if volume.source_path is None:
+            return self.content_hash(volume)
+        stat = os.stat(volume.source_path)
+        identity = (
+            os.path.abspath(volume.source_path), stat.st_size, stat.st_mtime_ns,
+            volume.axes, volume.slope, volume.inter, str(volume.dtype), tuple(volume.shape)
+        )
+        return hashlib.blake2b(repr(identity).encode('utf-8'), digest_size=16).hexdigest()
+
+    def content_hash(self, image_data):
+        """按内容分块计算哈希"""
+        hasher = hashlib.blake2b(digest_size=16)
+        hasher.update(repr((tuple(image_data.shape), str(image_data.dtype))).encode('utf-8'))
+        for start in range(0, image_data.shape[0], HASH_CHUNK_SLICES):
+            hasher.update(np.ascontiguousarray(image_data[start:start + HASH_CHUNK_SLICES]).data)
+        return hasher.hexdigest()
+
+    def _forget(self, key):
+        with self._lock:
+            self._hashes.pop(key, None)
+
+    def make_key(self, image_data, *params):
+        """
+        生成缓存键
+
+        Args:
+            image_data: 3D体数据
+            params: 预处理参数
+
+        Returns:
+            key: 缓存键
+        """
+        return ('preprocess', self.volume_hash(image_data)) + tuple(params)
+
+    def disk_path(self, key):
+        digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, f'{digest}.npy')
+
+    def get(self, key):
+        """
+        获取缓存的结果，内存中没有时查找磁盘缓存
+
+        Args:
+            key: 缓存键
+
+        Returns:
+            result: 缓存的只读数组，不存在时返回None
+        """
+        result = self.volume_cache.get(key)
+        if result is not None:
+            return result
+        if self.cache_dir is None:
+            return None
+        path = self.disk_path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            # 磁盘缓存以内存映射方式打开，不占用常驻内存
+            result = np.load(path, mmap_mode='r')
+        except Exception as e:
+            print(f"读取预处理缓存时出错: {e}")
+            return None
+        self.volume_cache.put(key, result, 0)
+        return result
+
+    def put(self, key, result):
+        """
+        保存结果，数组设为只读后共享
+
+        Args:
+            key: 缓存键
+            result: 预处理结果数组
+        """
+        result.flags.writeable = False
+        self.volume_cache.put(key, result, result.nbytes)
+        if self.cache_dir is None:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(suffix='.npy', dir=self.cache_dir)
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, result)
+            os.replace(temp_path, self.disk_path(key))
+        except Exception as e:
+            print(f"保存预处理缓存时出错: {e}")
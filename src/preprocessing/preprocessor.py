@@ -1,48 +1,115 @@
+import itertools
 import numpy as np
 import cv2
-from scipy.ndimage import zoom
+from scipy.ndimage import binary_opening
+from src.preprocessing.statistics import compute_statistics, iter_slabs, robust_range
+from src.preprocessing.equalization import equalize_slices, equalize_volume, clahe_slices
+from src.preprocessing.resampling import resample_volume, resample_affine, RESAMPLING_ORDERS
+from src.preprocessing.pipeline_cache import PipelineCache
+from src.preprocessing.slice_sequence import SliceSequence
 
 class Preprocessor:
     """医学图像预处理器"""
     
-    def normalize_intensity(self, image_data, method='z-score'):
+    def __init__(self, cache=None, patch_size=None):
+        """
+        初始化预处理器
+        
+        Args:
+            cache: 预处理结果缓存，默认为只使用内存的PipelineCache
+            patch_size: 默认的块大小，通常从nnUNetPlan.json读取
+        """
+        self.cache = cache if cache is not None else PipelineCache()
+        self.patch_size = tuple(patch_size) if patch_size is not None else None
+    
+    def normalize_intensity(self, image_data, method='z-score', mask=None):
         """
         对医学图像进行亮度归一化
         
         Args:
-            image_data: 3D医学图像数据
-            method: 归一化方法，可选值：'z-score'（z-score归一化）或'histogram'（直方图均衡化）
+            image_data: 3D医学图像数据（numpy数组、内存映射数组或LazyVolume）
+            method: 归一化方法，可选值：'z-score'（z-score归一化）、'percentile'（按0.5/99.5百分位数截断后
+                    z-score归一化，适合存在极端值的SWI相位图）、'histogram'（逐切片直方图均衡化）、
+                    'clahe'（逐切片CLAHE）或'histogram-3d'（三维直方图均衡化）
+            mask: 可选的前景掩码，z-score和percentile归一化时只用掩码内的体素计算统计量
             
         Returns:
-            normalized_data: 归一化后的图像数据
+            normalized_data: 归一化后的float32图像数据
         """
         if method == 'z-score':
-            # z-score归一化
-            mean = np.mean(image_data)
-            std = np.std(image_data)
-            normalized_data = (image_data - mean) / (std + 1e-8)
-        elif method == 'histogram':
-            # 直方图均衡化（对每个切片单独处理）
-            normalized_data = np.zeros_like(image_data)
-            depth, height, width = image_data.shape
-            for i in range(depth):
-                # 获取当前切片
-                slice_data = image_data[i, :, :]
-                # 归一化到0-255范围
-                min_val = np.min(slice_data)
-                max_val = np.max(slice_data)
-                normalized_slice = (slice_data - min_val) / (max_val - min_val + 1e-8)
-                normalized_slice = (normalized_slice * 255).astype(np.uint8)
-                # 应用直方图均衡化
-                equalized_slice = cv2.equalizeHist(normalized_slice)
-                # 转换回原始范围
-                normalized_data[i, :, :] = (equalized_slice / 255.0) * (max_val - min_val) + min_val
+            # 单次分块遍历计算统计量，再逐块归一化，不产生整个体数据大小的float64临时数组
+            stats = compute_statistics(image_data, mask=mask)
+            mean = np.float32(stats.mean)
+            scale = np.float32(1.0 / (stats.std + 1e-8))
+            normalized_data = np.empty(image_data.shape, dtype=np.float32)
+            for start, stop, slab in iter_slabs(image_data):
+                out = normalized_data[start:stop]
+                np.subtract(slab, mean, out=out)
+                out *= scale
+            return normalized_data
+        
+        if method == 'percentile':
+            # 从随机样本估计0.5/99.5百分位数，截断和缩放在同一次分块遍历中完成
+            low, high, mean, std = robust_range(image_data, 0.5, 99.5, mask=mask)
+            low, high, mean = np.float32(low), np.float32(high), np.float32(mean)
+            scale = np.float32(1.0 / (std + 1e-8))
+            normalized_data = np.empty(image_data.shape, dtype=np.float32)
+            for start, stop, slab in iter_slabs(image_data):
+                out = normalized_data[start:stop]
+                np.clip(slab, low, high, out=out)
+                out -= mean
+                out *= scale
+            return normalized_data
+        
+        # 统一使用float32计算，整数图像不再提升为float64
+        image_data = np.asarray(image_data, dtype=np.float32)
+        
+        if method == 'histogram':
+            # 逐切片直方图均衡化（所有切片的查找表批量计算）
+            normalized_data = equalize_slices(image_data)
+        elif method == 'clahe':
+            # 逐切片限制对比度自适应直方图均衡化
+            normalized_data = clahe_slices(image_data)
+        elif method == 'histogram-3d':
+            # 整个体数据共用一个直方图
+            normalized_data = equalize_volume(image_data)
         else:
-            raise ValueError("method必须为'z-score'或'histogram'")
+            raise ValueError("method必须为'z-score'、'percentile'、'histogram'、'clahe'或'histogram-3d'")
         
         return normalized_data
     
-    def resample(self, image_data, original_voxel_size, target_voxel_size):
+    def batch_normalizer(self, image_data, method='z-score', mask=None):
+        """
+        用整个体数据的统计量生成逐批归一化函数，推理时在后台线程中就地归一化每个批次，
+        不生成整个体数据大小的归一化结果
+        
+        Args:
+            image_data: 3D医学图像数据
+            method: 'z-score'或'percentile'
+            mask: 可选的前景掩码
+            
+        Returns:
+            normalize: 就地归一化float32批次的函数
+        """
+        if method == 'z-score':
+            stats = compute_statistics(image_data, mask=mask)
+            low, high, mean, std = None, None, stats.mean, stats.std
+        elif method == 'percentile':
+            low, high, mean, std = robust_range(image_data, 0.5, 99.5, mask=mask)
+        else:
+            raise ValueError("逐批归一化只支持'z-score'或'percentile'")
+        mean = np.float32(mean)
+        scale = np.float32(1.0 / (std + 1e-8))
+        
+        def normalize(batch):
+            if low is not None:
+                np.clip(batch, np.float32(low), np.float32(high), out=batch)
+            batch -= mean
+            batch *= scale
+        return normalize
+    
+    def resample(self, image_data, original_voxel_size, target_voxel_size, data_kind='image', mode=None,
+                 affine=None):
         """
         统一医学图像的空间分辨率
         
@@ -50,73 +117,263 @@ class Preprocessor:
             image_data: 3D医学图像数据
             original_voxel_size: 原始体素大小，形状为(深度, 高度, 宽度)
             target_voxel_size: 目标体素大小，形状为(深度, 高度, 宽度)
+            data_kind: 数据类别，'image'默认使用线性插值，'mask'使用最近邻插值
+            mode: 插值方式，'nearest'、'linear'或'bspline'，为None时按数据类别选择
+            affine: 可选的仿射变换矩阵，给出时同时返回新体素网格的仿射变换矩阵
             
         Returns:
-            resampled_data: 重采样后的图像数据
+            resampled_data: 重采样后的图像数据（插值结果为float32，最近邻保留原类型）
+            new_affine: 给出affine时返回，重采样后的仿射变换矩阵
         """
+        if mode is None:
+            mode = 'nearest' if data_kind == 'mask' else 'linear'
+        if mode not in RESAMPLING_ORDERS:
+            raise ValueError("mode必须为'nearest'、'linear'或'bspline'")
+        
         # 计算缩放因子
         zoom_factors = [orig / target for orig, target in zip(original_voxel_size, target_voxel_size)]
         
-        # 使用双线性插值进行重采样
-        resampled_data = zoom(image_data, zoom_factors, order=1, mode='nearest')
+        # 可分离的一维插值，按块在多个线程中并行
+        resampled_data = resample_volume(image_data, zoom_factors, order=RESAMPLING_ORDERS[mode])
         
+        if affine is not None:
+            return resampled_data, resample_affine(affine, image_data.shape, resampled_data.shape)
         return resampled_data
     
-    def slice_3d_to_2d(self, image_data, axis=0):
+    def compute_foreground_bbox(self, image_data, threshold=None, downsample=4, margin=2):
+        """
+        在降采样的体数据上阈值化，快速估计前景（头部）包围盒
+        
+        Args:
+            image_data: 3D医学图像数据（numpy数组、内存映射数组或LazyVolume）
+            threshold: 前景阈值，为None时使用降采样数据的平均强度
+            downsample: 各轴的降采样步长
+            margin: 包围盒外扩的降采样体素数
+            
+        Returns:
+            bbox: 各轴的(起点, 终点)，没有前景时返回整个视野
+        """
+        shape = image_data.shape
+        # 按步长取样只读取少量体素
+        small = np.asarray(image_data[::downsample, ::downsample, ::downsample], dtype=np.float32)
+        if threshold is None:
+            threshold = float(small.mean())
+        foreground = small > threshold
+        # 去除孤立的噪声点
+        foreground = binary_opening(foreground)
+        if not foreground.any():
+            return tuple((0, n) for n in shape)
+        
+        bbox = []
+        for axis, n in enumerate(shape):
+            other_axes = tuple(i for i in range(3) if i != axis)
+            indices = np.flatnonzero(foreground.any(axis=other_axes))
+            start = max(0, (indices[0] - margin) * downsample)
+            stop = min(n, (indices[-1] + 1 + margin) * downsample)
+            bbox.append((int(start), int(stop)))
+        return tuple(bbox)
+    
+    def crop_to_foreground(self, image_data, bbox=None, **bbox_options):
+        """
+        将体数据裁剪到前景包围盒，后续各阶段只处理包围盒内的体素
+        
+        Args:
+            image_data: 3D医学图像数据
+            bbox: 已知的包围盒，为None时调用compute_foreground_bbox计算
+            bbox_options: 传给compute_foreground_bbox的参数
+            
+        Returns:
+            cropped: 裁剪后的数据（numpy数组输入时为视图）
+            crop_info: 包含'bbox'和原始'shape'的字典，用于还原
+        """
+        if bbox is None:
+            bbox = self.compute_foreground_bbox(image_data, **bbox_options)
+        cropped = image_data[tuple(slice(start, stop) for start, stop in bbox)]
+        crop_info = {'bbox': tuple(bbox), 'shape': tuple(image_data.shape)}
+        return cropped, crop_info
+    
+    def crop_affine(self, affine, crop_info):
+        """
+        计算裁剪后的仿射变换矩阵（原点移到包围盒起点）
+        
+        Args:
+            affine: 原仿射变换矩阵（对应NIFTI的(x, y, z)轴）
+            crop_info: crop_to_foreground返回的裁剪信息
+            
+        Returns:
+            new_affine: 裁剪后的仿射变换矩阵
+        """
+        # 数组轴顺序与NIFTI轴顺序相反
+        starts = [start for start, _ in reversed(crop_info['bbox'])]
+        shift = np.eye(4)
+        shift[:3, 3] = starts
+        return np.asarray(affine, dtype=np.float64) @ shift
+    
+    def uncrop(self, cropped, crop_info, fill_value=0):
+        """
+        将裁剪后的结果放回原始视野
+        
+        Args:
+            cropped: 裁剪区域内的结果
+            crop_info: crop_to_foreground返回的裁剪信息
+            fill_value: 包围盒外的填充值
+            
+        Returns:
+            full: 原始形状的结果
+        """
+        cropped = np.asarray(cropped)
+        full = np.full(crop_info['shape'], fill_value, dtype=cropped.dtype)
+        full[tuple(slice(start, stop) for start, stop in crop_info['bbox'])] = cropped
+        return full
+    
+    def slice_3d_to_2d(self, image_data, axis=0, contiguous=False):
         """
         将3D医学图像切分为2D切片
         
         Args:
             image_data: 3D医学图像数据，形状为(深度, 高度, 宽度)
             axis: 切片轴，0表示深度轴，1表示高度轴，2表示宽度轴
+            contiguous: 是否一次性生成按切片轴重排的连续缓冲区
+            
+        Returns:
+            slices: 按需返回连续切片的SliceSequence，支持len、索引、迭代和批量读取
+        """
+        return SliceSequence(image_data, axis=axis, contiguous=contiguous)
+    
+    def patch_starts(self, shape, patch_size, stride):
+        """
+        计算各轴的滑窗起点，最后一个窗口与边界对齐以覆盖整个体数据
+        
+        Args:
+            shape: 各轴长度
+            patch_size: 各轴的块大小
+            stride: 各轴的步长
             
         Returns:
-            slices: 2D切片列表
-        """
-        slices = []
-        
-        if axis == 0:
-            # 沿深度轴切片
-            depth = image_data.shape[0]
-            for i in range(depth):
-                slices.append(image_data[i, :, :])
-        elif axis == 1:
-            # 沿高度轴切片
-            height = image_data.shape[1]
-            for i in range(height):
-                slices.append(image_data[:, i, :])
-        elif axis == 2:
-            # 沿宽度轴切片
-            width = image_data.shape[2]
-            for i in range(width):
-                slices.append(image_data[:, :, i])
+            starts: 每个轴的起点列表
+        """
+        starts = []
+        for n, p, step in zip(shape, patch_size, stride):
+            axis_starts = list(range(0, max(n - p, 0) + 1, max(step, 1)))
+            if axis_starts[-1] + p < n:
+                axis_starts.append(n - p)
+            starts.append(axis_starts)
+        return starts
+    
+    def extract_patches(self, image_data, patch_size=None, stride=None, batch_size=8,
+                        skip_empty=False, empty_value=None, dtype=np.float32):
+        """
+        按滑窗逐批生成重叠的2D或3D图像块
+        
+        每个块只读取体数据中对应的区域（numpy数组为视图，LazyVolume只读取并转换该区域），
+        在放入批次缓冲区时复制一次；所有批次复用同一个预分配的缓冲区，内存占用与体数据大小无关
+        
+        Args:
+            image_data: 3D医学图像数据（numpy数组、内存映射数组或LazyVolume），形状为(深度, 高度, 宽度)
+            patch_size: 块大小，长度为2时在每个深度切片上取(高, 宽)的2D块，
+                        长度为3时取(深, 高, 宽)的3D块；为None时使用nnUNetPlan中读取的patch_size
+            stride: 各轴步长，默认为块大小的一半
+            batch_size: 每批的块数
+            skip_empty: 是否跳过所有体素都不大于empty_value的块
+            empty_value: 空块的阈值，默认为体数据最小值
+            dtype: 批次缓冲区的数据类型
+            
+        Yields:
+            positions, batch: 每个块在体数据中的起点(z, y, x)列表，以及形状为(n, *patch_size)的批次
+                              （下一次迭代时会被覆盖）
+        """
+        patch_size = tuple(patch_size or self.patch_size or ())
+        if len(patch_size) not in (2, 3):
+            raise ValueError("patch_size的长度必须为2或3")
+        # 2D块等价于深度为1的3D窗口
+        window = patch_size if len(patch_size) == 3 else (1,) + patch_size
+        if stride is None:
+            stride = tuple(max(p // 2, 1) for p in window)
         else:
-            raise ValueError("axis必须为0、1或2")
+            stride = tuple(stride) if len(stride) == 3 else (1,) + tuple(stride)
         
-        return slices
+        # 体数据小于块大小的轴在末尾补边（补体数据最小值），滑窗起点按补边后的形状计算
+        shape = tuple(image_data.shape)
+        padded = tuple(max(n, p) for n, p in zip(shape, window))
+        min_value = None
+        if padded != shape or (skip_empty and empty_value is None):
+            min_value = min(float(slab.min()) for _, _, slab in iter_slabs(image_data))
+        if skip_empty and empty_value is None:
+            empty_value = min_value
+        
+        buffer = np.empty((batch_size,) + window, dtype=dtype)
+        positions = []
+        for z, y, x in itertools.product(*self.patch_starts(padded, window, stride)):
+            patch = image_data[z:z + window[0], y:y + window[1], x:x + window[2]]
+            slot = buffer[len(positions)]
+            if patch.shape != window:
+                slot.fill(min_value)
+                slot[:patch.shape[0], :patch.shape[1], :patch.shape[2]] = patch
+            else:
+                slot[...] = patch
+            if skip_empty and not (slot > empty_value).any():
+                continue
+            positions.append((z, y, x))
+            if len(positions) == batch_size:
+                yield positions, buffer.reshape((batch_size,) + patch_size)
+                positions = []
+        if positions:
+            yield positions, buffer[:len(positions)].reshape((len(positions),) + patch_size)
     
     def preprocess_pipeline(self, image_data, original_voxel_size, target_voxel_size=(1, 1, 1), 
-                           normalize_method='z-score', slice_axis=0):
+                           normalize_method='z-score', slice_axis=0, use_cache=True):
         """
         完整的预处理流程
         
+        z-score归一化是线性变换，与插值可以交换顺序：先分块统计，再对原始数据重采样，
+        最后在重采样结果上就地归一化，不生成原尺寸的归一化中间结果。
+        重采样后的体数据按(内容哈希, 归一化方法, 体素大小)缓存，切片只是其视图
+        
         Args:
             image_data: 3D医学图像数据
             original_voxel_size: 原始体素大小
             target_voxel_size: 目标体素大小
             normalize_method: 归一化方法
             slice_axis: 切片轴
+            use_cache: 是否使用预处理缓存
             
         Returns:
-            slices: 预处理后的2D切片列表
+            slices: 预处理后的2D切片序列（SliceSequence）
         """
-        # 1. 亮度归一化
-        normalized_data = self.normalize_intensity(image_data, method=normalize_method)
+        key = None
+        resampled_data = None
+        if use_cache and self.cache is not None:
+            key = self.cache.make_key(
+                image_data, normalize_method,
+                tuple(float(v) for v in original_voxel_size),
+                tuple(float(v) for v in target_voxel_size)
+            )
+            resampled_data = self.cache.get(key)
         
-        # 2. 空间分辨率统一
-        resampled_data = self.resample(normalized_data, original_voxel_size, target_voxel_size)
+        if resampled_data is None:
+            if normalize_method == 'z-score':
+                # 1. 分块统计强度
+                stats = compute_statistics(image_data)
+                # 2. 空间分辨率统一（float32）
+                resampled_data = self.resample(image_data, original_voxel_size, target_voxel_size)
+                # 3. 在重采样结果上逐块就地归一化
+                mean = np.float32(stats.mean)
+                scale = np.float32(1.0 / (stats.std + 1e-8))
+                for start in range(0, resampled_data.shape[0], 16):
+                    slab = resampled_data[start:start + 16]
+                    slab -= mean
+                    slab *= scale
+            else:
+                # 直方图类方法是非线性的，先归一化再重采样
+                normalized_data = self.normalize_intensity(image_data, method=normalize_method)
+                resampled_data = self.resample(normalized_data, original_voxel_size, target_voxel_size)
+                del normalized_data
+            
+            if key is not None:
+                self.cache.put(key, resampled_data)
         
-        # 3. 二维切分
+        # 4. 二维切分
         slices = self.slice_3d_to_2d(resampled_data, axis=slice_axis)
         
-        return slices
\ No newline at end of file
+        return slices
+
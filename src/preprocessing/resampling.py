@@ -0,0 +1,168 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from scipy.ndimage import spline_filter1d
+
+
+# 插值方式对应的样条阶数
+RESAMPLING_ORDERS = {'nearest': 0, 'linear': 1, 'bspline': 3}
+
+# 每个线程任务处理的切片数
+SLAB_SLICES = 16
+
+
+def output_shape_for(input_shape, zoom_factors):
+    """按缩放因子计算输出形状（与scipy.ndimage.zoom一致）"""
+    return tuple(max(1, int(round(n * f))) for n, f in zip(input_shape, zoom_factors))
+
+
+def source_coordinates(n_in, n_out):
+    """输出网格在输入网格中的坐标，首尾体素中心对齐（与scipy.ndimage.zoom一致）"""
+    if n_out == 1:
+        return np.zeros(1)
+    return np.arange(n_out) * ((n_in - 1) / (n_out - 1))
+
+
+def axis_weights(n_in, n_out, order):
+    """
+    计算一维插值的采样位置和权重
+
+    Args:
+        n_in: 输入长度
+        n_out: 输出长度
+        order: 样条阶数，0、1或3
+
+    Returns:
+        index: 形状为(n_out, taps)的输入位置（已限制在边界内）
+        weights: 形状为(n_out, taps)的float32权重，最近邻插值时为None
+    """
+    x = source_coordinates(n_in, n_out)
+    if order == 0:
+        return np.clip(np.floor(x + 0.5), 0, n_in - 1).astype(np.intp)[:, None], None
+
+    base = np.floor(x)
+    t = x - base
+    if order == 1:
+        offsets = np.arange(2)
+        weights = np.stack([1 - t, t], axis=1)
+    elif order == 3:
+        # 三次B样条基函数
+        offsets = np.arange(-1, 3)
+        weights = np.stack([
+            (1 - t) ** 3 / 6,
+            (3 * t ** 3 - 6 * t ** 2 + 4) / 6,
+            (-3 * t ** 3 + 3 * t ** 2 + 3 * t + 1) / 6,
+            t ** 3 / 6,
+        ], axis=1)
+    else:
+        raise ValueError("order必须为0、1或3")
+    index = np.clip(base[:, None] + offsets[None, :], 0, n_in - 1).astype(np.intp)
+    return index, weights.astype(np.float32)
+
+
+def interpolate_axis(data, axis, index, weights, order):
+    """
+    沿一个轴做一维插值
+
+    Args:
+        data: 输入数据块
+        axis: 插值轴
+        index: axis_weights给出的采样位置
+        weights: axis_weights给出的权重
+        order: 样条阶数，三次B样条先做预滤波
+
+    Returns:
+        result: 插值结果
+    """
+    if weights is None:
+        return np.take(data, index[:, 0], axis=axis)
+    if order == 3:
+        data = spline_filter1d(data, order=3, axis=axis, output=np.float32, mode='nearest')
+    shape = [1] * data.ndim
+    shape[axis] = -1
+    result = np.take(data, index[:, 0], axis=axis)
+    result *= weights[:, 0].reshape(shape)
+    for k in range(1, index.shape[1]):
+        result += np.take(data, index[:, k], axis=axis) * weights[:, k].reshape(shape)
+    return result
+
+
+def run_slabs(func, length, slab_slices, max_workers):
+    """沿某个轴划分任务块并在线程池中处理（numpy和scipy的主要运算释放GIL）"""
+    ranges = [(start, min(start + slab_slices, length)) for start in range(0, length, slab_slices)]
+    if len(ranges) <= 1 or max_workers <= 1:
+        for start, stop in ranges:
+            func(start, stop)
+        return
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(lambda r: func(*r), ranges))
+
+
+def resample_volume(image_data, zoom_factors, order=1, max_workers=None, slab_slices=SLAB_SLICES):
+    """
+    可分离的三维重采样
+
+    先在各切片平面内沿高度和宽度轴插值（按深度分块并行），
+    再沿深度轴插值（按高度分块并行）
+
+    Args:
+        image_data: 形状为(深度, 高度, 宽度)的3D数据
+        zoom_factors: 各轴的缩放因子
+        order: 样条阶数，0（最近邻，保留原数据类型）、1（线性）或3（三次B样条）
+        max_workers: 线程数，默认为CPU核数
+        slab_slices: 每个任务块的切片数
+
+    Returns:
+        resampled: 重采样后的数据，插值时为float32
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    if order == 0:
+        image_data = np.asarray(image_data)
+    else:
+        image_data = np.asarray(image_data, dtype=np.float32)
+    depth, height, width = image_data.shape
+    out_depth, out_height, out_width = output_shape_for(image_data.shape, zoom_factors)
+    tables = [
+        axis_weights(depth, out_depth, order),
+        axis_weights(height, out_height, order),
+        axis_weights(width, out_width, order),
+    ]
+
+    # 第一步：切片平面内插值
+    planar = np.empty((depth, out_height, out_width), dtype=image_data.dtype)
+
+    def resample_planes(start, stop):
+        slab = interpolate_axis(image_data[start:stop], 1, *tables[1], order)
+        planar[start:stop] = interpolate_axis(slab, 2, *tables[2], order)
+
+    run_slabs(resample_planes, depth, slab_slices, max_workers)
+
+    # 第二步：沿深度轴插值
+    resampled = np.empty((out_depth, out_height, out_width), dtype=image_data.dtype)
+
+    def resample_depth(start, stop):
+        resampled[:, start:stop] = interpolate_axis(planar[:, start:stop], 0, *tables[0], order)
+
+    run_slabs(resample_depth, out_height, slab_slices, max_workers)
+    return resampled
+
+
+def resample_affine(affine, input_shape, output_shape):
+    """
+    计算重采样后的仿射变换矩阵
+
+    Args:
+        affine: 原仿射变换矩阵（对应NIFTI的(x, y, z)轴）
+        input_shape: 重采样前的形状(深度, 高度, 宽度)
+        output_shape: 重采样后的形状(深度, 高度, 宽度)
+
+    Returns:
+        new_affine: 重采样后的仿射变换矩阵
+    """
+    # 数组轴顺序与NIFTI轴顺序相反
+    steps = [
+        (n_in - 1) / (n_out - 1) if n_out > 1 else 1.0
+        for n_in, n_out in zip(reversed(input_shape), reversed(output_shape))
+    ]
+    return np.asarray(affine, dtype=np.float64) @ np.diag(steps + [1.0])
@@ -0,0 +1,126 @@
+import numpy as np
+
+
+class SliceSequence:
+    """
+    3D体数据沿某个轴的2D切片序列
+
+    按需返回连续存储的切片，不预先生成切片列表；需要反复访问高度轴或宽度轴的切片时，
+    可以一次性生成按切片轴重排的连续缓冲区
+    """
+
+    def __init__(self, volume, axis=0, contiguous=False):
+        """
+        初始化切片序列
+
+        Args:
+            volume: 3D体数据，形状为(深度, 高度, 宽度)
+            axis: 切片轴，0表示深度轴，1表示高度轴，2表示宽度轴
+            contiguous: 是否立即生成重排后的连续缓冲区
+        """
+        if axis not in (0, 1, 2):
+            raise ValueError("axis必须为0、1或2")
+        self.volume = volume
+        self.axis = axis
+        self._buffer = None
+        if contiguous:
+            self.materialize()
+
+    @property
+    def slice_shape(self):
+        return tuple(n for i, n in enumerate(self.volume.shape) if i != self.axis)
+
+    @property
+    def shape(self):
+        return (len(self),) + self.slice_shape
+
+    @property
+    def dtype(self):
+        return self.volume.dtype
+
+    def __len__(self):
+        return self.volume.shape[self.axis]
+
+    def _take(self, index):
+        """
+        沿切片轴取一个切片或一段切片，切片轴移到最前面
+
+        直接索引体数据，numpy数组返回视图，LazyVolume只读取并转换对应的部分
+        """
+        if self._buffer is not None:
+            return self._buffer[index]
+        key = [slice(None)] * 3
+        key[self.axis] = index
+        data = self.volume[tuple(key)]
+        if isinstance(index, slice):
+            data = np.moveaxis(data, self.axis, 0)
+        return data
+
+    def materialize(self):
+        """
+        生成按切片轴重排的连续缓冲区（只生成一次）
+
+        Returns:
+            buffer: 形状为(切片数, 高, 宽)的C连续数组
+        """
+        if self._buffer is None:
+            self._buffer = np.ascontiguousarray(np.moveaxis(np.asarray(self.volume), self.axis, 0))
+        return self._buffer
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step == 1:
+                return self.batch(start, stop)
+            return np.ascontiguousarray(self._take(slice(start, stop, step)))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("切片索引超出范围")
+        return np.ascontiguousarray(self._take(index))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield np.ascontiguousarray(self._take(i))
+
+    def batch(self, start, stop, out=None):
+        """
+        获取连续若干个切片
+
+        Args:
+            start: 起始索引
+            stop: 结束索引（不包含）
+            out: 可复用的输出缓冲区，形状至少为(stop - start, 高, 宽)
+
+        Returns:
+            batch: 形状为(stop - start, 高, 宽)的连续数组
+        """
+        view = self._take(slice(start, min(stop, len(self))))
+        if out is None:
+            return np.ascontiguousarray(view)
+        out = out[:len(view)]
+        out[...] = view
+        return out
+
+    def iter_batches(self, batch_size, dtype=None):
+        """
+        按批次遍历切片，所有批次复用同一个缓冲区
+
+        Args:
+            batch_size: 每批的切片数
+            dtype: 输出数据类型，默认与体数据相同
+
+        Yields:
+            start, batch: 批次起始索引和切片数组（下一次迭代时会被覆盖）
+        """
+        buffer = np.empty((min(batch_size, len(self)),) + self.slice_shape, dtype=dtype or self.dtype)
+        for start in range(0, len(self), batch_size):
+            yield start, self.batch(start, min(start + batch_size, len(self)), out=buffer)
+
+    def __array__(self, dtype=None, copy=None):
+        # 需要整个数组时才读取全部体数据
+        if self._buffer is not None:
+            array = self._buffer
+        else:
+            array = np.moveaxis(np.asarray(self.volume), self.axis, 0)
+        return array if dtype is None else array.astype(dtype, copy=False)
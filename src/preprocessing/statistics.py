@@ -0,0 +1,239 @@
+import numpy as np
+
+
+# 每次读取的切片数
+DEFAULT_CHUNK_SLICES = 16
+
+# 直方图的bin数量（必须为偶数，扩展范围时两两合并）
+DEFAULT_BINS = 4096
+
+# 估计百分位数时的随机样本体素数
+DEFAULT_SAMPLE_SIZE = 200000
+
+
+def iter_slabs(image_data, chunk_slices=DEFAULT_CHUNK_SLICES):
+    """
+    沿第一个轴分块读取体数据
+
+    适用于numpy数组、内存映射数组和LazyVolume，每次只有一个块转换为float32；
+    输入已是float32数组时返回的是视图，不能就地修改
+
+    Args:
+        image_data: 3D体数据
+        chunk_slices: 每块的切片数
+
+    Yields:
+        start, stop, slab: 块的切片范围和float32数据
+    """
+    depth = image_data.shape[0]
+    for start in range(0, depth, chunk_slices):
+        stop = min(start + chunk_slices, depth)
+        yield start, stop, np.asarray(image_data[start:stop], dtype=np.float32)
+
+
+class StreamingHistogram:
+    """范围自适应的流式直方图，数据超出当前范围时合并相邻bin使范围加倍"""
+
+    def __init__(self, bins=DEFAULT_BINS):
+        """
+        初始化直方图
+
+        Args:
+            bins: bin数量
+        """
+        if bins % 2:
+            raise ValueError("bins必须为偶数")
+        self.bins = bins
+        self.counts = np.zeros(bins, dtype=np.int64)
+        self.low = None
+        self.width = None
+
+    @property
+    def high(self):
+        return self.low + self.width * self.bins
+
+    @property
+    def bin_edges(self):
+        return self.low + self.width * np.arange(self.bins + 1)
+
+    def update(self, values, vmin=None, vmax=None):
+        """
+        加入一批数据
+
+        Args:
+            values: 一维float32数组
+            vmin: 数据最小值（已知时传入避免重复计算）
+            vmax: 数据最大值
+        """
+        if values.size == 0:
+            return
+        vmin = float(values.min()) if vmin is None else vmin
+        vmax = float(values.max()) if vmax is None else vmax
+        if self.low is None:
+            span = vmax - vmin
+            self.low = vmin
+            self.width = span * (1 + 1e-6) / self.bins if span > 0 else 1.0 / self.bins
+        while vmin < self.low or vmax >= self.high:
+            self._grow(downward=vmin < self.low)
+
+        index = ((values - self.low) / self.width).astype(np.int64)
+        np.clip(index, 0, self.bins - 1, out=index)
+        self.counts += np.bincount(index, minlength=self.bins)
+
+    def _grow(self, downward):
+        """合并相邻的两个bin，向下或向上把范围扩大一倍"""
+        merged = self.counts.reshape(-1, 2).sum(axis=1)
+        empty = np.zeros(self.bins // 2, dtype=np.int64)
+        if downward:
+            self.counts = np.concatenate([empty, merged])
+            self.low -= self.width * self.bins
+        else:
+            self.counts = np.concatenate([merged, empty])
+        self.width *= 2
+
+    def percentile(self, q):
+        """
+        根据直方图估算百分位数（在bin内线性插值，误差不超过一个bin宽度）
+
+        Args:
+            q: 百分位数（0-100），可以是数组
+
+        Returns:
+            value: 估算值
+        """
+        q = np.asarray(q, dtype=np.float64)
+        total = self.counts.sum()
+        if total == 0:
+            return np.full(q.shape, np.nan)
+        cdf = np.cumsum(self.counts)
+        target = q / 100.0 * total
+        index = np.clip(np.searchsorted(cdf, target, side='left'), 0, self.bins - 1)
+        before = np.where(index > 0, cdf[index - 1], 0)
+        fraction = (target - before) / np.maximum(self.counts[index], 1)
+        return self.low + (index + np.clip(fraction, 0, 1)) * self.width
+
+
+class VolumeStatistics:
+    """体数据强度统计量，单次分块遍历同时得到均值、方差、极值和直方图"""
+
+    def __init__(self, bins=DEFAULT_BINS):
+        """
+        初始化统计量
+
+        Args:
+            bins: 直方图的bin数量
+        """
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        self.histogram = StreamingHistogram(bins)
+
+    def update(self, values):
+        """
+        加入一批数据（按Chan等人的并行算法合并Welford统计量）
+
+        Args:
+            values: 一维float32数组
+        """
+        n = values.size
+        if n == 0:
+            return
+        # 块内统计量以float64累加，临时数组只有一个块大小
+        chunk_mean = float(np.mean(values, dtype=np.float64))
+        centered = values.astype(np.float64) - chunk_mean
+        chunk_m2 = float(np.dot(centered, centered))
+        chunk_min = float(values.min())
+        chunk_max = float(values.max())
+
+        total = self.count + n
+        delta = chunk_mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += chunk_m2 + delta * delta * self.count * n / total
+        self.count = total
+        self.min = min(self.min, chunk_min)
+        self.max = max(self.max, chunk_max)
+        self.histogram.update(values, chunk_min, chunk_max)
+
+    @property
+    def variance(self):
+        return self.m2 / self.count if self.count else 0.0
+
+    @property
+    def std(self):
+        return float(np.sqrt(self.variance))
+
+    def percentile(self, q):
+        """
+        估算百分位数
+
+        Args:
+            q: 百分位数（0-100）
+
+        Returns:
+            value: 估算值，限制在实际最小值和最大值之间
+        """
+        return np.clip(self.histogram.percentile(q), self.min, self.max)
+
+
+def compute_statistics(image_data, mask=None, bins=DEFAULT_BINS, chunk_slices=DEFAULT_CHUNK_SLICES):
+    """
+    单次分块遍历计算体数据的强度统计量
+
+    Args:
+        image_data: 3D体数据（numpy数组、内存映射数组或LazyVolume）
+        mask: 可选的前景掩码，与image_data形状相同，只统计掩码内的体素
+        bins: 直方图的bin数量
+        chunk_slices: 每块的切片数
+
+    Returns:
+        stats: VolumeStatistics实例
+    """
+    stats = VolumeStatistics(bins)
+    for start, stop, slab in iter_slabs(image_data, chunk_slices):
+        if mask is not None:
+            values = slab[np.asarray(mask[start:stop]) > 0]
+        else:
+            values = slab.ravel()
+        stats.update(values)
+    return stats
+
+
+def robust_range(image_data, lower=0.5, upper=99.5, sample_size=DEFAULT_SAMPLE_SIZE, mask=None, seed=0):
+    """
+    从固定数量的随机体素样本估计百分位截断范围以及截断后的均值和标准差，不对整个体数据排序
+
+    numpy数组直接按随机下标取样；其他体数据（如LazyVolume）分块读取时按块大小比例取样。
+    种子固定，结果可复现
+
+    Args:
+        image_data: 3D体数据
+        lower: 下百分位数
+        upper: 上百分位数
+        sample_size: 随机样本的体素数
+        mask: 可选的前景掩码，只使用掩码内的体素
+        seed: 随机种子
+
+    Returns:
+        low, high: 截断范围
+        mean, std: 截断后的均值和标准差
+    """
+    rng = np.random.default_rng(seed)
+    if isinstance(image_data, np.ndarray) and mask is None:
+        indices = rng.integers(0, image_data.size, min(sample_size, image_data.size))
+        # 按多维索引取样，转置视图不会为展平而复制整个体数据
+        sample = image_data[np.unravel_index(indices, image_data.shape)].astype(np.float32)
+    else:
+        fraction = min(1.0, sample_size / max(int(np.prod(image_data.shape)), 1))
+        parts = []
+        for start, stop, slab in iter_slabs(image_data):
+            values = slab[np.asarray(mask[start:stop]) > 0] if mask is not None else slab.reshape(-1)
+            count = int(np.ceil(values.size * fraction))
+            if count:
+                parts.append(values[rng.integers(0, values.size, count)])
+        sample = np.concatenate(parts) if parts else np.zeros(1, dtype=np.float32)
+
+    low, high = np.percentile(sample, [lower, upper])
+    np.clip(sample, low, high, out=sample)
+    return float(low), float(high), float(sample.mean(dtype=np.float64)), float(sample.std(dtype=np.float64))
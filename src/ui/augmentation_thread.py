@@ -0,0 +1,51 @@
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from src.preprocessing.augmentation import augment_dataset
+
+
+class AugmentationThread(QThread):
+    """数据增强线程，在后台调度进程池为nnUNet数据集生成增强病例"""
+
+    # 信号定义
+    progress_updated = pyqtSignal(int)
+    status_updated = pyqtSignal(str)
+    augmentation_completed = pyqtSignal(int)
+    error_occurred = pyqtSignal(str)
+
+    def __init__(self, dataset_dir, selected, copies=1, max_workers=None):
+        """
+        初始化数据增强线程
+
+        Args:
+            dataset_dir: nnUNet_raw下的数据集目录
+            selected: 选中的增强方法键名列表
+            copies: 每个病例生成的增强副本数
+            max_workers: 进程数，默认为CPU核数
+        """
+        super().__init__()
+        self.dataset_dir = dataset_dir
+        self.selected = list(selected)
+        self.copies = copies
+        self.max_workers = max_workers
+        self._cancelled = False
+
+    def cancel(self):
+        """停止提交新的增强任务"""
+        self._cancelled = True
+
+    def on_progress(self, done, total):
+        self.progress_updated.emit(int(100 * done / total) if total else 100)
+        self.status_updated.emit(f'已完成 {done}/{total}')
+
+    def run(self):
+        try:
+            written = augment_dataset(
+                self.dataset_dir, self.selected, copies=self.copies,
+                max_workers=self.max_workers,
+                progress_callback=self.on_progress,
+                cancel_check=lambda: self._cancelled
+            )
+            self.progress_updated.emit(100)
+            self.augmentation_completed.emit(len(written))
+        except Exception as e:
+            self.error_occurred.emit(str(e))
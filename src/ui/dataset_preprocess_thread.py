@@ -0,0 +1,55 @@
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from src.preprocessing.dataset_preprocessing import preprocess_dataset
+
+
+class DatasetPreprocessThread(QThread):
+    """数据集预处理线程，在后台调度进程池处理nnUNet原始数据集"""
+
+    # 信号定义
+    progress_updated = pyqtSignal(int)
+    status_updated = pyqtSignal(str)
+    preprocessing_completed = pyqtSignal(int, int)
+    error_occurred = pyqtSignal(str)
+
+    def __init__(self, raw_dataset_dir, output_dir, normalize_method='z-score',
+                 target_voxel_size=None, max_workers=None):
+        """
+        初始化数据集预处理线程
+
+        Args:
+            raw_dataset_dir: nnUNet_raw下的数据集目录
+            output_dir: 预处理结果目录
+            normalize_method: 归一化方法
+            target_voxel_size: 目标体素大小，为None时保持原始体素大小
+            max_workers: 进程数，默认为CPU核数
+        """
+        super().__init__()
+        self.raw_dataset_dir = raw_dataset_dir
+        self.output_dir = output_dir
+        self.normalize_method = normalize_method
+        self.target_voxel_size = target_voxel_size
+        self.max_workers = max_workers
+        self._cancelled = False
+
+    def cancel(self):
+        """取消尚未开始的病例，正在处理的病例完成后停止"""
+        self._cancelled = True
+
+    def on_progress(self, done, total):
+        self.progress_updated.emit(int(100 * done / total) if total else 100)
+        self.status_updated.emit(f'已完成 {done}/{total} 个病例')
+
+    def run(self):
+        try:
+            processed, skipped = preprocess_dataset(
+                self.raw_dataset_dir, self.output_dir,
+                normalize_method=self.normalize_method,
+                target_voxel_size=self.target_voxel_size,
+                max_workers=self.max_workers,
+                progress_callback=self.on_progress,
+                cancel_check=lambda: self._cancelled
+            )
+            self.preprocessing_completed.emit(processed, skipped)
+        except Exception as e:
+            self.error_occurred.emit(str(e))
@@ -0,0 +1,105 @@
+import numpy as np
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from src.data.lazy_volume import LazyVolume
+from src.data.volume_cache import is_memory_mapped
+
+
+class LoadCancelled(Exception):
+    """加载被用户取消"""
+    pass
+
+
+class VolumeLoadThread(QThread):
+    """体数据加载线程，在后台读取文件，先返回中间切片再完成其余部分"""
+
+    # 信号定义
+    progress_updated = pyqtSignal(int)
+    preview_ready = pyqtSignal(int, int, object)
+    load_completed = pyqtSignal(list)
+    error_occurred = pyqtSignal(str)
+    load_cancelled = pyqtSignal()
+
+    def __init__(self, data_loader, requests, slab_size=16):
+        """
+        初始化加载线程
+
+        Args:
+            data_loader: DataLoader实例
+            requests: 加载请求列表，每项为(文件路径, 数据类别)
+            slab_size: 预读时每次读取的切片数
+        """
+        super().__init__()
+        self.data_loader = data_loader
+        self.requests = list(requests)
+        self.slab_size = slab_size
+        self._cancelled = False
+
+    def cancel(self):
+        """请求取消加载，在下一个检查点生效"""
+        self._cancelled = True
+
+    def check_cancelled(self):
+        if self._cancelled:
+            raise LoadCancelled()
+
+    def emit_progress(self, index, fraction):
+        """按请求序号和当前文件的完成比例汇报总进度"""
+        total = len(self.requests)
+        self.progress_updated.emit(int(100 * (index + fraction) / total))
+
+    def run(self):
+        try:
+            results = []
+            for index, (file_path, data_kind) in enumerate(self.requests):
+                self.check_cancelled()
+                self.emit_progress(index, 0.0)
+
+                # 延迟加载：未压缩文件为内存映射，压缩文件经由分块缓存
+                image_data, affine, header = self.data_loader.load_nifti(
+                    file_path, lazy=True, data_kind=data_kind
+                )
+                if image_data is None:
+                    raise IOError(f'无法加载文件: {file_path}')
+                self.check_cancelled()
+
+                # 先读取中间切片，界面可以立即显示
+                middle = image_data.shape[0] // 2
+                self.preview_ready.emit(index, middle, np.asarray(image_data[middle]))
+                self.emit_progress(index, 0.2)
+
+                # 内存映射文件按块预读其余切片，之后翻页不再等待磁盘
+                self.warm_up(image_data, index)
+
+                results.append((image_data, affine, header))
+                self.emit_progress(index, 1.0)
+
+            self.load_completed.emit(results)
+        except LoadCancelled:
+            self.load_cancelled.emit()
+        except Exception as e:
+            self.error_occurred.emit(str(e))
+
+    def warm_up(self, image_data, index):
+        """
+        预读内存映射体数据的所有切片，使数据进入系统页缓存
+
+        Args:
+            image_data: 延迟加载的体数据
+            index: 请求序号，用于汇报进度
+        """
+        if not isinstance(image_data, LazyVolume) or not isinstance(image_data.source, np.ndarray):
+            return
+        if not is_memory_mapped(image_data.source):
+            return
+
+        source = image_data.source
+        depth_axis = image_data.axes[0]
+        depth = image_data.shape[0]
+        for start in range(0, depth, self.slab_size):
+            self.check_cancelled()
+            # 直接访问底层数组，只触发读盘不做类型转换
+            key = [slice(None)] * source.ndim
+            key[depth_axis] = slice(start, start + self.slab_size)
+            source[tuple(key)].max()
+            self.emit_progress(index, 0.2 + 0.8 * min(start + self.slab_size, depth) / depth)
@@ -1,5 +1,6 @@
 import sys
 import os
+import math
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_agg import FigureCanvasAgg
@@ -11,15 +12,24 @@ from PyQt5.QtWidgets import (
     QAction, QToolBar, QStatusBar, QMessageBox
 )
 from PyQt5.QtGui import QPixmap, QImage, QIcon
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QTimer, QThread
 
 from src.data.data_loader import DataLoader
+from src.data.dataset_index import DatasetIndexer
+from src.data.prefetcher import Prefetcher
+from src.data.mask_store import MaskStore, MASK_EXTENSION
 from src.preprocessing.preprocessor import Preprocessor
+from src.preprocessing.slice_sequence import SliceSequence
+from src.models.model_interface import ModelFactory
+from src.models.model_pool import ModelPool
 from src.visualization.image_display import ImageDisplay
 from src.visualization.evaluation import ResultVisualizer, Evaluator
 from src.postprocessing.second_stage_processor import SecondStageProcessor
 
 from src.ui.prediction_thread import PredictionThread
+from src.ui.load_thread import VolumeLoadThread
+from src.ui.write_thread import NiftiWriteThread
+from src.ui.model_warmup_thread import ModelWarmupThread
 from src.ui.tabs.image_tab import create_image_tab
 from src.ui.tabs.preprocessing_tab import create_preprocessing_tab
 from src.ui.tabs.prediction_tab import create_prediction_tab
@@ -34,12 +44,21 @@ class MainWindow(QMainWindow):
         super().__init__()
         
         # 初始化组件
+        # 界面浏览时压缩文件首次打开后转存为分块缓存，之后只解压访问到的分块
         self.data_loader = DataLoader()
+        # 预读和批量预测每个文件只读取一次，不转存分块缓存（与界面浏览共用体数据缓存）
+        self.batch_data_loader = DataLoader(chunk_cache=False)
+        self.dataset_indexer = DatasetIndexer()
+        self.prefetcher = Prefetcher(self.batch_data_loader)
+        self.write_thread = NiftiWriteThread(self.data_loader)
+        self.write_thread.write_completed.connect(self.on_write_completed)
+        self.write_thread.error_occurred.connect(self.on_write_error)
         self.preprocessor = Preprocessor()
         self.image_display = ImageDisplay()
         self.result_visualizer = ResultVisualizer()
         self.evaluator = Evaluator()
         self.second_stage_processor = SecondStageProcessor()
+        self.model_pool = ModelPool()
         
         # 数据存储
         self.image_data = None
@@ -53,8 +72,40 @@ class MainWindow(QMainWindow):
         # 当前切片索引
         self.current_slice = 0
         
+        # 已被替换但仍在运行的线程，结束后才释放引用
+        self.retired_threads = []
+        
+        # 一阶段批量预测队列
+        self.first_stage_batch_files = []
+        self.first_stage_batch_index = 0
+        self.first_stage_input_path = None
+        
+        # 二阶段批量预测队列
+        self.second_stage_batch_files = []
+        self.second_stage_batch_index = 0
+        self.second_stage_input_path = None
+        
         # 初始化UI
         self.init_ui()
+        
+        # 后台加载并预热当前选中的模型
+        self.start_model_warmup()
+        
+        # 定期释放长时间未使用的模型
+        self.model_evict_timer = QTimer(self)
+        self.model_evict_timer.timeout.connect(self.model_pool.evict_idle)
+        self.model_evict_timer.start(60 * 1000)
+    
+    def start_model_warmup(self):
+        """在后台加载当前选中的一阶段和二阶段模型，并执行一次预热推理"""
+        names = [self.first_stage_combo.currentText(), self.second_stage_combo.currentText()]
+        self.model_warmup_thread = ModelWarmupThread(self.model_pool, names)
+        self.model_warmup_thread.status_updated.connect(self.status_bar.showMessage)
+        self.model_warmup_thread.start()
+    
+    def model_loader(self, name):
+        """返回从模型池获取模型的函数，在预测线程中调用，模型未预热完成时在后台加载，无法加载时由预测线程报告错误"""
+        return lambda: self.model_pool.require(name)
     
     def init_ui(self):
         """初始化UI界面"""
@@ -150,50 +201,137 @@ class MainWindow(QMainWindow):
         )
         
         if file_path:
-            try:
-                self.status_bar.showMessage('加载图像文件中...')
-                
-                # 加载NIFTI文件
-                self.image_data, self.affine, self.header = self.data_loader.load_nifti(file_path)
-                
-                if self.image_data is not None:
-                    # 重置label_data
-                    self.label_data = None
-                    
-                    # 更新图像信息
-                    depth, height, width = self.image_data.shape
-                    self.dim_label.setText(f'{depth} × {height} × {width}')
-                    
-                    voxel_size = self.header.get('pixdim')[1:4] if self.header else (1, 1, 1)
-                    self.voxel_label.setText(f'{voxel_size[0]:.2f} × {voxel_size[1]:.2f} × {voxel_size[2]:.2f}')
-                    
-                    self.file_label.setText(os.path.basename(file_path))
-                    
-                    # 更新切片导航
-                    self.current_slice = 0
-                    self.update_total_slices()
-                    self.slice_label.setText(f'切片: {self.current_slice + 1}/{self.total_slices}')
-                    if hasattr(self, 'vis_slice_label'):
-                        self.vis_slice_label.setText(f'切片: {self.current_slice + 1}/{self.total_slices}')
-                    
-                    # 启用按钮
-                    self.prev_button.setEnabled(True)
-                    self.next_button.setEnabled(True)
-                    if hasattr(self, 'vis_prev_button'):
-                        self.vis_prev_button.setEnabled(True)
-                        self.vis_next_button.setEnabled(True)
-                    
-                    # 显示第一切片
-                    self.update_image_display()
-                    
-                    # 更新按钮显示
-                    self.update_button_display()
-                    
-                    self.status_bar.showMessage('图像文件加载成功')
-                else:
-                    self.status_bar.showMessage('图像文件加载失败')
-            except Exception as e:
-                self.status_bar.showMessage(f'错误: {str(e)}')
+            self.status_bar.showMessage('加载图像文件中...')
+            # 在后台线程加载，先显示中间切片
+            self.start_loading(
+                [(file_path, 'image')],
+                lambda results: self.on_image_loaded(file_path, results[0]),
+                preview_handler=self.on_image_preview
+            )
+    
+    def start_loading(self, requests, completed_handler, preview_handler=None):
+        """
+        启动后台加载线程，正在进行的加载会被取消
+        
+        Args:
+            requests: 加载请求列表，每项为(文件路径, 数据类别)
+            completed_handler: 加载完成后的处理函数，参数为结果列表
+            preview_handler: 中间切片就绪时的处理函数
+        """
+        self.cancel_loading()
+        
+        self.load_thread = VolumeLoadThread(self.data_loader, requests)
+        self.load_thread.progress_updated.connect(self.on_load_progress_updated)
+        self.load_thread.load_completed.connect(completed_handler)
+        self.load_thread.error_occurred.connect(self.on_load_error)
+        self.load_thread.load_cancelled.connect(lambda: self.status_bar.showMessage('加载已取消'))
+        if preview_handler is not None:
+            self.load_thread.preview_ready.connect(preview_handler)
+        self.load_thread.finished.connect(self.on_load_finished)
+        
+        self.cancel_load_button.show()
+        self.load_thread.start()
+    
+    def cancel_loading(self):
+        """取消正在进行的加载"""
+        thread = getattr(self, 'load_thread', None)
+        if thread is not None and thread.isRunning():
+            # 断开完成信号，旧线程的结果不再更新界面
+            for signal in (thread.load_completed, thread.preview_ready):
+                try:
+                    signal.disconnect()
+                except TypeError:
+                    pass
+            thread.cancel()
+            self.retire_thread(thread)
+    
+    def retire_thread(self, thread):
+        """
+        保留即将被替换的线程的引用直到其结束，避免QThread在运行中被回收导致进程中止
+        
+        Args:
+            thread: 旧的QThread
+        """
+        # self.thread未赋值时是QObject.thread方法
+        if not isinstance(thread, QThread) or not thread.isRunning() or thread in self.retired_threads:
+            return
+        self.retired_threads.append(thread)
+        thread.finished.connect(lambda: self.retired_threads.remove(thread) if thread in self.retired_threads else None)
+    
+    def on_load_finished(self):
+        """加载线程结束后隐藏取消按钮"""
+        if not self.load_thread.isRunning():
+            self.cancel_load_button.hide()
+    
+    def on_load_progress_updated(self, value):
+        """更新加载进度"""
+        self.status_bar.showMessage(f'加载文件中... {value}%')
+    
+    def on_load_error(self, error):
+        """加载错误处理"""
+        self.status_bar.showMessage(f'错误: {error}')
+    
+    def on_image_preview(self, index, slice_index, slice_data):
+        """加载过程中先显示中间切片"""
+        normalized_image = self.image_display.normalize_slice(slice_data)
+        height, width = normalized_image.shape
+        q_image = QImage(bytes(normalized_image.data), width, height, width, QImage.Format_Grayscale8)
+        pixmap = QPixmap.fromImage(q_image)
+        self.image_label.setPixmap(pixmap.scaled(400, 400, Qt.KeepAspectRatio, Qt.SmoothTransformation))
+        self.image_display_group.show()
+    
+    def on_image_loaded(self, file_path, result):
+        """图像文件加载完成处理"""
+        try:
+            self.image_data, self.affine, self.header = result
+            
+            # 重置label_data
+            self.label_data = None
+            
+            # 更新图像信息
+            depth, height, width = self.image_data.shape
+            self.dim_label.setText(f'{depth} × {height} × {width}')
+            
+            voxel_size = self.header.get('pixdim')[1:4] if self.header else (1, 1, 1)
+            self.voxel_label.setText(f'{voxel_size[0]:.2f} × {voxel_size[1]:.2f} × {voxel_size[2]:.2f}')
+            
+            self.file_label.setText(os.path.basename(file_path))
+            
+            # 更新切片导航
+            self.current_slice = 0
+            self.update_total_slices()
+            self.slice_label.setText(f'切片: {self.current_slice + 1}/{self.total_slices}')
+            if hasattr(self, 'vis_slice_label'):
+                self.vis_slice_label.setText(f'切片: {self.current_slice + 1}/{self.total_slices}')
+            
+            # 启用按钮
+            self.prev_button.setEnabled(True)
+            self.next_button.setEnabled(True)
+            if hasattr(self, 'vis_prev_button'):
+                self.vis_prev_button.setEnabled(True)
+                self.vis_next_button.setEnabled(True)
+            
+            # 显示第一切片
+            self.update_image_display()
+            
+            # 更新按钮显示
+            self.update_button_display()
+            
+            # 预读同一文件夹中的后续影像
+            self.prefetch_neighbors(file_path)
+            
+            self.status_bar.showMessage('图像文件加载成功')
+        except Exception as e:
+            self.status_bar.showMessage(f'错误: {str(e)}')
+    
+    def prefetch_neighbors(self, file_path):
+        """预读同一文件夹中排在当前文件之后的影像，便于连续浏览"""
+        folder = os.path.dirname(file_path)
+        names = sorted(f for f in os.listdir(folder) if f.endswith(('.nii', '.nii.gz')))
+        name = os.path.basename(file_path)
+        if name in names:
+            next_files = [os.path.join(folder, f) for f in names[names.index(name) + 1:]]
+            self.prefetcher.prefetch(next_files, lazy=True)
     
     def open_label(self):
         """打开标签文件"""
@@ -202,44 +340,43 @@ class MainWindow(QMainWindow):
         )
         
         if file_path:
-            try:
-                self.status_bar.showMessage('加载标签文件中...')
-                
-                # 加载NIFTI文件到临时变量
-                temp_label_data, _, _ = self.data_loader.load_nifti(file_path)
-                
-                # 保存原始label_data
-                original_label_data = getattr(self, 'label_data', None)
-                
-                if temp_label_data is not None:
-                    # 检查尺寸是否匹配
-                    if self.image_data is not None:
-                        image_shape = self.image_data.shape
-                        label_shape = temp_label_data.shape
-                        if image_shape != label_shape:
-                            # 尺寸不匹配，弹出窗口
-                            QMessageBox.warning(
-                                self, '尺寸不匹配', 
-                                f'图像尺寸 ({image_shape}) 与标签尺寸 ({label_shape}) 不匹配，请重新加载标签文件。'
-                            )
-                            # 保持原始label_data不变
-                            return
-                    
-                    # 尺寸匹配，更新label_data
-                    self.label_data = temp_label_data
-                    
-                    self.status_bar.showMessage('标签文件加载成功')
-                    # 更新图像显示
-                    self.update_image_display()
-                    # 如果已经加载了图像，更新可视化显示
-                    if self.image_data is not None and hasattr(self, 'update_visualization'):
-                        self.update_visualization()
-                    # 更新按钮显示
-                    self.update_button_display()
-                else:
-                    self.status_bar.showMessage('标签文件加载失败')
-            except Exception as e:
-                self.status_bar.showMessage(f'错误: {str(e)}')
+            self.status_bar.showMessage('加载标签文件中...')
+            self.start_loading(
+                [(file_path, 'mask')],
+                lambda results: self.on_label_loaded(results[0])
+            )
+    
+    def on_label_loaded(self, result):
+        """标签文件加载完成处理"""
+        try:
+            temp_label_data = result[0]
+            
+            # 检查尺寸是否匹配
+            if self.image_data is not None:
+                image_shape = self.image_data.shape
+                label_shape = temp_label_data.shape
+                if image_shape != label_shape:
+                    # 尺寸不匹配，弹出窗口
+                    QMessageBox.warning(
+                        self, '尺寸不匹配', 
+                        f'图像尺寸 ({image_shape}) 与标签尺寸 ({label_shape}) 不匹配，请重新加载标签文件。'
+                    )
+                    # 保持原始label_data不变
+                    return
+            
+            # 尺寸匹配，更新label_data
+            self.label_data = temp_label_data
+            
+            self.status_bar.showMessage('标签文件加载成功')
+            # 更新图像显示
+            self.update_image_display()
+            # 如果已经加载了图像，更新可视化显示
+            if self.image_data is not None and hasattr(self, 'update_visualization'):
+                self.update_visualization()
+            # 更新按钮显示
+            self.update_button_display()
+        except Exception as e:
+            self.status_bar.showMessage(f'错误: {str(e)}')
     
     def save_file(self):
         """保存结果"""
@@ -272,10 +409,11 @@ class MainWindow(QMainWindow):
                     
                     # 检查文件扩展名
                     if file_path.endswith('.nii') or file_path.endswith('.nii.gz'):
-                        # 保存为NIFTI格式
-                        success = self.data_loader.save_nifti(
-                            self.prediction, self.affine, self.header, file_path
+                        # 预测结果按uint8掩码在后台保存
+                        self.write_thread.enqueue(
+                            self.prediction, self.affine, self.header, file_path, mask=True
                         )
+                        return
                     elif file_path.endswith('.png') or file_path.endswith('.jpg') or file_path.endswith('.jpeg'):
                         # 保存为PNG或JPG格式
                         format = file_path.rsplit('.', 1)[1].lower()
@@ -284,9 +422,10 @@ class MainWindow(QMainWindow):
                         print(f"保存结果: {success}")
                     else:
                         # 默认保存为NIFTI格式
-                        success = self.data_loader.save_nifti(
-                            self.prediction, self.affine, self.header, file_path
+                        self.write_thread.enqueue(
+                            self.prediction, self.affine, self.header, file_path, mask=True
                         )
+                        return
                     
                     if success:
                         self.status_bar.showMessage('文件保存成功')
@@ -605,8 +744,8 @@ class MainWindow(QMainWindow):
                 )
             
             # 获取指定切片
-            if isinstance(image_data, list):
-                # 如果是列表，直接取对应索引的元素
+            if isinstance(image_data, (list, SliceSequence)):
+                # 如果是切片列表或切片序列，直接取对应索引的元素
                 slice_data = image_data[slice_index]
             else:
                 # 否则，使用get_slice方法
@@ -720,17 +859,29 @@ class MainWindow(QMainWindow):
         try:
             self.status_bar.showMessage('执行预处理中...')
             
-            # 获取预处理参数
-            normalize_method = self.normalize_combo.currentText()
-            target_voxel_size = (
-                self.voxel_d.value(),
-                self.voxel_h.value(),
-                self.voxel_w.value()
+            # 获取预处理参数（界面中没有对应控件时使用默认值）
+            normalize_method = (
+                self.normalize_combo.currentText() if hasattr(self, 'normalize_combo') else 'z-score'
             )
+            if hasattr(self, 'voxel_d'):
+                target_voxel_size = (
+                    self.voxel_d.value(),
+                    self.voxel_h.value(),
+                    self.voxel_w.value()
+                )
+            else:
+                target_voxel_size = (1, 1, 1)
             
-            # 执行预处理
+            # 原始体素大小来自头部信息，(x, y, z)顺序转换为(深度, 高度, 宽度)
+            if self.header is not None:
+                original_voxel_size = tuple(float(v) for v in self.header.get('pixdim')[1:4])[::-1]
+            else:
+                original_voxel_size = (1, 1, 1)
+            
+            # 执行预处理（相同数据和参数的结果直接从缓存获取）
             self.preprocessed_data = self.preprocessor.preprocess_pipeline(
                 self.image_data,
+                original_voxel_size,
                 normalize_method=normalize_method,
                 target_voxel_size=target_voxel_size
             )
@@ -791,41 +942,44 @@ class MainWindow(QMainWindow):
             # 处理预测
             if is_single:
                 # 单个文件预测
+                self.first_stage_batch_files = []
                 self.first_stage_prediction_log.append(f'开始处理单个文件: {file_path}')
-                # 这里应该加载文件并进行预测
-                # 为了演示，我们模拟加载文件
-                try:
-                    # 模拟加载文件
-                    import numpy as np
-                    # 创建模拟数据
-                    self.image_data = np.random.rand(64, 256, 256)  # 模拟3D图像数据
-                    self.first_stage_prediction_log.append('文件加载成功')
-                except Exception as e:
-                    self.first_stage_prediction_log.append(f'文件加载错误: {str(e)}')
-                    self.first_stage_predict_status.setText(f'文件加载错误: {str(e)}')
-                    return
             else:
                 # 批量文件夹预测
                 self.first_stage_prediction_log.append(f'开始批量处理文件夹: {file_path}')
-                # 查找文件夹中的SWI影像文件
-                swi_files = []
-                for root, dirs, files in os.walk(file_path):
-                    for file in files:
-                        if file.endswith('.nii') or file.endswith('.nii.gz'):
-                            swi_files.append(os.path.join(root, file))
+                # 查找文件夹中的SWI影像文件（只读取头部并更新文件夹清单）
+                entries, errors = self.dataset_indexer.scan(file_path)
+                swi_files = [os.path.join(file_path, entry['path']) for entry in entries]
+                total_voxels = sum(math.prod(entry['dims']) for entry in entries)
                 
                 self.first_stage_prediction_log.append(f'找到 {len(swi_files)} 个SWI影像文件')
+                for rel_path, message in errors:
+                    self.first_stage_prediction_log.append(f'无法读取，已跳过: {rel_path}: {message}')
+                self.first_stage_prediction_log.append(f'总体素数: {total_voxels / 1e6:.1f}M')
                 
-                # 为了演示，我们使用模拟数据
-                import numpy as np
-                self.image_data = np.random.rand(64, 256, 256)  # 模拟3D图像数据
+                if not swi_files:
+                    self.first_stage_predict_status.setText('文件夹中没有SWI影像文件')
+                    return
+                
+                # 逐个文件预测，预测当前文件时在后台预读后续文件
+                self.first_stage_batch_files = swi_files
+                self.first_stage_batch_index = 0
+                self.start_first_stage_batch_item()
+                return
             
-            # 创建预测线程
+            # 记录输入文件，保存结果时使用其头部信息，二阶段据此确认候选病灶来自同一文件
+            self.first_stage_input_path = file_path
+            self.first_stage_pending_source = self.source_key(file_path)
+            
+            # 创建预测线程，文件在线程中读取，不替换界面中已打开的图像
+            # 上一个预测线程可能仍在发出完成信号（批量预测在完成槽中启动下一个文件）
+            self.retire_thread(getattr(self, 'thread', None))
             self.thread = PredictionThread(
-                None,
-                self.image_data,
+                self.model_loader(first_stage_model),
+                lambda: self.load_prediction_input(file_path),
                 self.preprocessor,
-                None
+                None,
+                **self.first_stage_inference_options()
             )
             
             # 连接信号
@@ -841,6 +995,235 @@ class MainWindow(QMainWindow):
             self.first_stage_prediction_log.append(f'错误: {str(e)}')
             self.status_bar.showMessage(f'预测错误: {str(e)}')
     
+    def first_stage_inference_options(self):
+        """
+        一阶段推理方式：3D模型始终使用滑窗推理，块大小优先取nnUNet计划，否则取模型注册时的默认块大小
+        
+        Returns:
+            options: PredictionThread的mode和patch_size参数
+        """
+        name = self.first_stage_combo.currentText()
+        config = ModelFactory.model_config(name) or {}
+        default_patch = config.get('patch_size')
+        if default_patch is None or len(default_patch) != 3:
+            # 2D模型按切片推理
+            return {'mode': '2d', 'patch_size': None}
+        patch_size = getattr(self.preprocessor, 'patch_size', None)
+        if patch_size is None or len(patch_size) != 3:
+            patch_size = default_patch
+        return {'mode': 'patch', 'patch_size': tuple(patch_size)}
+    
+    def source_key(self, file_path):
+        """标识预测输入文件的键（绝对路径和修改时间），文件被替换后键随之改变"""
+        file_path = os.path.abspath(file_path)
+        try:
+            return (file_path, os.stat(file_path).st_mtime_ns)
+        except OSError:
+            return (file_path, None)
+    
+    def case_name(self, file_path):
+        """输入文件的病例名（去掉NIFTI扩展名），保存的结果文件以其开头"""
+        name = os.path.basename(file_path)
+        for ext in ('.nii.gz', '.nii'):
+            if name.endswith(ext):
+                return name[:-len(ext)]
+        return name
+    
+    def second_stage_candidates(self, file_path):
+        """
+        获取同一输入文件的一阶段预测结果，二阶段只精细分割其中的候选病灶
+        
+        优先使用本次运行中该文件的一阶段预测，否则在一阶段和二阶段的保存目录中查找已保存的结果
+        
+        Args:
+            file_path: 二阶段的输入文件
+            
+        Returns:
+            mask: 一阶段预测掩码，或读取已保存结果的函数（在预测线程中调用），
+                  没有该文件的一阶段结果时返回None
+        """
+        mask = getattr(self, 'first_stage_prediction', None)
+        if mask is not None and getattr(self, 'first_stage_prediction_source', None) == self.source_key(file_path):
+            return mask
+        search_dirs = [getattr(self, 'first_stage_save_dir', None), getattr(self, 'second_stage_save_dir', None)]
+        result_path = self.first_stage_result_path(file_path, search_dirs)
+        if result_path is None:
+            return None
+        return lambda: self.load_first_stage_result(result_path)
+    
+    def first_stage_result_path(self, file_path, search_dirs):
+        """
+        查找输入文件已保存的一阶段预测结果，掩码容器优先于NIFTI文件
+        
+        结果文件必须比输入文件新，且形状与输入文件一致
+        
+        Args:
+            file_path: 输入文件
+            search_dirs: 依次查找的保存目录
+            
+        Returns:
+            result_path: 结果文件路径，没有可用的结果时返回None
+        """
+        _, header = self.data_loader.load_header(file_path)
+        if header is None:
+            return None
+        shape = tuple(int(n) for n in reversed(header.get_data_shape()[:3]))
+        source_mtime = os.path.getmtime(file_path)
+        prefix = f'{self.case_name(file_path)}_first_stage_prediction'
+        for directory in search_dirs:
+            if not directory:
+                continue
+            for ext in (MASK_EXTENSION, '.nii.gz'):
+                result_path = os.path.join(directory, prefix + ext)
+                if not os.path.exists(result_path) or os.path.getmtime(result_path) < source_mtime:
+                    continue
+                try:
+                    if ext == MASK_EXTENSION:
+                        with np.load(result_path) as data:
+                            result_shape = tuple(int(n) for n in data['shape'])
+                    else:
+                        _, result_header = self.data_loader.load_header(result_path)
+                        result_shape = tuple(int(n) for n in reversed(result_header.get_data_shape()[:3]))
+                except Exception as e:
+                    print(f"读取一阶段预测结果时出错 {result_path}: {e}")
+                    continue
+                if result_shape == shape:
+                    return result_path
+        return None
+    
+    def load_first_stage_result(self, result_path):
+        """读取已保存的一阶段预测结果（在预测线程中调用）"""
+        if result_path.endswith(MASK_EXTENSION):
+            return MaskStore.load(result_path).to_array()
+        mask, _, _ = self.batch_data_loader.load_nifti(result_path, data_kind='mask')
+        if mask is None:
+            raise IOError(f'无法加载一阶段预测结果: {result_path}')
+        return mask
+    
+    def start_first_stage_batch_item(self):
+        """开始批量预测队列中的当前文件，并预读其后的文件"""
+        index = self.first_stage_batch_index
+        file_path = self.first_stage_batch_files[index]
+        self.first_stage_prediction_log.append(
+            f'[{index + 1}/{len(self.first_stage_batch_files)}] 处理文件: {os.path.basename(file_path)}'
+        )
+        
+        self.first_stage_input_path = file_path
+        self.first_stage_pending_source = self.source_key(file_path)
+        
+        # 预读后续文件，使IO与当前文件的预测重叠（受体数据缓存的内存预算限制）
+        self.prefetcher.prefetch(self.first_stage_batch_files[index + 1:], lazy=True)
+        
+        # 创建预测线程，文件在线程中读取（已预读时直接从缓存获取）
+        # 上一个预测线程可能仍在发出完成信号（批量预测在完成槽中启动下一个文件）
+        self.retire_thread(getattr(self, 'thread', None))
+        self.thread = PredictionThread(
+            self.model_loader(self.first_stage_combo.currentText()),
+            lambda: self.load_prediction_input(file_path),
+            self.preprocessor,
+            None,
+            **self.first_stage_inference_options()
+        )
+        
+        # 连接信号
+        self.thread.progress_updated.connect(self.on_first_stage_progress_updated)
+        self.thread.prediction_completed.connect(self.on_first_stage_prediction_completed)
+        self.thread.error_occurred.connect(self.on_first_stage_prediction_error)
+        
+        # 启动线程
+        self.thread.start()
+    
+    def load_prediction_input(self, file_path):
+        """读取预测输入数据（在预测线程中调用），延迟加载，推理时按批次读取"""
+        image_data, _, _ = self.prefetcher.get(file_path, lazy=True)
+        if image_data is None:
+            raise IOError(f'无法加载文件: {file_path}')
+        return image_data
+    
+    def advance_first_stage_batch(self):
+        """
+        一阶段批量预测时继续处理下一个文件
+        
+        Returns:
+            bool: 是否已开始下一个文件
+        """
+        if not self.first_stage_batch_files:
+            return False
+        self.first_stage_batch_index += 1
+        if self.first_stage_batch_index < len(self.first_stage_batch_files):
+            self.start_first_stage_batch_item()
+            return True
+        self.first_stage_batch_files = []
+        self.first_stage_prediction_log.append('批量预测全部完成！')
+        return False
+    
+    def start_second_stage_prediction(self, file_path, first_stage_mask):
+        """
+        启动二阶段预测线程
+        
+        Args:
+            file_path: 输入文件
+            first_stage_mask: 一阶段预测掩码或读取掩码的函数
+        """
+        self.second_stage_input_path = file_path
+        
+        # 创建预测线程，文件在线程中读取，不替换界面中已打开的图像
+        # 上一个预测线程可能仍在发出完成信号（批量预测在完成槽中启动下一个文件）
+        self.retire_thread(getattr(self, 'thread', None))
+        self.thread = PredictionThread(
+            self.model_loader(self.second_stage_combo.currentText()),
+            lambda: self.load_prediction_input(file_path),
+            self.preprocessor,
+            self.second_stage_processor,
+            first_stage_mask=first_stage_mask
+        )
+        
+        # 连接信号
+        self.thread.progress_updated.connect(self.on_second_stage_progress_updated)
+        self.thread.prediction_completed.connect(self.on_second_stage_prediction_completed)
+        self.thread.error_occurred.connect(self.on_second_stage_prediction_error)
+        
+        # 启动线程
+        self.thread.start()
+    
+    def start_second_stage_batch_item(self):
+        """
+        开始二阶段批量预测队列中的当前文件，没有一阶段结果的文件记录后跳过
+        
+        Returns:
+            bool: 是否已开始某个文件的预测
+        """
+        files = self.second_stage_batch_files
+        while self.second_stage_batch_index < len(files):
+            index = self.second_stage_batch_index
+            file_path = files[index]
+            self.second_stage_prediction_log.append(
+                f'[{index + 1}/{len(files)}] 处理文件: {os.path.basename(file_path)}'
+            )
+            first_stage_mask = self.second_stage_candidates(file_path)
+            if first_stage_mask is not None:
+                # 预读后续文件，使IO与当前文件的预测重叠
+                self.prefetcher.prefetch(files[index + 1:], lazy=True)
+                self.start_second_stage_prediction(file_path, first_stage_mask)
+                return True
+            self.second_stage_prediction_log.append('没有该文件的一阶段预测结果，已跳过')
+            self.second_stage_batch_index += 1
+        self.second_stage_batch_files = []
+        self.second_stage_prediction_log.append('批量预测全部完成！')
+        return False
+    
+    def advance_second_stage_batch(self):
+        """
+        二阶段批量预测时继续处理下一个文件
+        
+        Returns:
+            bool: 是否已开始下一个文件
+        """
+        if not self.second_stage_batch_files:
+            return False
+        self.second_stage_batch_index += 1
+        return self.start_second_stage_batch_item()
+    
     def run_second_stage_prediction(self):
         """执行二阶段预测"""
         # 获取文件路径
@@ -891,50 +1274,38 @@ class MainWindow(QMainWindow):
             # 处理预测
             if is_single:
                 # 单个文件预测
+                self.second_stage_batch_files = []
                 self.second_stage_prediction_log.append(f'开始处理单个文件: {file_path}')
-                # 这里应该加载文件并进行预测
-                # 为了演示，我们模拟加载文件
-                try:
-                    # 模拟加载文件
-                    import numpy as np
-                    # 创建模拟数据
-                    self.image_data = np.random.rand(64, 256, 256)  # 模拟3D图像数据
-                    self.second_stage_prediction_log.append('文件加载成功')
-                except Exception as e:
-                    self.second_stage_prediction_log.append(f'文件加载错误: {str(e)}')
-                    self.second_stage_predict_status.setText(f'文件加载错误: {str(e)}')
-                    return
             else:
                 # 批量文件夹预测
                 self.second_stage_prediction_log.append(f'开始批量处理文件夹: {file_path}')
-                # 查找文件夹中的SWI影像文件
-                swi_files = []
-                for root, dirs, files in os.walk(file_path):
-                    for file in files:
-                        if file.endswith('.nii') or file.endswith('.nii.gz'):
-                            swi_files.append(os.path.join(root, file))
+                # 查找文件夹中的SWI影像文件（只读取头部并更新文件夹清单）
+                entries, errors = self.dataset_indexer.scan(file_path)
+                swi_files = [os.path.join(file_path, entry['path']) for entry in entries]
+                total_voxels = sum(math.prod(entry['dims']) for entry in entries)
                 
                 self.second_stage_prediction_log.append(f'找到 {len(swi_files)} 个SWI影像文件')
+                for rel_path, message in errors:
+                    self.second_stage_prediction_log.append(f'无法读取，已跳过: {rel_path}: {message}')
+                self.second_stage_prediction_log.append(f'总体素数: {total_voxels / 1e6:.1f}M')
                 
-                # 为了演示，我们使用模拟数据
-                import numpy as np
-                self.image_data = np.random.rand(64, 256, 256)  # 模拟3D图像数据
-            
-            # 创建预测线程
-            self.thread = PredictionThread(
-                None,
-                self.image_data,
-                self.preprocessor,
-                self.second_stage_processor
-            )
+                # 逐个文件预测，没有一阶段结果的文件跳过
+                self.second_stage_batch_files = swi_files
+                self.second_stage_batch_index = 0
+                if not self.start_second_stage_batch_item():
+                    self.second_stage_predict_status.setText('文件夹中没有带一阶段预测结果的SWI影像文件')
+                return
             
-            # 连接信号
-            self.thread.progress_updated.connect(self.on_second_stage_progress_updated)
-            self.thread.prediction_completed.connect(self.on_second_stage_prediction_completed)
-            self.thread.error_occurred.connect(self.on_second_stage_prediction_error)
+            # 二阶段模型只接收候选病灶周围的块，需要同一文件的一阶段结果
+            first_stage_mask = self.second_stage_candidates(file_path)
+            if first_stage_mask is None:
+                message = '没有该文件的一阶段预测结果，请先对同一文件执行一阶段预测'
+                self.second_stage_predict_status.setText(message)
+                self.second_stage_prediction_log.append(f'错误: {message}')
+                self.status_bar.showMessage(message)
+                return
             
-            # 启动线程
-            self.thread.start()
+            self.start_second_stage_prediction(file_path, first_stage_mask)
             
         except Exception as e:
             self.second_stage_predict_status.setText(f'预测错误: {str(e)}')
@@ -952,6 +1323,7 @@ class MainWindow(QMainWindow):
     def on_first_stage_prediction_completed(self, prediction, metrics):
         """一阶段预测完成处理"""
         self.first_stage_prediction = prediction
+        self.first_stage_prediction_source = getattr(self, 'first_stage_pending_source', None)
         self.first_stage_metrics = metrics
         
         # 更新预测状态
@@ -963,7 +1335,13 @@ class MainWindow(QMainWindow):
         
         # 保存预测结果
         if hasattr(self, 'first_stage_save_dir') and self.first_stage_save_dir:
-            self.save_prediction_result(prediction, self.first_stage_save_dir, 'first_stage')
+            # 文件名以病例名开头，二阶段据此查找同一文件的结果；使用预测输入文件的头部信息
+            case_name = self.case_name(self.first_stage_input_path)
+            affine, header = self.data_loader.load_header(self.first_stage_input_path)
+            self.save_prediction_result(
+                prediction, self.first_stage_save_dir, 'first_stage',
+                case_name=case_name, affine=affine, header=header
+            )
         
         # 更新预测日志
         self.first_stage_prediction_log.append('预测完成！')
@@ -977,6 +1355,10 @@ class MainWindow(QMainWindow):
         if hasattr(self, 'update_visualization'):
             self.update_visualization()
         
+        # 批量预测时继续下一个文件
+        if self.advance_first_stage_batch():
+            return
+        
         # 显示状态信息
         self.status_bar.showMessage('一阶段预测完成')
     
@@ -985,6 +1367,9 @@ class MainWindow(QMainWindow):
         self.first_stage_predict_status.setText(f'预测错误: {error}')
         self.first_stage_prediction_log.append(f'错误: {error}')
         self.status_bar.showMessage(f'一阶段预测错误: {error}')
+        
+        # 批量预测时跳过出错的文件
+        self.advance_first_stage_batch()
     
     def on_second_stage_progress_updated(self, value):
         """更新二阶段预测进度条"""
@@ -1004,7 +1389,11 @@ class MainWindow(QMainWindow):
         
         # 保存预测结果
         if hasattr(self, 'second_stage_save_dir') and self.second_stage_save_dir:
-            self.save_prediction_result(prediction, self.second_stage_save_dir, 'second_stage')
+            affine, header = self.data_loader.load_header(self.second_stage_input_path)
+            self.save_prediction_result(
+                prediction, self.second_stage_save_dir, 'second_stage',
+                case_name=self.case_name(self.second_stage_input_path), affine=affine, header=header
+            )
         
         # 更新预测日志
         self.second_stage_prediction_log.append('预测完成！')
@@ -1015,7 +1404,7 @@ class MainWindow(QMainWindow):
             self.second_stage_prediction_log.append(f'特异性: {metrics.get("specificity", 0):.4f}')
         
         # 更新评估指标
-        if hasattr(self, 'dice_label'):
+        if metrics and hasattr(self, 'dice_label'):
             self.dice_label.setText(f'{metrics["dice"]:.4f}')
             self.iou_label.setText(f'{metrics["iou"]:.4f}')
             self.sensitivity_label.setText(f'{metrics["sensitivity"]:.4f}')
@@ -1025,6 +1414,10 @@ class MainWindow(QMainWindow):
         if hasattr(self, 'update_visualization'):
             self.update_visualization()
         
+        # 批量预测时继续下一个文件
+        if self.advance_second_stage_batch():
+            return
+        
         # 显示状态信息
         self.status_bar.showMessage('二阶段预测完成')
     
@@ -1033,6 +1426,9 @@ class MainWindow(QMainWindow):
         self.second_stage_predict_status.setText(f'预测错误: {error}')
         self.second_stage_prediction_log.append(f'错误: {error}')
         self.status_bar.showMessage(f'二阶段预测错误: {error}')
+        
+        # 批量预测时跳过出错的文件
+        self.advance_second_stage_batch()
     
     def save_heatmaps(self, stage_prefix):
         """保存热力图"""
@@ -1067,8 +1463,8 @@ class MainWindow(QMainWindow):
             if hasattr(self, f'{stage_prefix}_prediction_log'):
                 getattr(self, f'{stage_prefix}_prediction_log').append(f'保存热力图: {heatmap_path}')
     
-    def save_prediction_result(self, prediction, save_dir, stage_prefix):
-        """保存预测结果"""
+    def save_prediction_result(self, prediction, save_dir, stage_prefix, case_name=None, affine=None, header=None):
+        """保存预测结果，批量预测时文件名以病例名开头，NIFTI文件在后台线程中写入"""
         import os
         import numpy as np
         from PIL import Image
@@ -1083,25 +1479,55 @@ class MainWindow(QMainWindow):
         if hasattr(self, f'{stage_prefix}_prediction_log'):
             getattr(self, f'{stage_prefix}_prediction_log').append('保存预测结果...')
         
-        # 保存整个预测结果为npy文件
-        npy_path = os.path.join(save_dir, f'{stage_prefix}_prediction.npy')
-        np.save(npy_path, prediction)
+        # 整个预测结果按uint8掩码加入写入队列，下一个文件的预测不必等待压缩完成
+        file_prefix = f'{case_name}_{stage_prefix}' if case_name else stage_prefix
+        nifti_path = os.path.join(save_dir, f'{file_prefix}_prediction.nii.gz')
+        self.write_thread.enqueue(prediction, affine, header, nifti_path, mask=True)
         
         if hasattr(self, f'{stage_prefix}_prediction_log'):
-            getattr(self, f'{stage_prefix}_prediction_log').append(f'保存预测结果: {npy_path}')
+            getattr(self, f'{stage_prefix}_prediction_log').append(f'加入保存队列: {nifti_path}')
+        
+        # 同时保存游程编码的掩码容器，便于归档和传输
+        mask_store = MaskStore.from_array(prediction, affine)
+        mask_path = os.path.join(save_dir, f'{file_prefix}_prediction{MASK_EXTENSION}')
+        mask_store.save(mask_path)
+        
+        if hasattr(self, f'{stage_prefix}_prediction_log'):
+            getattr(self, f'{stage_prefix}_prediction_log').append(
+                f'保存掩码容器: {mask_path}（{len(mask_store.lesions)}个病灶）'
+            )
         
         # 保存中间切片为图像
         mid_slice = prediction.shape[0] // 2
         slice_data = prediction[mid_slice]
         slice_data = (slice_data * 255).astype(np.uint8)
         
-        img_path = os.path.join(save_dir, f'{stage_prefix}_prediction_mid_slice.png')
+        img_path = os.path.join(save_dir, f'{file_prefix}_prediction_mid_slice.png')
         slice_image = Image.fromarray(slice_data, mode='L')
         slice_image.save(img_path)
         
         if hasattr(self, f'{stage_prefix}_prediction_log'):
             getattr(self, f'{stage_prefix}_prediction_log').append(f'保存中间切片: {img_path}')
     
+    def on_write_completed(self, file_path):
+        """后台写入完成处理"""
+        self.status_bar.showMessage(f'已保存: {file_path}')
+    
+    def on_write_error(self, error):
+        """后台写入错误处理"""
+        self.status_bar.showMessage(f'保存错误: {error}')
+    
+    def closeEvent(self, event):
+        """关闭窗口前写完队列中的结果并停止预读"""
+        self.prefetcher.shutdown()
+        self.write_thread.stop()
+        self.model_warmup_thread.requestInterruption()
+        self.model_warmup_thread.wait()
+        for thread in list(self.retired_threads):
+            thread.wait()
+        self.model_pool.clear()
+        super().closeEvent(event)
+    
     def on_prediction_completed(self, prediction, metrics):
         """预测完成处理"""
         self.prediction = prediction
@@ -1112,7 +1538,7 @@ class MainWindow(QMainWindow):
             self.predict_status.setText('预测完成')
         
         # 更新评估指标
-        if hasattr(self, 'dice_label'):
+        if metrics and hasattr(self, 'dice_label'):
             self.dice_label.setText(f'{metrics["dice"]:.4f}')
             self.iou_label.setText(f'{metrics["iou"]:.4f}')
             self.sensitivity_label.setText(f'{metrics["sensitivity"]:.4f}')
@@ -0,0 +1,32 @@
+from PyQt5.QtCore import QThread, pyqtSignal
+
+
+class ModelWarmupThread(QThread):
+    """模型预热线程，在程序启动后于后台加载模型并执行一次预热推理"""
+
+    # 信号定义
+    model_ready = pyqtSignal(str)
+    status_updated = pyqtSignal(str)
+
+    def __init__(self, model_pool, names):
+        """
+        初始化模型预热线程
+
+        Args:
+            model_pool: ModelPool实例
+            names: 需要预热的模型名称列表，按顺序加载
+        """
+        super().__init__()
+        self.model_pool = model_pool
+        self.names = list(names)
+
+    def run(self):
+        for name in self.names:
+            if self.isInterruptionRequested():
+                return
+            try:
+                if self.model_pool.warm_up(name):
+                    self.model_ready.emit(name)
+                    self.status_updated.emit(f'模型已就绪: {name}')
+            except Exception as e:
+                self.status_updated.emit(f'模型预热失败: {name}: {str(e)}')
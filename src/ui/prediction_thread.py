@@ -1,7 +1,8 @@
 import numpy as np
-import time
 from PyQt5.QtCore import QThread, pyqtSignal
 
+from src.models.inference import InferenceEngine, InferenceCancelled
+
 
 class PredictionThread(QThread):
     """预测线程，用于在后台执行模型预测"""
@@ -11,49 +12,127 @@ class PredictionThread(QThread):
     prediction_completed = pyqtSignal(object, dict)
     error_occurred = pyqtSignal(str)
     
-    def __init__(self, model, input_data, preprocessor=None, postprocessor=None):
+    def __init__(self, model, input_data, preprocessor=None, postprocessor=None, batch_size=8, mode='2d',
+                 first_stage_mask=None, patch_size=None):
+        """
+        Args:
+            model: 模型实例，也可以是返回模型实例的函数（在线程中调用，用于从模型池获取，
+                   无法加载时抛出异常）
+            input_data: 输入数据，也可以是返回输入数据的函数（在线程中调用，用于后台加载）
+            preprocessor: 预处理器
+            postprocessor: 后处理器
+            batch_size: 每批推理的切片数或图像块数
+            mode: '2d'按切片推理，'patch'按图像块滑窗推理
+            first_stage_mask: 一阶段预测掩码，给出时二阶段只精细分割其中的候选病灶，
+                              也可以是返回掩码的函数（在线程中调用，用于读取已保存的结果）
+            patch_size: patch模式的块大小，为None时使用preprocessor.patch_size
+        """
         super().__init__()
         self.model = model
         self.input_data = input_data
         self.preprocessor = preprocessor
         self.postprocessor = postprocessor
+        self.batch_size = batch_size
+        self.mode = mode
+        self.first_stage_mask = first_stage_mask
+        self.patch_size = patch_size
+        self._cancelled = False
+    
+    def cancel(self):
+        """在当前批次完成后停止推理"""
+        self._cancelled = True
+    
+    def on_batch_done(self, done, total):
+        # 推理占10%到90%的进度
+        self.progress_updated.emit(10 + int(80 * done / total) if total else 90)
     
     def run(self):
         try:
-            # 模拟预测过程
-            self.progress_updated.emit(20)
+            # 模型为获取函数时在后台线程中获取（可能需要加载）
+            if callable(self.model) and not hasattr(self.model, 'predict'):
+                self.model = self.model()
+            if self.model is None:
+                raise RuntimeError('没有可用的模型，请检查模型文件和onnxruntime是否已安装')
             
-            # 这里应该是实际的模型预测代码
-            # prediction = self.model.predict(self.input_data)
+            # 输入为加载函数时在后台线程中读取数据
+            if callable(self.input_data):
+                self.input_data = self.input_data()
+            if callable(self.first_stage_mask):
+                self.first_stage_mask = self.first_stage_mask()
             
-            # 模拟预测结果
-            time.sleep(2)  # 模拟预测时间
+            # 裁剪到前景包围盒，只对头部区域预测
+            crop_info = None
+            if self.preprocessor is not None and isinstance(self.input_data, np.ndarray) and self.input_data.ndim == 3:
+                self.input_data, crop_info = self.preprocessor.crop_to_foreground(self.input_data)
+                if self.first_stage_mask is not None:
+                    self.first_stage_mask, _ = self.preprocessor.crop_to_foreground(
+                        self.first_stage_mask, bbox=crop_info['bbox']
+                    )
             
-            # 创建模拟预测结果
-            if isinstance(self.input_data, np.ndarray) and self.input_data.ndim == 3:
-                # 如果输入是3D数据，创建相同形状的掩码
-                prediction = np.zeros_like(self.input_data)
-                # 在中间区域添加一些模拟的微出血
-                depth, height, width = prediction.shape
-                center_d = depth // 2
-                center_h = height // 2
-                center_w = width // 2
-                prediction[center_d-5:center_d+5, center_h-10:center_h+10, center_w-10:center_w+10] = 1
+            if self.first_stage_mask is not None:
+                prediction, metrics = self.refine_candidates()
             else:
-                # 其他情况返回空结果
-                prediction = None
+                prediction, metrics = self.predict_volume()
             
-            self.progress_updated.emit(80)
-            
-            # 模拟评估指标
-            metrics = {
-                'dice': 0.85,
-                'iou': 0.75,
-                'sensitivity': 0.90,
-                'specificity': 0.95
-            }
+            # 预测结果放回原始视野
+            if prediction is not None and crop_info is not None:
+                prediction = self.preprocessor.uncrop(prediction, crop_info)
             
             self.progress_updated.emit(100)
             self.prediction_completed.emit(prediction, metrics)
+        except InferenceCancelled:
+            self.error_occurred.emit('预测已取消')
         except Exception as e:
             self.error_occurred.emit(str(e))
+    
+    def predict_volume(self):
+        """
+        用批量推理引擎对输入数据预测
+        
+        Returns:
+            prediction: uint8分割掩码
+            metrics: 评估指标（没有标签时为空）
+        """
+        self.progress_updated.emit(10)
+        # 与训练时一致地做z-score归一化，统计量来自整个体数据，归一化在准备批次时完成
+        preprocess_fn = None
+        if self.preprocessor is not None:
+            preprocess_fn = self.preprocessor.batch_normalizer(self.input_data)
+        engine = InferenceEngine(
+            self.model,
+            batch_size=self.batch_size,
+            mode=self.mode,
+            patch_size=self.patch_size,
+            preprocessor=self.preprocessor,
+            preprocess_fn=preprocess_fn
+        )
+        prediction = engine.run(
+            self.input_data,
+            progress_callback=self.on_batch_done,
+            cancel_check=lambda: self._cancelled,
+            threshold=0.5
+        )
+        return prediction, {}
+    
+    def refine_candidates(self):
+        """
+        二阶段只对一阶段标出的候选病灶推理
+        
+        Returns:
+            prediction: uint8精细分割掩码
+            metrics: 评估指标（没有标签时为空）
+        """
+        self.progress_updated.emit(10)
+        preprocess_fn = None
+        if self.preprocessor is not None:
+            preprocess_fn = self.preprocessor.batch_normalizer(self.input_data)
+        prediction, _ = self.postprocessor.refine_candidates(
+            self.model,
+            self.input_data,
+            self.first_stage_mask,
+            batch_size=self.batch_size,
+            preprocess_fn=preprocess_fn,
+            progress_callback=self.on_batch_done,
+            cancel_check=lambda: self._cancelled
+        )
+        return prediction, {}
@@ -27,6 +27,12 @@ def create_image_tab(parent):
     open_label_button.clicked.connect(parent.open_label)
     button_group.addWidget(open_label_button)
     
+    # 取消加载按钮（加载过程中显示）
+    parent.cancel_load_button = QPushButton('取消加载')
+    parent.cancel_load_button.clicked.connect(parent.cancel_loading)
+    button_group.addWidget(parent.cancel_load_button)
+    parent.cancel_load_button.hide()
+    
     # 保存结果按钮
     parent.save_button = QPushButton('保存结果')
     parent.save_button.clicked.connect(parent.save_file)
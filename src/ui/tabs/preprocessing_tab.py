@@ -229,9 +229,15 @@ def create_execution_section(parent, stage_prefix):
     
     exec_layout = QVBoxLayout(exec_group)
     
+    button_layout = QHBoxLayout()
     exec_btn = QPushButton(f'执行{stage_prefix}预处理')
     exec_btn.clicked.connect(lambda: run_preprocessing(parent, stage_prefix))
-    exec_layout.addWidget(exec_btn)
+    button_layout.addWidget(exec_btn)
+    
+    cancel_btn = QPushButton('取消')
+    cancel_btn.clicked.connect(lambda: cancel_preprocessing(parent, stage_prefix))
+    button_layout.addWidget(cancel_btn)
+    exec_layout.addLayout(button_layout)
     
     setattr(parent, f'{stage_prefix}_progress', QProgressBar())
     progress_bar = getattr(parent, f'{stage_prefix}_progress')
@@ -286,6 +292,9 @@ def read_nnunet_plan(parent, stage_prefix):
                 getattr(parent, f'{stage_prefix}_height').setValue(patch_size[-2])
             if len(patch_size) >= 3 and hasattr(parent, f'{stage_prefix}_depth'):
                 getattr(parent, f'{stage_prefix}_depth').setValue(patch_size[-3])
+            # 预处理器按该块大小提取图像块
+            if hasattr(parent, 'preprocessor'):
+                parent.preprocessor.patch_size = tuple(patch_size)
         
         status_text = getattr(parent, f'{stage_prefix}_status')
         status_text.append(f'成功读取nnUNetPlan.json: {plan_path}')
@@ -332,36 +341,82 @@ def save_nnunet_plan(parent, stage_prefix):
 
 
 def run_preprocessing(parent, stage_prefix):
-    from PyQt5.QtCore import QTimer
+    from src.ui.dataset_preprocess_thread import DatasetPreprocessThread
     
     status_text = getattr(parent, f'{stage_prefix}_status')
     progress_bar = getattr(parent, f'{stage_prefix}_progress')
     
+    raw_path = getattr(parent, f'{stage_prefix}_raw_path').text()
+    dataset_name = getattr(parent, f'{stage_prefix}_dataset_name').text()
+    if not raw_path or not dataset_name:
+        status_text.append('请先设置nnUNet_raw路径和数据集名称')
+        return
+    raw_dataset_dir = os.path.join(raw_path, dataset_name)
+    if not os.path.isdir(os.path.join(raw_dataset_dir, 'imagesTr')):
+        status_text.append(f'未找到训练图像目录: {os.path.join(raw_dataset_dir, "imagesTr")}')
+        return
+    
+    preprocessed_path = getattr(parent, f'{stage_prefix}_preprocessed_path').text()
+    if not preprocessed_path:
+        preprocessed_path = os.path.join(os.path.expanduser('~'), 'nnUNet_preprocessed')
+    output_dir = os.path.join(preprocessed_path, dataset_name, 'preprocessed')
+    
+    thread_attr = f'{stage_prefix}_preprocess_thread'
+    running = getattr(parent, thread_attr, None)
+    if running is not None and running.isRunning():
+        status_text.append(f'{stage_prefix}预处理正在进行中')
+        return
+    
+    # nnUNetPlan.json中有目标体素大小时按其重采样
+    target_voxel_size = None
+    plan_path = os.path.join(raw_dataset_dir, 'nnUNetPlan.json')
+    if os.path.exists(plan_path):
+        try:
+            with open(plan_path, 'r', encoding='utf-8') as f:
+                plan_data = json.load(f)
+            if 'spacing' in plan_data:
+                target_voxel_size = tuple(plan_data['spacing'])
+        except Exception as e:
+            status_text.append(f'读取nnUNetPlan.json失败: {str(e)}')
+    
     status_text.append(f'开始执行{stage_prefix}预处理...')
+    status_text.append(f'输出目录: {output_dir}')
     progress_bar.setValue(0)
     
-    status_text.append(f'{stage_prefix}预处理执行中...')
-    progress_bar.setValue(50)
-    
-    QTimer.singleShot(2000, lambda: finish_preprocessing(parent, stage_prefix))
+    # 在后台线程中调度进程池，已完成的病例会被跳过
+    thread = DatasetPreprocessThread(raw_dataset_dir, output_dir, target_voxel_size=target_voxel_size)
+    thread.progress_updated.connect(progress_bar.setValue)
+    thread.preprocessing_completed.connect(
+        lambda processed, skipped: finish_preprocessing(parent, stage_prefix, processed, skipped)
+    )
+    thread.error_occurred.connect(lambda error: status_text.append(f'{stage_prefix}预处理错误: {error}'))
+    setattr(parent, thread_attr, thread)
+    thread.start()
 
 
-def finish_preprocessing(parent, stage_prefix):
+def cancel_preprocessing(parent, stage_prefix):
+    thread = getattr(parent, f'{stage_prefix}_preprocess_thread', None)
+    if thread is not None and thread.isRunning():
+        thread.cancel()
+        getattr(parent, f'{stage_prefix}_status').append('正在取消，当前病例处理完成后停止...')
+
+
+def finish_preprocessing(parent, stage_prefix, processed, skipped):
     status_text = getattr(parent, f'{stage_prefix}_status')
-    progress_bar = getattr(parent, f'{stage_prefix}_progress')
     
-    progress_bar.setValue(100)
+    status_text.append(f'本次处理{processed}个病例，跳过已完成的{skipped}个病例')
     status_text.append(f'{stage_prefix}预处理完成！')
 
 
 def apply_data_augmentation(parent, stage_prefix):
-    from PyQt5.QtCore import QTimer
+    from src.ui.augmentation_thread import AugmentationThread
     
     aug_status = getattr(parent, f'{stage_prefix}_aug_status')
     aug_progress = getattr(parent, f'{stage_prefix}_aug_progress')
     
     # 检查选中的增强方法
     selected_aug = []
+    selected_keys = []
     aug_list = [
         ('随机旋转', 'random_rotation'),
         ('随机缩放', 'random_scaling'),
@@ -376,22 +431,39 @@ def apply_data_augmentation(parent, stage_prefix):
     for aug_name, aug_key in aug_list:
         if getattr(parent, f'{stage_prefix}_aug_{aug_key}').isChecked():
             selected_aug.append(aug_name)
+            selected_keys.append(aug_key)
     
     if not selected_aug:
         aug_status.append('请至少选择一种数据增强方法')
         return
     
+    # 增强结果写入nnUNet_raw下的数据集目录
+    raw_path = getattr(parent, f'{stage_prefix}_raw_path').text()
+    dataset_name = getattr(parent, f'{stage_prefix}_dataset_name').text()
+    if not raw_path or not dataset_name:
+        aug_status.append('请先设置nnUNet_raw路径和数据集名称')
+        return
+    dataset_dir = os.path.join(raw_path, dataset_name)
+    if not os.path.isdir(os.path.join(dataset_dir, 'imagesTr')):
+        aug_status.append(f'未找到训练图像目录: {os.path.join(dataset_dir, "imagesTr")}')
+        return
+    
+    thread_attr = f'{stage_prefix}_augmentation_thread'
+    running = getattr(parent, thread_attr, None)
+    if running is not None and running.isRunning():
+        aug_status.append('数据增强正在进行中')
+        return
+    
     aug_status.append('开始应用数据增强...')
     aug_status.append(f"选中的增强方法: {', '.join(selected_aug)}")
     aug_progress.setValue(0)
     
-    # 模拟数据增强过程
-    def update_progress():
-        current = aug_progress.value()
-        if current < 100:
-            aug_progress.setValue(current + 10)
-            QTimer.singleShot(200, update_progress)
-        else:
-            aug_status.append('数据增强应用完成！')
-    
-    QTimer.singleShot(500, update_progress)
+    # 在后台线程中调度进程池，保持线程对象的引用
+    thread = AugmentationThread(dataset_dir, selected_keys)
+    thread.progress_updated.connect(aug_progress.setValue)
+    thread.augmentation_completed.connect(
+        lambda count: aug_status.append(f'数据增强应用完成！共生成{count}个增强病例')
+    )
+    thread.error_occurred.connect(lambda error: aug_status.append(f'数据增强错误: {error}'))
+    setattr(parent, thread_attr, thread)
+    thread.start()
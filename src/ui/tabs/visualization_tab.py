@@ -198,21 +198,21 @@ def load_visualization_files(parent):
     if not swi_path or not gt_path or not mask_path:
         return
     
+    # 在后台线程延迟加载三个文件，完成后再更新显示
+    parent.status_bar.showMessage('加载可视化文件中...')
+    parent.start_loading(
+        [(swi_path, 'image'), (gt_path, 'mask'), (mask_path, 'mask')],
+        lambda results: on_visualization_files_loaded(parent, results)
+    )
+
+
+def on_visualization_files_loaded(parent, results):
+    """可视化文件加载完成处理"""
     try:
-        import nibabel as nib
-        import numpy as np
-        
-        # 加载SWI影像
-        swi_img = nib.load(swi_path)
-        parent.vis_image_data = swi_img.get_fdata()
-        
-        # 加载GroundTruth
-        gt_img = nib.load(gt_path)
-        parent.vis_gt_data = gt_img.get_fdata()
-        
-        # 加载预测Mask
-        mask_img = nib.load(mask_path)
-        parent.vis_mask_data = mask_img.get_fdata()
+        # DataLoader返回(深度, 高度, 宽度)，可视化选项卡沿用NIfTI原始的(x, y, z)轴顺序
+        parent.vis_image_data, parent.vis_gt_data, parent.vis_mask_data = [
+            image_data.transpose(2, 1, 0) for image_data, _, _ in results
+        ]
         
         # 更新切片信息
         update_slice_info(parent)
@@ -223,6 +223,7 @@ def load_visualization_files(parent):
         
         # 更新可视化
         parent.update_visualization()
+        parent.status_bar.showMessage('可视化文件加载成功')
         
     except Exception as e:
         print(f'加载文件错误: {str(e)}')
@@ -0,0 +1,68 @@
+import queue
+from PyQt5.QtCore import QThread, pyqtSignal
+
+
+class NiftiWriteThread(QThread):
+    """结果写入线程，按队列顺序在后台保存NIFTI文件，不阻塞界面和后续预测"""
+
+    # 信号定义
+    write_completed = pyqtSignal(str)
+    error_occurred = pyqtSignal(str)
+
+    def __init__(self, data_loader, max_workers=None):
+        """
+        初始化写入线程
+
+        Args:
+            data_loader: DataLoader实例
+            max_workers: 每个文件并行压缩的线程数，默认为CPU核数
+        """
+        super().__init__()
+        self.data_loader = data_loader
+        self.max_workers = max_workers
+        self.queue = queue.Queue()
+
+    def enqueue(self, image_data, affine, header, file_path, mask=False):
+        """
+        加入写入任务，线程未运行时自动启动
+
+        Args:
+            image_data: 要保存的数据，入队后不应再被修改
+            affine: 仿射变换矩阵
+            header: 头部信息
+            file_path: 保存路径
+            mask: 是否按uint8掩码保存
+        """
+        self.queue.put((image_data, affine, header, file_path, mask))
+        if not self.isRunning():
+            self.start()
+
+    def pending(self):
+        """尚未完成的写入任务数"""
+        return self.queue.unfinished_tasks
+
+    def stop(self):
+        """写完队列中剩余的任务后结束线程"""
+        if self.isRunning():
+            self.queue.put(None)
+            self.wait()
+
+    def run(self):
+        while True:
+            job = self.queue.get()
+            try:
+                if job is None:
+                    break
+                image_data, affine, header, file_path, mask = job
+                success = self.data_loader.save_nifti(
+                    image_data, affine, header, file_path,
+                    mask=mask, max_workers=self.max_workers
+                )
+                if success:
+                    self.write_completed.emit(file_path)
+                else:
+                    self.error_occurred.emit(f'保存文件失败: {file_path}')
+            except Exception as e:
+                self.error_occurred.emit(str(e))
+            finally:
+                self.queue.task_done()
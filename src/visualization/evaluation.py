@@ -21,12 +21,12 @@ class Evaluator:
             dice: Dice系数
         """
         # 二值化预测结果
-        prediction_binary = (prediction > threshold).astype(np.float32)
-        ground_truth_binary = (ground_truth > 0).astype(np.float32)
+        prediction_binary = np.asarray(prediction) > threshold
+        ground_truth_binary = np.asarray(ground_truth) > 0
         
         # 计算交集和并集
-        intersection = np.sum(prediction_binary * ground_truth_binary)
-        union = np.sum(prediction_binary) + np.sum(ground_truth_binary)
+        intersection = np.count_nonzero(prediction_binary & ground_truth_binary)
+        union = np.count_nonzero(prediction_binary) + np.count_nonzero(ground_truth_binary)
         
         # 计算Dice系数
         if union == 0:
@@ -48,12 +48,12 @@ class Evaluator:
             iou: IoU值
         """
         # 二值化预测结果
-        prediction_binary = (prediction > threshold).astype(np.float32)
-        ground_truth_binary = (ground_truth > 0).astype(np.float32)
+        prediction_binary = np.asarray(prediction) > threshold
+        ground_truth_binary = np.asarray(ground_truth) > 0
         
         # 计算交集和并集
-        intersection = np.sum(prediction_binary * ground_truth_binary)
-        union = np.sum(np.maximum(prediction_binary, ground_truth_binary))
+        intersection = np.count_nonzero(prediction_binary & ground_truth_binary)
+        union = np.count_nonzero(prediction_binary | ground_truth_binary)
         
         # 计算IoU
         if union == 0:
@@ -75,12 +75,12 @@ class Evaluator:
             sensitivity: 敏感性
         """
         # 二值化预测结果
-        prediction_binary = (prediction > threshold).astype(np.float32)
-        ground_truth_binary = (ground_truth > 0).astype(np.float32)
+        prediction_binary = np.asarray(prediction) > threshold
+        ground_truth_binary = np.asarray(ground_truth) > 0
         
         # 计算真阳性和假阴性
-        true_positive = np.sum(prediction_binary * ground_truth_binary)
-        false_negative = np.sum((1 - prediction_binary) * ground_truth_binary)
+        true_positive = np.count_nonzero(prediction_binary & ground_truth_binary)
+        false_negative = np.count_nonzero(~prediction_binary & ground_truth_binary)
         
         # 计算敏感性
         if true_positive + false_negative == 0:
@@ -102,12 +102,12 @@ class Evaluator:
             specificity: 特异性
         """
         # 二值化预测结果
-        prediction_binary = (prediction > threshold).astype(np.float32)
-        ground_truth_binary = (ground_truth > 0).astype(np.float32)
+        prediction_binary = np.asarray(prediction) > threshold
+        ground_truth_binary = np.asarray(ground_truth) > 0
         
         # 计算真阴性和假阳性
-        true_negative = np.sum((1 - prediction_binary) * (1 - ground_truth_binary))
-        false_positive = np.sum(prediction_binary * (1 - ground_truth_binary))
+        true_negative = np.count_nonzero(~prediction_binary & ~ground_truth_binary)
+        false_positive = np.count_nonzero(prediction_binary & ~ground_truth_binary)
         
         # 计算特异性
         if true_negative + false_positive == 0:
@@ -16,6 +16,9 @@ class ImageDisplay:
         Returns:
             normalized_slice: 归一化后的图像切片
         """
+        # 延迟加载的切片保留磁盘整数类型，先转换为浮点数避免相减溢出
+        slice_data = np.asarray(slice_data, dtype=np.float32)
+        
         if min_val is None:
             min_val = np.min(slice_data)
         if max_val is None:
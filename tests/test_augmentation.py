@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from src.preprocessing.augmentation import Augmenter, SPATIAL_AUGMENTATIONS, INTENSITY_AUGMENTATIONS
+
+
+def make_case():
+    image = np.zeros((8, 40, 40), dtype=np.float32)
+    image[2:6, 12:28, 14:26] = 100.0
+    label = (image > 0).astype(np.uint8)
+    return image, label
+
+
+def test_unknown_method_is_rejected():
+    with pytest.raises(ValueError):
+        Augmenter(['random_rotation', 'sharpen'])
+
+
+def test_no_selection_keeps_data():
+    image, label = make_case()
+    out_image, out_label = Augmenter([]).augment(image, label, np.random.default_rng(0))
+    assert out_image.dtype == np.float32
+    assert np.array_equal(out_image, image)
+    assert np.array_equal(out_label, label)
+
+
+def test_flip_only_flips_arrays():
+    image, label = make_case()
+    image[0, 0, 0] = 1.0
+    augmenter = Augmenter(['random_flip'])
+    out_image, out_label = augmenter.augment(image, label, np.random.default_rng(3))
+    matrix = augmenter.sample_matrix(np.random.default_rng(3))
+    axes = () if matrix is None else tuple(np.flatnonzero(np.diag(matrix) < 0))
+    assert np.array_equal(out_image, np.flip(image, axes))
+    assert np.array_equal(out_label, np.flip(label, axes))
+
+
+def test_spatial_composition_keeps_label_aligned():
+    image, label = make_case()
+    augmenter = Augmenter(list(SPATIAL_AUGMENTATIONS), elastic_magnitude=2.0)
+    out_image, out_label = augmenter.augment(image, label, np.random.default_rng(7))
+    assert out_image.shape == image.shape and out_label.shape == label.shape
+    assert out_label.dtype == np.uint8
+    assert set(np.unique(out_label)) <= {0, 1}
+    assert out_label.any()
+    # 最近邻插值的标签与线性插值的图像使用同一组坐标
+    assert out_image[out_label == 1].mean() > 50.0
+    assert out_image[out_label == 0].mean() < 50.0
+
+
+def test_same_seed_is_deterministic():
+    image, label = make_case()
+    augmenter = Augmenter(list(SPATIAL_AUGMENTATIONS) + list(INTENSITY_AUGMENTATIONS))
+    first = augmenter.augment(image, label, np.random.default_rng(11))
+    second = augmenter.augment(image, label, np.random.default_rng(11))
+    assert np.array_equal(first[0], second[0])
+    assert np.array_equal(first[1], second[1])
+    # 输入不被修改
+    assert np.array_equal(image, make_case()[0])
+
+
+def test_intensity_only_keeps_label():
+    image, label = make_case()
+    out_image, out_label = Augmenter(['brightness', 'contrast', 'gamma']).augment(
+        image, label, np.random.default_rng(5))
+    assert np.array_equal(out_label, label)
+    assert np.isfinite(out_image).all()
+    # 单调的强度变换保持前景比背景亮
+    assert out_image[label == 1].min() > out_image[label == 0].max()
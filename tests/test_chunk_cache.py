@@ -0,0 +1,39 @@
+import os
+import time
+
+import numpy as np
+
+from src.data.chunk_cache import ChunkCache
+from src.data.data_loader import DataLoader
+
+
+def make_source(tmp_path, name):
+    file_path = str(tmp_path / name)
+    with open(file_path, 'wb') as f:
+        f.write(name.encode('utf-8'))
+    return file_path
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = ChunkCache(cache_dir=str(tmp_path / 'cache'), compress_level=0, max_bytes=2500)
+    raw = np.random.randint(0, 255, (10, 10, 10), dtype=np.uint8)
+    first, second, third = (make_source(tmp_path, f'{i}.nii.gz') for i in range(3))
+    cache.store(first, raw)
+    time.sleep(0.01)
+    cache.store(second, raw)
+    time.sleep(0.01)
+    # 最近打开过的条目保留
+    assert cache.open(first) is not None
+    time.sleep(0.01)
+    cache.store(third, raw)
+
+    assert cache.open(second) is None
+    assert cache.open(first) is not None
+    volume = cache.open(third)
+    assert np.array_equal(volume[:, :, :], raw)
+    assert sum(size for _, size, _ in cache.entries()) <= 2500
+
+
+def test_chunk_cache_can_be_disabled():
+    assert DataLoader(chunk_cache=False).chunk_cache is None
+    assert isinstance(DataLoader().chunk_cache, ChunkCache)
@@ -0,0 +1,31 @@
+import os
+
+import numpy as np
+import nibabel as nib
+
+from src.data.dataset_index import DatasetIndexer
+
+
+def test_scan_reports_unreadable_files_and_keeps_manifest_out_of_folder(tmp_path):
+    folder = tmp_path / 'data'
+    folder.mkdir()
+    nib.save(nib.Nifti1Image(np.zeros((4, 5, 6), dtype=np.int16), np.eye(4)), str(folder / 'good.nii'))
+    (folder / 'broken.nii').write_bytes(b'not a nifti file')
+    os.chmod(folder, 0o555)
+    manifest_dir = tmp_path / 'manifests'
+
+    try:
+        indexer = DatasetIndexer(max_workers=2, manifest_dir=str(manifest_dir))
+        entries, errors = indexer.scan(str(folder))
+        assert [entry['path'] for entry in entries] == ['good.nii']
+        assert entries[0]['dims'] == [4, 5, 6]
+        assert [rel_path for rel_path, _ in errors] == ['broken.nii']
+        assert sorted(os.listdir(folder)) == ['broken.nii', 'good.nii']
+        assert os.path.exists(indexer.manifest_path(str(folder)))
+
+        # 再次扫描沿用清单条目，无法读取的文件仍然报告
+        entries, errors = indexer.scan(str(folder))
+        assert [entry['path'] for entry in entries] == ['good.nii']
+        assert [rel_path for rel_path, _ in errors] == ['broken.nii']
+    finally:
+        os.chmod(folder, 0o755)
@@ -0,0 +1,92 @@
+import os
+import json
+
+import numpy as np
+
+from src.data.data_loader import DataLoader
+from src.preprocessing.preprocessor import Preprocessor
+from src.preprocessing.dataset_preprocessing import preprocess_case, preprocess_dataset, DONE_EXTENSION
+
+
+def world(affine, d, h, w):
+    # 数组轴(d, h, w)对应NIFTI轴(z, y, x)
+    return (np.asarray(affine) @ [w, h, d, 1])[:3]
+
+
+def make_dataset(root, cases=('case_001',)):
+    os.makedirs(root / 'imagesTr')
+    os.makedirs(root / 'labelsTr')
+    affine = np.diag([0.5, 0.5, 2.0, 1.0])
+    affine[:3, 3] = [-10.0, 5.0, 30.0]
+    loader = DataLoader(chunk_cache=False)
+    rng = np.random.default_rng(0)
+    for case_name in cases:
+        image = np.zeros((48, 96, 96), dtype=np.float32)
+        image[16:32, 32:64, 36:68] = rng.uniform(50, 150, (16, 32, 32))
+        label = np.zeros(image.shape, dtype=np.uint8)
+        label[20:24, 40:48, 44:52] = 1
+        assert loader.save_nifti(image, affine, None, str(root / 'imagesTr' / f'{case_name}_0000.nii.gz'))
+        assert loader.save_nifti(label, affine, None, str(root / 'labelsTr' / f'{case_name}.nii.gz'), mask=True)
+    with open(root / 'dataset.json', 'w', encoding='utf-8') as f:
+        json.dump({'numTraining': len(cases)}, f)
+    return affine
+
+
+def test_preprocess_case_writes_cropped_arrays_and_affine(tmp_path):
+    raw = tmp_path / 'raw'
+    affine = make_dataset(raw)
+    output_dir = tmp_path / 'out'
+    output_dir.mkdir()
+    params = {'normalize_method': 'z-score', 'target_voxel_size': None}
+    assert preprocess_case('case_001', str(raw / 'imagesTr' / 'case_001_0000.nii.gz'),
+                           str(raw / 'labelsTr' / 'case_001.nii.gz'), str(output_dir), params) == 'case_001'
+
+    arrays = np.load(output_dir / 'case_001.npz')
+    with open(output_dir / 'case_001.json', 'r', encoding='utf-8') as f:
+        properties = json.load(f)
+    data, seg = arrays['data'], arrays['seg']
+    image, _, _ = DataLoader(chunk_cache=False).load_nifti(str(raw / 'imagesTr' / 'case_001_0000.nii.gz'),
+                                                           use_cache=False)
+    bbox = Preprocessor().compute_foreground_bbox(image)
+    assert data.shape == seg.shape == tuple(stop - start for start, stop in bbox)
+    assert data.size < image.size
+    assert properties['original_shape'] == [48, 96, 96]
+    assert properties['crop_bbox'] == [list(b) for b in bbox]
+    assert properties['original_spacing'] == [2.0, 0.5, 0.5]
+    assert properties['shape_after_resampling'] == list(data.shape)
+    assert abs(float(data.mean())) < 1e-3
+    assert int(seg.sum()) == 4 * 8 * 8
+    # 裁剪后的体素(0, 0, 0)与原图包围盒起点位于同一世界坐标
+    assert np.allclose(world(properties['affine'], 0, 0, 0), world(affine, *[start for start, _ in bbox]))
+    assert np.allclose(properties['original_affine'], affine)
+    assert os.path.exists(output_dir / ('case_001' + DONE_EXTENSION))
+
+
+def test_preprocess_case_resamples_to_target_spacing(tmp_path):
+    raw = tmp_path / 'raw'
+    make_dataset(raw)
+    output_dir = tmp_path / 'out'
+    output_dir.mkdir()
+    params = {'normalize_method': 'percentile', 'target_voxel_size': [2.0, 1.0, 1.0]}
+    preprocess_case('case_001', str(raw / 'imagesTr' / 'case_001_0000.nii.gz'),
+                    str(raw / 'labelsTr' / 'case_001.nii.gz'), str(output_dir), params)
+    arrays = np.load(output_dir / 'case_001.npz')
+    with open(output_dir / 'case_001.json', 'r', encoding='utf-8') as f:
+        properties = json.load(f)
+    cropped = [stop - start for start, stop in properties['crop_bbox']]
+    assert arrays['data'].shape == arrays['seg'].shape == (cropped[0], cropped[1] // 2, cropped[2] // 2)
+    assert int(arrays['seg'].sum()) > 0
+    assert np.allclose(np.abs(np.diag(np.asarray(properties['affine'])[:3, :3])), [1.0, 1.0, 2.0], rtol=0.05)
+
+
+def test_preprocess_dataset_skips_finished_cases(tmp_path):
+    raw = tmp_path / 'raw'
+    make_dataset(raw, cases=('case_001', 'case_002'))
+    output_dir = str(tmp_path / 'out')
+    progress = []
+    assert preprocess_dataset(str(raw), output_dir, max_workers=1,
+                              progress_callback=lambda done, total: progress.append((done, total))) == (2, 0)
+    assert progress[-1] == (2, 2)
+    assert preprocess_dataset(str(raw), output_dir, max_workers=1) == (0, 2)
+    # 参数改变后重新处理
+    assert preprocess_dataset(str(raw), output_dir, normalize_method='percentile', max_workers=1) == (2, 0)
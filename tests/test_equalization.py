@@ -0,0 +1,53 @@
+import numpy as np
+import cv2
+
+from src.preprocessing.equalization import (
+    build_luts, clahe_slices, equalize_slices, equalize_volume, to_codes
+)
+
+
+def random_volume(shape=(20, 32, 40), seed=0):
+    return np.random.default_rng(seed).gamma(2.0, 30.0, shape).astype(np.float32)
+
+
+def test_luts_match_cv2_equalize_hist():
+    codes = np.random.default_rng(0).integers(20, 200, (3, 40, 50), dtype=np.uint8)
+    codes[2] = 77
+    hist = np.stack([np.bincount(c.ravel(), minlength=256) for c in codes])
+    luts = build_luts(hist)
+    for c, lut in zip(codes, luts):
+        assert np.array_equal(lut.astype(np.uint8)[c], cv2.equalizeHist(c))
+
+
+def test_equalize_slices_matches_per_slice_reference():
+    volume = random_volume()
+    result = equalize_slices(volume, max_workers=2)
+    for slice_data, equalized in zip(volume, result):
+        low, high = slice_data.min(), slice_data.max()
+        reference = cv2.equalizeHist(to_codes(slice_data, low, high)) / 255.0 * (high - low) + low
+        assert np.allclose(equalized, reference, atol=1e-3)
+
+
+def test_equalize_slices_in_place():
+    volume = random_volume()
+    expected = equalize_slices(volume)
+    assert equalize_slices(volume, out=volume) is volume
+    assert np.allclose(volume, expected)
+
+
+def test_equalize_volume_is_monotonic_and_keeps_range():
+    volume = random_volume()
+    result = equalize_volume(volume, max_workers=2)
+    order = np.argsort(volume, axis=None)
+    assert np.all(np.diff(result.ravel()[order]) >= -1e-4)
+    assert result.min() >= volume.min() - 1e-4 and result.max() <= volume.max() + 1e-3
+
+
+def test_clahe_matches_cv2_per_slice():
+    volume = random_volume((5, 64, 64))
+    result = clahe_slices(volume, clip_limit=2.0, tile_grid_size=(8, 8), max_workers=2)
+    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+    for slice_data, equalized in zip(volume, result):
+        low, high = slice_data.min(), slice_data.max()
+        reference = clahe.apply(to_codes(slice_data, low, high)) * np.float32((high - low) / 255.0) + low
+        assert np.allclose(equalized, reference)
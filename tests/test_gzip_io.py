@@ -0,0 +1,34 @@
+import gzip
+
+import numpy as np
+import nibabel as nib
+
+from src.data.data_loader import DataLoader
+from src.data.gzip_io import GzipReader, GzipVolume, write_gzip
+from src.data.lazy_volume import LazyVolume
+
+
+def test_read_range_matches_decompressed(tmp_path):
+    data = np.random.randint(0, 255, 300000, dtype=np.uint8).tobytes()
+    file_path = str(tmp_path / 'data.gz')
+    write_gzip(file_path, data, max_workers=2)
+    reader = GzipReader(file_path)
+    assert reader.parallel and reader.random_access
+    assert reader.read_all() == gzip.decompress(open(file_path, 'rb').read())
+    assert reader.read_range(70000, 100000) == data[70000:170000]
+
+
+def test_lazy_bgzf_volume_reads_slices(tmp_path):
+    image = np.random.rand(200, 30, 40).astype(np.float32)
+    file_path = str(tmp_path / 'image.nii.gz')
+    loader = DataLoader(chunk_cache=False)
+    assert loader.save_nifti(image, np.eye(4), None, file_path)
+
+    volume, _, _ = loader.load_nifti(file_path, lazy=True, use_cache=False)
+    assert isinstance(volume, LazyVolume)
+    assert isinstance(volume.source, GzipVolume)
+    expected = np.asanyarray(nib.load(file_path).dataobj).transpose(2, 1, 0)
+    assert np.array_equal(expected, image)
+    assert np.array_equal(volume[57], expected[57])
+    assert np.array_equal(volume[10:150:7, 3:9], expected[10:150:7, 3:9])
+    assert np.array_equal(np.asarray(volume), expected)
@@ -0,0 +1,86 @@
+import threading
+
+import numpy as np
+import pytest
+
+from src.models.inference import InferenceEngine, InferenceCancelled
+from src.models.model_interface import FirstStageModel
+from src.data.lazy_volume import LazyVolume
+
+
+class ThresholdModel(FirstStageModel):
+    """按阈值输出前景的测试模型，可以在指定批次抛出异常"""
+
+    def __init__(self, fail_at=None):
+        self.calls = 0
+        self.fail_at = fail_at
+
+    def load_model(self, model_path):
+        pass
+
+    def predict(self, input_data):
+        self.calls += 1
+        if self.fail_at is not None and self.calls == self.fail_at:
+            raise RuntimeError('模型错误')
+        return (input_data > 0.5).astype(np.float32)
+
+
+def run_with_timeout(func, timeout=10):
+    """在子线程中运行，超时说明推理线程没有退出"""
+    result = {}
+
+    def target():
+        try:
+            result['value'] = func()
+        except Exception as e:
+            result['error'] = e
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), 'run()没有返回'
+    return result
+
+
+def test_run_2d_matches_model():
+    volume = np.random.rand(10, 16, 16).astype(np.float32)
+    probability = InferenceEngine(ThresholdModel(), batch_size=3).run(volume)
+    assert probability.shape == volume.shape
+    assert np.array_equal(probability, volume > 0.5)
+
+
+def test_run_returns_when_model_raises():
+    volume = np.random.rand(4, 8, 8).astype(np.float32)
+    engine = InferenceEngine(ThresholdModel(fail_at=2), batch_size=1, prefetch_batches=1)
+    result = run_with_timeout(lambda: engine.run(volume))
+    assert isinstance(result.get('error'), RuntimeError)
+
+
+def test_run_returns_when_cancelled():
+    volume = np.random.rand(6, 8, 8).astype(np.float32)
+    engine = InferenceEngine(ThresholdModel(), batch_size=1, prefetch_batches=1)
+    result = run_with_timeout(lambda: engine.run(volume, cancel_check=lambda: True))
+    assert isinstance(result.get('error'), InferenceCancelled)
+
+
+def test_run_patch_mode_blends_windows():
+    volume = np.random.rand(12, 20, 20).astype(np.float32)
+    engine = InferenceEngine(ThresholdModel(), batch_size=2, mode='patch', patch_size=(8, 8, 8))
+    probability = engine.run(volume)
+    assert np.array_equal(probability, volume > 0.5)
+
+
+class GuardedVolume(LazyVolume):
+    """整体转换为数组时报错，用于确认推理只按块读取"""
+
+    def __array__(self, dtype=None, copy=None):
+        raise AssertionError('体数据被整体加载')
+
+
+def test_run_patch_mode_reads_lazy_volume_by_patch():
+    volume = np.random.rand(21, 13, 30).astype(np.float32)
+    lazy = GuardedVolume(np.ascontiguousarray(volume.transpose(2, 1, 0)))
+    engine = InferenceEngine(ThresholdModel(), batch_size=3, mode='patch', patch_size=(8, 16, 8))
+    mask = engine.run(lazy, threshold=0.5)
+    assert mask.dtype == np.uint8
+    assert np.array_equal(mask, volume > 0.5)
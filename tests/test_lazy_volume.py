@@ -0,0 +1,42 @@
+import numpy as np
+import nibabel as nib
+
+from src.data.data_loader import DataLoader
+from src.data.lazy_volume import LazyVolume
+
+
+def test_scaled_int16_mask_loads_as_uint8(tmp_path):
+    raw = np.zeros((6, 5, 4), dtype=np.int16)
+    raw[1:3, 1:3, 1:3] = 2
+    img = nib.Nifti1Image(raw, np.eye(4))
+    img.header.set_data_dtype(np.int16)
+    img.header.set_slope_inter(0.5, 0)
+    file_path = str(tmp_path / 'mask.nii')
+    nib.save(img, file_path)
+    # nibabel写入时可能重新计算缩放，按磁盘上的数据和缩放得到期望值
+    expected = np.asanyarray(nib.load(file_path).dataobj).transpose(2, 1, 0)
+
+    mask, _, _ = DataLoader().load_nifti(file_path, data_kind='mask', use_cache=False)
+    assert mask is not None
+    assert mask.dtype == np.uint8
+    assert np.array_equal(mask, np.rint(expected).astype(np.uint8))
+    assert mask.max() == 1
+
+
+def test_float_probability_mask_is_rounded():
+    source = np.zeros((4, 3, 2), dtype=np.float32)
+    source[0, 0, 0] = 0.8
+    source[1, 1, 1] = 0.3
+    volume = LazyVolume(source, dtype=np.uint8)
+    data = volume[...]
+    assert data.dtype == np.uint8
+    assert data[0, 0, 0] == 1
+    assert data[1, 1, 1] == 0
+
+
+def test_scaled_image_slices_match_full_read():
+    source = (np.arange(4 * 3 * 5) % 7).astype(np.int16).reshape(4, 3, 5)
+    volume = LazyVolume(source, slope=2.0, inter=-1.0)
+    expected = source.transpose(2, 1, 0).astype(np.float32) * 2.0 - 1.0
+    assert np.array_equal(volume[...], expected)
+    assert np.array_equal(volume[1:4:2, :, 1], expected[1:4:2, :, 1])
@@ -0,0 +1,58 @@
+import numpy as np
+
+from src.data.mask_store import MaskStore
+
+
+def make_mask():
+    mask = np.zeros((6, 10, 12), dtype=np.uint8)
+    mask[1:3, 2:4, 3:6] = 1
+    mask[4, 7, 9] = 2
+    mask[5, 0, 0] = 1
+    return mask
+
+
+def test_round_trip_and_slice_access():
+    mask = make_mask()
+    store = MaskStore.from_array(mask)
+    assert store.shape == mask.shape
+    assert len(store) == mask.shape[0]
+    assert np.array_equal(store.to_array(), mask)
+    for index in range(mask.shape[0]):
+        assert np.array_equal(store.get_slice(index), mask[index])
+    assert np.array_equal(store[-1], mask[-1])
+
+
+def test_float_input_is_rounded_to_labels():
+    probability = make_mask().astype(np.float32) * 0.9
+    store = MaskStore.from_array(probability)
+    assert np.array_equal(store.to_array(), np.rint(probability).astype(np.uint8))
+
+
+def test_lesion_statistics():
+    lesions = MaskStore.from_array(make_mask()).lesions
+    assert sorted(lesion['size'] for lesion in lesions) == [1, 1, 12]
+    largest = max(lesions, key=lambda lesion: lesion['size'])
+    assert largest['bbox'] == ((1, 2, 3), (3, 4, 6))
+    assert np.allclose(largest['centroid'], (1.5, 2.5, 4.0))
+
+
+def test_save_and_load(tmp_path):
+    affine = np.diag([0.5, 0.5, 2.0, 1.0])
+    store = MaskStore.from_array(make_mask(), affine)
+    file_path = str(tmp_path / 'case.mask.npz')
+    store.save(file_path)
+
+    loaded = MaskStore.load(file_path)
+    assert loaded.shape == store.shape
+    assert np.array_equal(loaded.to_array(), make_mask())
+    assert np.array_equal(loaded.get_slice(4), make_mask()[4])
+    assert np.allclose(loaded.affine, affine)
+    # 病灶列表随容器保存，读取时无需解码
+    assert loaded.lesions == store.lesions
+
+
+def test_nifti_round_trip(tmp_path):
+    store = MaskStore.from_array(make_mask(), np.eye(4))
+    file_path = str(tmp_path / 'case.nii.gz')
+    assert store.to_nifti(file_path)
+    assert np.array_equal(MaskStore.from_nifti(file_path).to_array(), make_mask())
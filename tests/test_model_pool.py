@@ -0,0 +1,91 @@
+import time
+import threading
+
+from src.models.model_interface import ModelFactory
+from src.models.model_pool import ModelPool
+
+
+class FakeModel:
+    def __init__(self, name):
+        self.name = name
+        self.inputs = []
+
+    def predict(self, input_data):
+        self.inputs.append(input_data.shape)
+        return input_data
+
+
+class CountingLoader:
+    """记录每个模型被加载的次数"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def __call__(self, name):
+        with self.lock:
+            self.calls.append(name)
+        time.sleep(self.delay)
+        return FakeModel(name)
+
+
+def test_models_are_reused_and_evicted_lru():
+    loader = CountingLoader()
+    pool = ModelPool(max_models=2, loader=loader)
+    a = pool.get('a')
+    pool.get('b')
+    assert pool.get('a') is a
+    # 加载c时淘汰最久未使用的b
+    pool.get('c')
+    assert pool.contains('a') and pool.contains('c')
+    assert not pool.contains('b')
+    pool.get('b')
+    assert loader.calls == ['a', 'b', 'c', 'b']
+
+
+def test_idle_models_are_released():
+    pool = ModelPool(idle_seconds=0.05, loader=CountingLoader())
+    pool.get('a')
+    assert pool.evict_idle() == []
+    time.sleep(0.1)
+    assert pool.evict_idle() == ['a']
+    assert not pool.contains('a')
+
+
+def test_concurrent_get_loads_once():
+    loader = CountingLoader(delay=0.1)
+    pool = ModelPool(loader=loader)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(pool.get('a'))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert loader.calls == ['a']
+    assert len(results) == 4 and all(model is results[0] for model in results)
+
+
+def test_failed_load_is_not_cached():
+    attempts = []
+
+    def loader(name):
+        attempts.append(name)
+        if len(attempts) == 1:
+            raise IOError('busy')
+        return FakeModel(name)
+
+    pool = ModelPool(loader=loader)
+    assert pool.get('a') is None
+    assert not pool.contains('a')
+    assert pool.get('a') is not None
+    assert attempts == ['a', 'a']
+
+
+def test_warm_up_runs_registered_shape(monkeypatch):
+    monkeypatch.setattr(ModelFactory, '_registry', {})
+    ModelFactory.register('a', 'first_stage', {'warmup_shape': (1, 8, 8)})
+    pool = ModelPool(loader=CountingLoader())
+    assert pool.warm_up('a')
+    assert pool.get('a').inputs == [(1, 8, 8)]
+    assert not ModelPool(loader=lambda name: None).warm_up('a')
@@ -0,0 +1,107 @@
+import os
+import threading
+
+import numpy as np
+import pytest
+
+from src.models.model_interface import ModelFactory
+from src.models.model_pool import ModelPool
+from src.models.onnx_backend import (
+    OnnxFirstStageModel, logits_to_probability, quantized_path, quantize_model, QUANTIZED_SUFFIX
+)
+
+
+class FakeSession:
+    """代替OnnxSession，返回固定的模型输出"""
+
+    def __init__(self, output):
+        self.output = output
+        self.lock = threading.RLock()
+
+    def run(self, batch):
+        return self.output
+
+
+def test_sigmoid_for_single_channel():
+    logits = np.array([[[-2.0, 0.0, 3.0]]], dtype=np.float32)
+    expected = 1.0 / (1.0 + np.exp(-logits))
+    assert np.allclose(logits_to_probability(logits), expected)
+
+
+def test_softmax_over_channel_axis():
+    logits = np.random.default_rng(0).normal(size=(2, 3, 4, 5)).astype(np.float32)
+    probability = logits_to_probability(logits.copy())
+    expected = np.exp(logits) / np.exp(logits).sum(axis=1, keepdims=True)
+    assert np.allclose(probability, expected, atol=1e-6)
+    assert np.allclose(probability.sum(axis=1), 1.0)
+
+
+def test_quantized_path_and_reuse(tmp_path):
+    model_path = str(tmp_path / 'model.onnx')
+    assert quantized_path(model_path) == str(tmp_path / ('model' + QUANTIZED_SUFFIX))
+    with open(model_path, 'wb') as f:
+        f.write(b'model')
+    with open(quantized_path(model_path), 'wb') as f:
+        f.write(b'quantized')
+    os.utime(model_path, (1000, 1000))
+    # 比原模型新的量化模型直接复用，不需要onnxruntime
+    assert quantize_model(model_path) == quantized_path(model_path)
+
+
+def test_predict_converts_logits_and_copies_probability():
+    logits = np.zeros((1, 1, 2, 2), dtype=np.float32)
+    model = OnnxFirstStageModel()
+    model.session = FakeSession(logits)
+    assert np.allclose(model.predict(np.zeros((1, 2, 2), dtype=np.float32)), 0.5)
+
+    model = OnnxFirstStageModel({'output': 'probability'})
+    model.session = FakeSession(logits)
+    output = model.predict(np.zeros((1, 2, 2), dtype=np.float32))
+    assert output is not logits and np.array_equal(output, logits)
+
+
+def test_predict_without_session_raises():
+    with pytest.raises(RuntimeError):
+        OnnxFirstStageModel().predict(np.zeros((1, 2, 2), dtype=np.float32))
+
+
+def test_factory_load_errors(tmp_path, monkeypatch):
+    monkeypatch.setattr(ModelFactory, '_registry', {})
+    with pytest.raises(KeyError):
+        ModelFactory.load('missing')
+
+    ModelFactory.register('absent', 'first_stage', {'model_path': str(tmp_path / 'absent.onnx')})
+    with pytest.raises(FileNotFoundError):
+        ModelFactory.load('absent')
+
+    ModelFactory.register('no_impl', 'first_stage', {}, loader=lambda model_type, config: None)
+    with pytest.raises(ValueError):
+        ModelFactory.load('no_impl')
+
+
+def test_pool_require_reports_load_error(tmp_path, monkeypatch):
+    monkeypatch.setattr(ModelFactory, '_registry', {})
+    ModelFactory.register('absent', 'first_stage', {'model_path': str(tmp_path / 'absent.onnx')})
+    pool = ModelPool()
+    assert pool.get('absent') is None
+    with pytest.raises(RuntimeError, match='模型文件不存在'):
+        pool.require('absent')
+
+
+def test_onnx_session_runs_exported_model(tmp_path):
+    onnx = pytest.importorskip('onnx')
+    pytest.importorskip('onnxruntime')
+    from onnx import helper, TensorProto
+    from src.models.onnx_backend import OnnxSession
+
+    graph = helper.make_graph(
+        [helper.make_node('Neg', ['x'], ['y'])], 'neg',
+        [helper.make_tensor_value_info('x', TensorProto.FLOAT, ['n', 1, 4, 4])],
+        [helper.make_tensor_value_info('y', TensorProto.FLOAT, ['n', 1, 4, 4])],
+    )
+    model_path = str(tmp_path / 'neg.onnx')
+    onnx.save(helper.make_model(graph), model_path)
+    session = OnnxSession(model_path, intra_op_threads=1)
+    batch = np.random.default_rng(0).normal(size=(2, 4, 4)).astype(np.float32)
+    for _ in range(2):
+        assert np.allclose(session.run(batch)[:, 0], -batch)
@@ -0,0 +1,55 @@
+import os
+
+import numpy as np
+import nibabel as nib
+
+from src.data.data_loader import DataLoader
+from src.data.lazy_volume import LazyVolume
+from src.preprocessing.pipeline_cache import PipelineCache
+from src.data.volume_cache import VolumeCache
+
+
+class UnreadableSource:
+    """读取数据时报错的底层数组，用于确认生成键时不读取数据"""
+
+    def __init__(self, shape, dtype):
+        self.shape = shape
+        self.dtype = np.dtype(dtype)
+        self.ndim = len(shape)
+
+    def __getitem__(self, key):
+        raise AssertionError('不应读取数据')
+
+
+def test_file_backed_volume_is_keyed_by_file_identity(tmp_path):
+    file_path = str(tmp_path / 'image.nii')
+    nib.save(nib.Nifti1Image(np.zeros((4, 5, 6), dtype=np.int16), np.eye(4)), file_path)
+    cache = PipelineCache(volume_cache=VolumeCache())
+
+    volume = LazyVolume(UnreadableSource((4, 5, 6), np.int16), source_path=file_path)
+    digest = cache.volume_hash(volume)
+    assert volume.digest == digest
+    assert cache.volume_hash(volume) == digest
+
+    # 同一文件的新对象得到相同的键，文件被修改后键改变
+    assert cache.volume_hash(LazyVolume(UnreadableSource((4, 5, 6), np.int16), source_path=file_path)) == digest
+    stat = os.stat(file_path)
+    os.utime(file_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+    assert cache.volume_hash(LazyVolume(UnreadableSource((4, 5, 6), np.int16), source_path=file_path)) != digest
+
+
+def test_lazy_load_records_source_path(tmp_path):
+    file_path = str(tmp_path / 'image.nii')
+    nib.save(nib.Nifti1Image(np.ones((4, 5, 6), dtype=np.float32), np.eye(4)), file_path)
+    volume, _, _ = DataLoader(chunk_cache=False).load_nifti(file_path, lazy=True, use_cache=False)
+    assert volume.source_path == file_path
+    assert volume.transpose(1, 0, 2).source_path == file_path
+
+
+def test_in_memory_volume_is_hashed_by_content():
+    cache = PipelineCache(volume_cache=VolumeCache())
+    data = np.arange(60, dtype=np.float32).reshape(3, 4, 5)
+    digest = cache.volume_hash(LazyVolume(data, axes=(0, 1, 2)))
+    assert digest == cache.volume_hash(LazyVolume(data.copy(), axes=(0, 1, 2)))
+    data[0, 0, 0] = -1
+    assert digest != cache.volume_hash(LazyVolume(data, axes=(0, 1, 2)))
@@ -0,0 +1,58 @@
+import threading
+
+from src.data.prefetcher import Prefetcher
+from src.data.volume_cache import VolumeCache
+
+
+class BlockingLoader:
+    """load_nifti等待事件后返回的加载器，与DataLoader一样缓存结果，记录实际加载过的文件"""
+
+    def __init__(self):
+        self.volume_cache = VolumeCache()
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.loaded = []
+
+    def load_nifti(self, file_path, lazy=False, data_kind='image'):
+        cached = self.volume_cache.get(file_path)
+        if cached is not None:
+            return cached
+        self.started.set()
+        self.release.wait(10)
+        self.loaded.append(file_path)
+        self.volume_cache.put(file_path, (file_path, None, None))
+        return file_path, None, None
+
+
+def test_get_waits_for_pending_prefetch():
+    loader = BlockingLoader()
+    prefetcher = Prefetcher(loader, depth=2)
+    prefetcher.prefetch(['a.nii', 'b.nii'], lazy=True)
+    loader.release.set()
+    assert prefetcher.get('a.nii', lazy=True)[0] == 'a.nii'
+    assert prefetcher.get('b.nii', lazy=True)[0] == 'b.nii'
+    prefetcher.shutdown()
+    # 预读结果被使用，没有重复加载
+    assert sorted(loader.loaded) == ['a.nii', 'b.nii']
+
+
+def test_cancel_drops_prefetches_not_started():
+    loader = BlockingLoader()
+    prefetcher = Prefetcher(loader, depth=3, max_workers=1)
+    prefetcher.prefetch(['a.nii', 'b.nii', 'c.nii'], lazy=True)
+    assert loader.started.wait(5)
+    prefetcher.cancel()
+    loader.release.set()
+    prefetcher.executor.shutdown(wait=True)
+    # 只有已开始的第一个文件被加载
+    assert loader.loaded == ['a.nii']
+    assert not prefetcher._pending
+
+
+def test_prefetch_limited_to_depth():
+    loader = BlockingLoader()
+    loader.release.set()
+    prefetcher = Prefetcher(loader, depth=1)
+    prefetcher.prefetch(['a.nii', 'b.nii'], lazy=True)
+    prefetcher.executor.shutdown(wait=True)
+    assert loader.loaded == ['a.nii']
@@ -0,0 +1,107 @@
+import numpy as np
+
+from src.preprocessing.preprocessor import Preprocessor
+
+
+def world(affine, d, h, w):
+    # 数组轴(d, h, w)对应NIFTI轴(z, y, x)
+    return (affine @ [w, h, d, 1])[:3]
+
+
+def test_crop_and_resample_keep_world_coordinates():
+    preprocessor = Preprocessor()
+    image = np.zeros((20, 40, 60), dtype=np.float32)
+    image[5:15, 10:30, 20:50] = 1.0
+    affine = np.diag([0.5, 0.5, 2.0, 1.0])
+    affine[:3, 3] = [10, 20, 30]
+
+    cropped, crop_info = preprocessor.crop_to_foreground(image)
+    cropped_affine = preprocessor.crop_affine(affine, crop_info)
+    resampled, new_affine = preprocessor.resample(
+        cropped, (2.0, 0.5, 0.5), (1.0, 1.0, 1.0), affine=cropped_affine
+    )
+
+    starts = [start for start, _ in crop_info['bbox']]
+    stops = [stop - 1 for _, stop in crop_info['bbox']]
+    last = [n - 1 for n in resampled.shape]
+    assert np.allclose(world(new_affine, 0, 0, 0), world(affine, *starts))
+    assert np.allclose(world(new_affine, *last), world(affine, *stops))
+
+
+def test_resample_without_affine_returns_data_only():
+    image = np.random.rand(8, 8, 8).astype(np.float32)
+    resampled = Preprocessor().resample(image, (1.0, 1.0, 1.0), (2.0, 2.0, 2.0))
+    assert isinstance(resampled, np.ndarray)
+
+
+def head_phantom():
+    image = np.random.default_rng(0).random((40, 64, 48)).astype(np.float32) * 5
+    image[8:30, 12:50, 10:40] += 100
+    return image
+
+
+def test_crop_contains_foreground_and_uncrop_restores():
+    preprocessor = Preprocessor()
+    image = head_phantom()
+    cropped, crop_info = preprocessor.crop_to_foreground(image)
+    assert crop_info['shape'] == image.shape
+    for (start, stop), (lo, hi) in zip(crop_info['bbox'], [(8, 30), (12, 50), (10, 40)]):
+        assert start <= lo and stop >= hi
+    assert cropped.size < image.size
+
+    restored = preprocessor.uncrop(cropped, crop_info)
+    region = tuple(slice(start, stop) for start, stop in crop_info['bbox'])
+    assert np.array_equal(restored[region], image[region])
+    outside = np.ones(image.shape, dtype=bool)
+    outside[region] = False
+    assert not restored[outside].any()
+
+
+def test_crop_with_given_bbox_and_empty_volume():
+    preprocessor = Preprocessor()
+    mask = np.zeros((10, 12, 14), dtype=np.uint8)
+    cropped, crop_info = preprocessor.crop_to_foreground(mask, bbox=((2, 5), (0, 12), (3, 9)))
+    assert cropped.shape == (3, 12, 6)
+    # 没有前景时保留整个视野
+    assert preprocessor.compute_foreground_bbox(mask) == ((0, 10), (0, 12), (0, 14))
+
+
+def test_crop_affine_round_trip():
+    preprocessor = Preprocessor()
+    affine = np.diag([0.5, 0.6, 2.0, 1.0])
+    affine[:3, 3] = [-20, 15, 4]
+    _, crop_info = preprocessor.crop_to_foreground(head_phantom())
+    cropped_affine = preprocessor.crop_affine(affine, crop_info)
+    starts = [start for start, _ in crop_info['bbox']]
+    # 裁剪后的原点就是原图中包围盒起点的世界坐标，其余体素依次对应
+    assert np.allclose(world(cropped_affine, 0, 0, 0), world(affine, *starts))
+    assert np.allclose(world(cropped_affine, 3, 4, 5), world(affine, starts[0] + 3, starts[1] + 4, starts[2] + 5))
+
+
+def test_patches_cover_every_voxel():
+    preprocessor = Preprocessor()
+    volume = np.random.default_rng(0).random((21, 35, 18)).astype(np.float32)
+    counts = np.zeros(volume.shape, dtype=np.int32)
+    for positions, batch in preprocessor.extract_patches(volume, patch_size=(8, 16, 16), stride=(5, 10, 7), batch_size=4):
+        assert batch.shape[1:] == (8, 16, 16)
+        for (z, y, x), patch in zip(positions, batch):
+            region = (slice(z, z + 8), slice(y, y + 16), slice(x, x + 16))
+            # 宽度不足16的体数据在末尾补最小值
+            valid = volume[region]
+            assert np.array_equal(patch[:valid.shape[0], :valid.shape[1], :valid.shape[2]], valid)
+            assert np.all(patch[:, :, valid.shape[2]:] == volume.min())
+            counts[region] += 1
+    assert counts.min() >= 1
+
+
+def test_2d_patches_and_skip_empty():
+    preprocessor = Preprocessor(patch_size=(8, 8))
+    volume = np.zeros((3, 16, 16), dtype=np.float32)
+    volume[1, 2:4, 10:12] = 1
+    patches = [
+        (position, batch) for positions, batch in preprocessor.extract_patches(volume, skip_empty=True, batch_size=16)
+        for position in positions
+    ]
+    assert patches and all(batch.shape[1:] == (8, 8) for _, batch in patches)
+    # 只保留包含前景的块
+    assert {z for (z, _, _), _ in patches} == {1}
@@ -0,0 +1,48 @@
+import numpy as np
+
+from src.data.lazy_volume import LazyVolume
+from src.preprocessing.preprocessor import Preprocessor
+from src.preprocessing.statistics import robust_range
+
+
+def skewed_volume():
+    volume = np.random.default_rng(0).normal(0, 1, (40, 50, 60)).astype(np.float32)
+    # 少量极端值
+    volume[0, 0, :10] = 1e4
+    return volume
+
+
+def test_range_close_to_exact_percentiles():
+    volume = skewed_volume()
+    low, high, mean, std = robust_range(volume, 0.5, 99.5)
+    exact_low, exact_high = np.percentile(volume, [0.5, 99.5])
+    assert abs(low - exact_low) < 0.05 and abs(high - exact_high) < 0.05
+    clipped = np.clip(volume, exact_low, exact_high)
+    assert abs(mean - clipped.mean()) < 0.02 and abs(std - clipped.std()) < 0.02
+
+
+def test_result_is_reproducible_and_transposed_views_work():
+    volume = skewed_volume()
+    assert robust_range(volume) == robust_range(volume)
+    low, high, _, _ = robust_range(volume.transpose(2, 1, 0))
+    assert high < 10
+
+
+def test_lazy_volume_and_mask():
+    volume = skewed_volume()
+    lazy = LazyVolume(np.ascontiguousarray(volume.transpose(2, 1, 0)))
+    low, high, _, _ = robust_range(lazy)
+    assert abs(low - np.percentile(volume, 0.5)) < 0.1
+
+    mask = np.zeros(volume.shape, dtype=bool)
+    mask[10:20] = True
+    volume[mask] += 100
+    low, high, mean, _ = robust_range(volume, mask=mask)
+    assert low > 90 and abs(mean - 100) < 0.1
+
+
+def test_percentile_normalization_clips_outliers():
+    normalized = Preprocessor().normalize_intensity(skewed_volume(), method='percentile')
+    assert normalized.dtype == np.float32
+    assert normalized.max() < 5
+    assert abs(normalized.mean()) < 0.05
@@ -0,0 +1,50 @@
+import os
+
+import numpy as np
+import nibabel as nib
+
+from src.data.data_loader import DataLoader
+from src.data.gzip_io import GzipReader
+
+
+def test_bgzf_round_trip_keeps_data_and_affine(tmp_path):
+    image = np.random.rand(12, 20, 16).astype(np.float32)
+    affine = np.diag([0.5, 0.6, 2.0, 1.0])
+    affine[:3, 3] = [1, 2, 3]
+    file_path = str(tmp_path / 'image.nii.gz')
+    loader = DataLoader(chunk_cache=False)
+    assert loader.save_nifti(image, affine, None, file_path, max_workers=2)
+
+    assert GzipReader(file_path).parallel
+    loaded, loaded_affine, _ = loader.load_nifti(file_path, use_cache=False)
+    assert np.array_equal(loaded, image)
+    assert np.allclose(loaded_affine, affine)
+    assert os.listdir(tmp_path) == ['image.nii.gz']
+
+
+def test_mask_is_saved_as_uint8_and_uncropped(tmp_path):
+    cropped = np.array([[[0.2, 0.9], [0.6, 0.1]]], dtype=np.float32)
+    crop_info = {'bbox': ((2, 3), (1, 3), (4, 6)), 'shape': (5, 6, 7)}
+    file_path = str(tmp_path / 'mask.nii.gz')
+    assert DataLoader(chunk_cache=False).save_nifti(
+        cropped, np.eye(4), None, file_path, mask=True, crop_info=crop_info
+    )
+
+    img = nib.load(file_path)
+    assert img.get_data_dtype() == np.uint8
+    mask = np.asanyarray(img.dataobj).transpose(2, 1, 0)
+    assert mask.shape == (5, 6, 7)
+    assert mask.sum() == 2
+    assert np.array_equal(mask[2, 1:3, 4:6], [[0, 1], [1, 0]])
+
+
+def test_failed_write_keeps_existing_file(tmp_path):
+    file_path = str(tmp_path / 'image.nii.gz')
+    loader = DataLoader(chunk_cache=False)
+    assert loader.save_nifti(np.ones((2, 3, 4), dtype=np.float32), np.eye(4), None, file_path)
+    before = open(file_path, 'rb').read()
+
+    # 对象数组无法写入NIFTI
+    assert not loader.save_nifti(np.empty((2, 3, 4), dtype=object), np.eye(4), None, file_path)
+    assert open(file_path, 'rb').read() == before
+    assert os.listdir(tmp_path) == ['image.nii.gz']
@@ -0,0 +1,108 @@
+import numpy as np
+import pytest
+
+from src.data.data_loader import DataLoader
+from src.data.mask_store import MaskStore, MASK_EXTENSION
+from src.models.inference import InferenceCancelled
+from src.postprocessing.second_stage_processor import SecondStageProcessor
+
+PATCH = (32, 32)
+
+
+class CenterSliceModel:
+    """以块中心切片上的亮体素作为精细分割结果"""
+
+    def __init__(self):
+        self.batches = []
+
+    def predict(self, batch):
+        self.batches.append(batch.shape)
+        center = batch[:, batch.shape[1] // 2]
+        return (center > 50).astype(np.float32)
+
+
+def make_case():
+    image = np.zeros((6, 128, 128), dtype=np.float32)
+    # 真实病灶，一阶段结果有偏移
+    image[1:3, 10:16, 10:16] = 100.0
+    # 一阶段漏检的亮区，不在任何候选块内
+    image[4, 60:64, 60:64] = 100.0
+    first_stage = np.zeros(image.shape, dtype=np.uint8)
+    first_stage[1:3, 12:18, 12:18] = 1
+    # 一阶段的假阳性，图像上是暗的
+    first_stage[4, 100:103, 100:103] = 1
+    return image, first_stage
+
+
+def expected_refined(image):
+    refined = np.zeros(image.shape, dtype=np.uint8)
+    refined[1:3, 10:16, 10:16] = 1
+    return refined
+
+
+def test_candidates_are_pasted_back():
+    image, first_stage = make_case()
+    model = CenterSliceModel()
+    progress = []
+    refined, count = SecondStageProcessor().refine_candidates(
+        model, image, first_stage, patch_size=PATCH, batch_size=2,
+        progress_callback=lambda done, total: progress.append((done, total))
+    )
+    assert count == 2
+    assert refined.dtype == np.uint8
+    assert np.array_equal(refined, expected_refined(image))
+    # 每个批次为(n, 上下文切片, 高, 宽)，只处理候选切片上的块
+    assert all(shape[1:] == (3,) + PATCH for shape in model.batches)
+    assert sum(shape[0] for shape in model.batches) == 3
+    assert progress[-1] == (2, 2)
+
+
+def test_region_outside_candidates_keeps_first_stage():
+    image, first_stage = make_case()
+    first_stage[5, 120:122, 120:122] = 1
+    processor = SecondStageProcessor()
+    _, candidates, origins = processor.process_first_stage_output(first_stage, patch_size=PATCH)
+    assert len(candidates['size']) == 3
+
+    # 模型对所有块都输出背景时，只有候选块内的体素被清除
+    empty = type('EmptyModel', (), {'predict': lambda self, batch: np.zeros((len(batch),) + PATCH)})()
+    refined, _ = processor.refine_candidates(empty, image, first_stage, patch_size=PATCH)
+    covered = np.zeros(image.shape, dtype=bool)
+    for z, y, x in origins:
+        covered[z, y:y + PATCH[0], x:x + PATCH[1]] = True
+    assert not refined[covered].any()
+    assert np.array_equal(refined[~covered], first_stage[~covered])
+
+
+def test_shape_mismatch_and_bad_input():
+    image, first_stage = make_case()
+    processor = SecondStageProcessor()
+    with pytest.raises(ValueError):
+        processor.refine_candidates(CenterSliceModel(), image, first_stage[:-1], patch_size=PATCH)
+    with pytest.raises(ValueError):
+        processor.process_first_stage_output(first_stage[0])
+
+
+def test_cancel_raises():
+    image, first_stage = make_case()
+    with pytest.raises(InferenceCancelled):
+        SecondStageProcessor().refine_candidates(CenterSliceModel(), image, first_stage, patch_size=PATCH,
+                                                 cancel_check=lambda: True)
+
+
+def test_saved_first_stage_and_lazy_image(tmp_path):
+    image, first_stage = make_case()
+    mask_path = str(tmp_path / ('case_first_stage_prediction' + MASK_EXTENSION))
+    MaskStore.from_array(first_stage).save(mask_path)
+    image_path = str(tmp_path / 'case.nii.gz')
+    loader = DataLoader(chunk_cache=False)
+    assert loader.save_nifti(image, np.eye(4), None, image_path)
+    lazy_image, _, _ = loader.load_nifti(image_path, lazy=True, use_cache=False)
+
+    processor = SecondStageProcessor()
+    mask, candidates, _ = processor.process_first_stage_output(mask_path, shape=image.shape, patch_size=PATCH)
+    assert np.array_equal(mask, first_stage)
+    assert len(candidates['size']) == 2
+    refined, count = processor.refine_candidates(CenterSliceModel(), lazy_image, mask_path, patch_size=PATCH)
+    assert count == 2
+    assert np.array_equal(refined, expected_refined(image))
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from src.data.lazy_volume import LazyVolume
+from src.preprocessing.slice_sequence import SliceSequence
+
+
+class CountingSource:
+    """记录被读取的z范围的底层数组"""
+
+    def __init__(self, array):
+        self.array = array
+        self.shape = array.shape
+        self.dtype = array.dtype
+        self.ndim = array.ndim
+        self.reads = []
+
+    def __getitem__(self, key):
+        self.reads.append(key)
+        return self.array[key]
+
+
+@pytest.mark.parametrize('axis', [0, 1, 2])
+def test_matches_numpy_slicing(axis):
+    volume = np.random.rand(5, 6, 7).astype(np.float32)
+    slices = SliceSequence(volume, axis=axis)
+    expected = np.moveaxis(volume, axis, 0)
+    assert np.array_equal(slices[3], expected[3])
+    assert np.array_equal(slices[1:4], expected[1:4])
+    assert np.array_equal(slices[::2], expected[::2])
+    assert np.array_equal(np.stack(list(slices)), expected)
+    out = np.empty((2,) + slices.slice_shape, dtype=np.float64)
+    assert np.array_equal(slices.batch(2, 4, out=out), expected[2:4])
+
+
+def test_lazy_volume_reads_only_requested_slices():
+    source = CountingSource(np.random.rand(8, 6, 10).astype(np.float32))
+    volume = LazyVolume(source)
+    slices = SliceSequence(volume)
+    assert np.array_equal(slices[4], np.asarray(volume)[4])
+    source.reads.clear()
+    slices[4]
+    slices.batch(2, 5)
+    # 深度轴对应source的z轴，每次只读取需要的切片
+    assert [key[2] for key in source.reads] == [4, slice(2, 5, None)]
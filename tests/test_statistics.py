@@ -0,0 +1,37 @@
+import numpy as np
+
+from src.data.lazy_volume import LazyVolume
+from src.preprocessing.preprocessor import Preprocessor
+from src.preprocessing.statistics import compute_statistics
+
+
+def test_chunked_statistics_match_numpy():
+    rng = np.random.default_rng(0)
+    volume = (rng.normal(100, 15, (37, 20, 24))).astype(np.float32)
+    stats = compute_statistics(volume, chunk_slices=5)
+    assert stats.count == volume.size
+    assert np.isclose(stats.mean, volume.mean(dtype=np.float64))
+    assert np.isclose(stats.std, volume.std(dtype=np.float64))
+    assert stats.min == volume.min() and stats.max == volume.max()
+    # 直方图估算的中位数误差在一个bin宽度左右
+    assert abs(stats.percentile(50) - np.median(volume)) < 0.5
+
+
+def test_statistics_with_mask_use_foreground_only():
+    volume = np.zeros((8, 10, 10), dtype=np.float32)
+    volume[2:6, 2:8, 2:8] = np.arange(144, dtype=np.float32).reshape(4, 6, 6)
+    mask = volume > 0
+    stats = compute_statistics(volume, mask=mask, chunk_slices=3)
+    assert stats.count == mask.sum()
+    assert np.isclose(stats.mean, volume[mask].mean())
+    assert np.isclose(stats.std, volume[mask].std())
+
+
+def test_z_score_on_lazy_volume_matches_array():
+    volume = np.random.default_rng(1).random((20, 12, 14)).astype(np.float32) * 50
+    lazy = LazyVolume(np.ascontiguousarray(volume.transpose(2, 1, 0)))
+    preprocessor = Preprocessor()
+    normalized = preprocessor.normalize_intensity(volume, method='z-score')
+    assert normalized.dtype == np.float32
+    assert abs(normalized.mean()) < 1e-4 and abs(normalized.std() - 1) < 1e-4
+    assert np.allclose(preprocessor.normalize_intensity(lazy, method='z-score'), normalized, atol=1e-5)
@@ -0,0 +1,44 @@
+import numpy as np
+import nibabel as nib
+
+from src.data.data_loader import DataLoader
+from src.data.volume_cache import VolumeCache
+
+
+def test_put_evicts_least_recently_used_within_budget():
+    cache = VolumeCache(max_bytes=100)
+    cache.put('a', 'A', 40)
+    cache.put('b', 'B', 40)
+    assert cache.get('a') == 'A'
+    cache.put('c', 'C', 40)
+    # b最久未使用，被淘汰
+    assert cache.get('b') is None
+    assert cache.get('a') == 'A' and cache.get('c') == 'C'
+    assert cache.current_bytes == 80
+    assert cache.free_bytes() == 20
+
+
+def test_oversized_item_is_not_cached_and_budget_can_shrink():
+    cache = VolumeCache(max_bytes=100)
+    assert not cache.put('big', 'X', 101)
+    assert cache.get('big') is None
+    cache.put('a', 'A', 30)
+    cache.put('b', 'B', 30)
+    cache.set_max_bytes(40)
+    assert cache.get('a') is None and cache.get('b') == 'B'
+    assert cache.current_bytes == 30
+
+
+def test_loader_shares_read_only_volume(tmp_path):
+    file_path = str(tmp_path / 'image.nii.gz')
+    nib.save(nib.Nifti1Image(np.arange(60, dtype=np.float32).reshape(3, 4, 5), np.eye(4)), file_path)
+    loader = DataLoader(chunk_cache=False, volume_cache=VolumeCache())
+    first, _, _ = loader.load_nifti(file_path)
+    second, _, _ = loader.load_nifti(file_path)
+    assert first is second
+    assert first.shape == (5, 4, 3)
+    assert not first.flags.writeable
+    # 不使用缓存时重新读取
+    private, _, _ = loader.load_nifti(file_path, use_cache=False)
+    assert private is not first
+    assert np.array_equal(private, first)